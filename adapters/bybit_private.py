@@ -142,6 +142,16 @@ def get_last_price(symbol) -> float:
     return float(bars[-1]["c"]) if bars else 0.0
 
 # ---------- Cuenta / posiciones ----------
+def get_server_time_ms() -> int:
+    """Hora del servidor Bybit en ms (endpoint público /v5/market/time)."""
+    r = session.get_server_time()
+    res = r.get("result") or {}
+    if res.get("timeNano"):
+        return int(res["timeNano"]) // 1_000_000
+    if res.get("timeSecond"):
+        return int(res["timeSecond"]) * 1000
+    return int(r["time"])
+
 def get_balance() -> float:
     try:
         r = session.get_wallet_balance(accountType=BYBIT_ACCOUNT, coin=BYBIT_SETTLE)
@@ -149,67 +159,163 @@ def get_balance() -> float:
     except Exception:
         return 0.0
 
+def fetch_position_snapshot(symbol: str):
+    """
+    Posición REST del símbolo: dict, o None si NO hay posición. Un error de
+    REST se propaga (el resync del stream no puede confundirlo con "sin posición").
+    """
+    r = session.get_positions(category="linear", symbol=symbol)
+    lst = r["result"]["list"]
+    if not lst:
+        return None
+    it  = lst[0]
+    qty_raw = it.get("size") or it.get("positionValue") or 0
+    try:
+        qty = float(qty_raw)
+    except Exception:
+        qty = 0.0
+    if qty <= 0.0:
+        return None
+    side  = "Buy" if it["side"].lower()=="buy" else "Sell"
+    price = float(it.get("avgPrice") or it.get("avgEntryPrice") or 0)
+
+    sl_raw = it.get("stopLoss"); tp_raw = it.get("takeProfit")
+    sl_val = None; tp_val = None
+    try:
+        if sl_raw not in (None, "", "0", 0):
+            sl_val = float(sl_raw)
+    except Exception:
+        sl_val = None
+    try:
+        if tp_raw not in (None, "", "0", 0):
+            tp_val = float(tp_raw)
+    except Exception:
+        tp_val = None
+
+    ts_val = None
+    try:
+        if it.get("trailingStop") not in (None, "", "0", 0):
+            ts_val = float(it.get("trailingStop"))
+    except Exception:
+        ts_val = None
+
+    return {"side": side, "qty": qty, "avgPrice": price, "stopLoss": sl_val, "takeProfit": tp_val,
+            "trailingStop": ts_val}
+
 def fetch_position_for_symbol(symbol: str):
     try:
-        r = session.get_positions(category="linear", symbol=symbol)
-        lst = r["result"]["list"]
-        if not lst:
-            return None
-        it  = lst[0]
-        qty_raw = it.get("size") or it.get("positionValue") or 0
+        return fetch_position_snapshot(symbol)
+    except Exception:
+        return None
+
+# ---------- Config de cuenta por símbolo (leverage / modo posición / margen) ----------
+_account_cfg = {}  # symbol -> {"leverage": int, "position_mode": int, "trade_mode": int}
+
+_TRADE_MODES = {"cross": 0, "isolated": 1}
+
+def _not_modified(e) -> bool:
+    msg = str(e).lower()
+    return ("not modified" in msg or "110043" in msg or "110025" in msg
+            or "110026" in msg or "already" in msg)
+
+def sync_account_config(symbols):
+    """
+    Arranque: lee leverage / tradeMode / positionIdx vigentes por símbolo
+    y llena el cache local. Devuelve el cache.
+    """
+    for symbol in symbols or []:
         try:
-            qty = float(qty_raw)
+            r = session.get_positions(category="linear", symbol=symbol)
+            lst = r["result"]["list"]
+            if not lst:
+                continue
+            it = lst[0]
+            _account_cfg[symbol] = {
+                "leverage": int(float(it.get("leverage") or 0)),
+                "position_mode": 0 if int(it.get("positionIdx") or 0) == 0 else 3,
+                "trade_mode": int(it.get("tradeMode")) if it.get("tradeMode") not in (None, "") else None,
+            }
         except Exception:
-            qty = 0.0
-        if qty <= 0.0:
-            return None
-        side  = "Buy" if it["side"].lower()=="buy" else "Sell"
-        price = float(it.get("avgPrice") or it.get("avgEntryPrice") or 0)
+            _account_cfg.pop(symbol, None)
+    return dict(_account_cfg)
+
+def ensure_symbol_config(symbol, lev: int = 10, margin_mode: str = "isolated", position_mode: int = 0) -> int:
+    """
+    Reenvía leverage / modo de posición / modo de margen SOLO si difieren del
+    cache. Devuelve la cantidad de requests enviados (0 si ya estaba alineado).
+    """
+    want = {
+        "leverage": int(lev),
+        "position_mode": int(position_mode),
+        "trade_mode": _TRADE_MODES.get(str(margin_mode or "isolated").lower(), 1),
+    }
+    have = _account_cfg.setdefault(symbol, {})
+    enviados = 0
 
-        sl_raw = it.get("stopLoss"); tp_raw = it.get("takeProfit")
-        sl_val = None; tp_val = None
+    if have.get("position_mode") != want["position_mode"]:
+        enviados += 1
         try:
-            if sl_raw not in (None, "", "0", 0):
-                sl_val = float(sl_raw)
-        except Exception:
-            sl_val = None
+            session.switch_position_mode(category="linear", symbol=symbol, mode=want["position_mode"])
+            have["position_mode"] = want["position_mode"]
+        except Exception as e:
+            if _not_modified(e):
+                have["position_mode"] = want["position_mode"]
+
+    if have.get("trade_mode") != want["trade_mode"]:
+        enviados += 1
         try:
-            if tp_raw not in (None, "", "0", 0):
-                tp_val = float(tp_raw)
-        except Exception:
-            tp_val = None
+            session.set_margin_mode(category="linear", symbol=symbol, tradeMode=want["trade_mode"])
+            have["trade_mode"] = want["trade_mode"]
+        except Exception as e:
+            if _not_modified(e):
+                have["trade_mode"] = want["trade_mode"]
 
-        return {"side": side, "qty": qty, "avgPrice": price, "stopLoss": sl_val, "takeProfit": tp_val}
-    except Exception:
-        return None
+    if have.get("leverage") != want["leverage"]:
+        enviados += 1
+        try:
+            session.set_leverage(category="linear", symbol=symbol,
+                                 buyLeverage=str(want["leverage"]), sellLeverage=str(want["leverage"]))
+            have["leverage"] = want["leverage"]
+        except Exception as e:
+            if _not_modified(e):
+                have["leverage"] = want["leverage"]
+
+    return enviados
 
 def set_symbol_leverage(symbol, lev: int = 10):
+    """Compat: delega en el cache (solo reenvía si hay drift)."""
     try:
-        session.set_leverage(category="linear", symbol=symbol,
-                             buyLeverage=str(lev), sellLeverage=str(lev))
-        try:
-            session.switch_position_mode(category="linear", mode=0)
-        except Exception:
-            pass
-        try:
-            session.set_margin_mode(category="linear", symbol=symbol, tradeMode=1)  # 1=Isolated
-        except Exception:
-            pass
+        ensure_symbol_config(symbol, lev=lev)
     except Exception:
         pass
 
 # ---------- Órdenes & TPSL ----------
-def place_market(symbol: str, side: str, qty: float):
+def place_market(symbol: str, side: str, qty: float, reduce_only: bool = False,
+                 take_profit: float = None, stop_loss: float = None):
     """
     Orden market con qty ajustada/serializada (sin colas binarias).
+    Con take_profit/stop_loss los adjunta en el MISMO request (tpslMode=Full):
+    la posición nace protegida, sin ventana entre el fill y el SL.
     Devuelve (ok, resp|msg).
     """
     f = load_symbol_filters(symbol) or {"min_qty": 0.0, "step": 0.001}
     step = float(f.get("step", 0.001)); minq = float(f.get("min_qty", 0.0))
+    tick = float(f.get("tick") or 0.0)
+    side_txt = "Buy" if str(side).lower() == "buy" else "Sell"
+    qty_txt = ""
     try:
         qty_txt = quantize_qty(qty, step, minq)
-        r = session.place_order(category="linear", symbol=symbol, side=side,
-                                orderType="Market", qty=qty_txt, timeInForce="GTC", reduceOnly=False)
+        kw = dict(category="linear", symbol=symbol, side=side_txt, orderType="Market",
+                  qty=qty_txt, timeInForce="GTC", reduceOnly=bool(reduce_only))
+        if take_profit is not None or stop_loss is not None:
+            kw["tpslMode"] = "Full"
+            if take_profit is not None:
+                kw["takeProfit"] = quantize_price(float(take_profit), tick)
+                kw["tpTriggerBy"] = "LastPrice"
+            if stop_loss is not None:
+                kw["stopLoss"] = quantize_price(float(stop_loss), tick)
+                kw["slTriggerBy"] = "LastPrice"
+        r = session.place_order(**kw)
         return True, r
     except Exception as e:
         msg = str(e)
@@ -224,11 +330,13 @@ def clear_tpsl(symbol: str):
     except Exception:
         pass
 
-def set_trading_stop(symbol: str, take_profit: float = None, stop_loss: float = None):
+def set_trading_stop(symbol: str, take_profit: float = None, stop_loss: float = None, posicion: dict = None):
     """
     SL/TP con validación por lado y cuantización por tickSize.
     + Regla MONOTÓNICA: NUNCA bajar SL (respeta manual más alto en LONG / más bajo en SHORT).
     Downgrade de 'not modified (34040)' a OK lógico.
+    `posicion` (formato fetch_position_for_symbol) evita la relectura si el caller
+    tiene estado fresco (core.stops.GestorStops).
     """
     try:
         f = load_symbol_filters(symbol) or {}
@@ -238,7 +346,7 @@ def set_trading_stop(symbol: str, take_profit: float = None, stop_loss: float =
         sl_val = None if stop_loss  is None else float(stop_loss)
 
         # leer posición para lado/base y SL actual
-        pos = fetch_position_for_symbol(symbol)
+        pos = posicion if posicion is not None else fetch_position_for_symbol(symbol)
         base = 0.0; side = None; current_sl = None
         if pos:
             base = float(pos.get("avgPrice") or 0.0) or float(get_last_price(symbol) or 0.0)
@@ -291,3 +399,67 @@ def set_trading_stop(symbol: str, take_profit: float = None, stop_loss: float =
 
     except Exception as e:
         return False, f"exception: {e}"
+
+# ---------- Protecciones residentes en el exchange ----------
+def set_native_trailing(symbol: str, distance: float, active_price: float = None):
+    """
+    Trailing nativo de Bybit: `trailingStop` es distancia en precio y
+    `activePrice` el precio que lo activa. Queda corriendo en el exchange
+    (no depende de la latencia del loop). Devuelve (ok, resp|msg).
+    """
+    try:
+        f = load_symbol_filters(symbol) or {}
+        tick = float(f.get("tick") or 0.0)
+        kw = dict(category="linear", symbol=symbol, tpslMode="Full", positionIdx=0,
+                  trailingStop=quantize_price(float(distance), tick))
+        if active_price is not None:
+            kw["activePrice"] = quantize_price(float(active_price), tick)
+        resp = session.set_trading_stop(**kw)
+        ret_code = str((resp or {}).get("retCode", "0"))
+        if ret_code in ("0", "34040"):
+            return True, resp
+        return False, resp
+    except Exception as e:
+        if _not_modified(e) or "34040" in str(e):
+            return True, str(e)
+        return False, f"exception: {e}"
+
+def place_reduce_limit(symbol: str, side: str, qty: float, price: float, order_link_id: str = None):
+    """
+    Limit reduce-only GTC (take profit parcial apoyado en el libro).
+    Devuelve (ok, order_id|msg).
+    """
+    f = load_symbol_filters(symbol) or {"min_qty": 0.0, "step": 0.001}
+    step = float(f.get("step", 0.001)); minq = float(f.get("min_qty", 0.0))
+    tick = float(f.get("tick") or 0.0)
+    side_txt = "Buy" if str(side).lower() == "buy" else "Sell"
+    try:
+        kw = dict(category="linear", symbol=symbol, side=side_txt, orderType="Limit",
+                  qty=quantize_qty(qty, step, minq), price=quantize_price(float(price), tick),
+                  timeInForce="GTC", reduceOnly=True)
+        if order_link_id:
+            kw["orderLinkId"] = order_link_id
+        r = session.place_order(**kw)
+        return True, str(((r or {}).get("result") or {}).get("orderId") or "")
+    except Exception as e:
+        return False, str(e)
+
+def get_open_orders(symbol: str):
+    """
+    Órdenes activas (no condicionales) del símbolo: lista de dicts crudos de
+    Bybit, o None si el REST falló (no es lo mismo que "no hay órdenes").
+    """
+    try:
+        r = session.get_open_orders(category="linear", symbol=symbol, openOnly=0)
+        return list(r["result"]["list"] or [])
+    except Exception:
+        return None
+
+def cancel_order(symbol: str, order_id: str):
+    try:
+        session.cancel_order(category="linear", symbol=symbol, orderId=order_id)
+        return True, None
+    except Exception as e:
+        msg = str(e)
+        # 110001: la orden ya no existe (llenada/cancelada)
+        return ("110001" in msg or "not exist" in msg.lower()), msg
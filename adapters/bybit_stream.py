@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Stream privado Bybit v5 (execution / order / position) para el core.
+
+- Normaliza los mensajes crudos del WebSocket privado a eventos planos
+  y los deja en una cola (`eventos`) que consume el loop principal.
+- Dedupe por execId y descarte de mensajes de posición fuera de orden (seq).
+- Marca resync (snapshot REST) al conectar, al reconectar y si el stream
+  queda sin confirmar conexión más de `stale_s` segundos.
+- El transporte es inyectable: en tests se usa un stand-in que reproduce
+  mensajes grabados llamando a `procesar(msg)`.
+"""
+
+import os
+import time
+import queue
+import logging
+from collections import deque
+
+LOG = logging.getLogger("bibit")
+
+TOPICS = ("execution", "order", "position")
+
+
+def _f(x, default=0.0):
+    try:
+        if x in (None, ""):
+            return default
+        return float(x)
+    except Exception:
+        return default
+
+
+def _f_or_none(x):
+    v = _f(x, None)
+    return None if (v is None or v == 0.0) else v
+
+
+# ---- Motivo exacto de cierre/ejecución ----
+_MOTIVOS_STOP = {
+    "takeprofit": "Take Profit",
+    "stoploss": "Stop Loss",
+    "trailingstop": "Trailing Stop",
+    "partialtakeprofit": "Take Profit parcial",
+    "partialstoploss": "Stop Loss parcial",
+    "tpslorder": "TP/SL",
+}
+_MOTIVOS_CREATE = {
+    "createbytakeprofit": "Take Profit",
+    "createbystoploss": "Stop Loss",
+    "createbytrailingstop": "Trailing Stop",
+    "createbypartialtakeprofit": "Take Profit parcial",
+    "createbypartialstoploss": "Stop Loss parcial",
+    "createbyliq": "Liquidación",
+    "createbyadl_pm": "ADL",
+    "createbyadl": "ADL",
+    "createbytakeover_pm": "Liquidación",
+}
+
+
+def motivo_desde_ejecucion(stop_order_type: str = "", create_type: str = "") -> str:
+    """Traduce stopOrderType/createType de Bybit a texto del bot."""
+    s = str(stop_order_type or "").replace("_", "").lower()
+    if s in _MOTIVOS_STOP:
+        return _MOTIVOS_STOP[s]
+    c = str(create_type or "").lower()
+    if c in _MOTIVOS_CREATE:
+        return _MOTIVOS_CREATE[c]
+    return "Cierre manual/externo"
+
+
+# ---- Normalización ----
+def normalizar_ejecucion(d: dict) -> dict:
+    return {
+        "tipo": "ejecucion",
+        "symbol": d.get("symbol"),
+        "side": str(d.get("side") or ""),             # lado de la orden (Buy/Sell)
+        "precio": _f(d.get("execPrice")),
+        "qty": _f(d.get("execQty")),
+        "leaves_qty": _f(d.get("leavesQty")),
+        "closed_size": _f(d.get("closedSize")),
+        "fee": _f(d.get("execFee")),
+        "order_id": str(d.get("orderId") or ""),
+        "order_link_id": str(d.get("orderLinkId") or ""),
+        "exec_id": str(d.get("execId") or ""),
+        "motivo": motivo_desde_ejecucion(d.get("stopOrderType"), d.get("createType")),
+        "ts": int(_f(d.get("execTime"), time.time() * 1000)),
+        "seq": int(_f(d.get("seq"), 0)),
+    }
+
+
+def normalizar_posicion(d: dict) -> dict:
+    side_raw = str(d.get("side") or "")
+    return {
+        "tipo": "posicion",
+        "symbol": d.get("symbol"),
+        "side": side_raw if side_raw in ("Buy", "Sell") else "",
+        "qty": _f(d.get("size")),
+        "avgPrice": _f(d.get("avgPrice") or d.get("entryPrice")),
+        "stopLoss": _f_or_none(d.get("stopLoss")),
+        "takeProfit": _f_or_none(d.get("takeProfit")),
+        "trailingStop": _f_or_none(d.get("trailingStop")),
+        "ts": int(_f(d.get("updatedTime"), time.time() * 1000)),
+        "seq": int(_f(d.get("seq"), 0)),
+    }
+
+
+def normalizar_orden(d: dict) -> dict:
+    return {
+        "tipo": "orden",
+        "symbol": d.get("symbol"),
+        "order_id": str(d.get("orderId") or ""),
+        "order_link_id": str(d.get("orderLinkId") or ""),
+        "status": str(d.get("orderStatus") or ""),
+        "side": str(d.get("side") or ""),
+        "reduce_only": bool(d.get("reduceOnly", False)),
+        "stop_order_type": str(d.get("stopOrderType") or ""),
+        "precio": _f(d.get("price")),
+        "trigger": _f(d.get("triggerPrice")),
+        "qty": _f(d.get("qty")),
+        "ts": int(_f(d.get("updatedTime"), time.time() * 1000)),
+    }
+
+
+class StreamPrivado:
+    """
+    Capa de eventos privados. Uso típico (core):
+        st = StreamPrivado(SIMBOLOS, snapshot=fetch_position_snapshot)
+        st.iniciar()
+        ...
+        st.resync_si_corresponde()   # en el loop
+        ev = st.eventos.get(timeout=...)
+    """
+
+    def __init__(self, simbolos, snapshot=None, transporte=None, stale_s: float = 60.0,
+                 max_exec_ids: int = 5000):
+        self.simbolos = set(simbolos or [])
+        self.eventos = queue.Queue()
+        self._snapshot = snapshot          # callable(symbol) -> dict|None (REST); error => excepción
+        self._transporte = transporte      # objeto con is_connected(); None => pybit
+        self._ws = None
+        self.stale_s = float(stale_s)
+        self._seq_pos = {}                 # symbol -> último seq de posición
+        self._exec_ids = deque(maxlen=int(max_exec_ids))
+        self._exec_set = set()
+        self._conectado = False
+        self._ultimo_ok = 0.0              # última vez que el transporte estaba conectado
+        self._resync_pendiente = True      # primer snapshot al arrancar
+        self.ultimo_msg = 0.0
+        self.resyncs = 0
+
+    # ---- transporte ----
+    def iniciar(self):
+        if self._transporte is None:
+            self._ws = _crear_ws_pybit()
+            for topic in TOPICS:
+                getattr(self._ws, f"{topic}_stream")(callback=self.procesar)
+        else:
+            self._ws = self._transporte
+        self._conectado = True
+        self._ultimo_ok = time.time()
+        LOG.info("STREAM privado iniciado (%s)", ",".join(TOPICS))
+        return self
+
+    def detener(self):
+        try:
+            if self._ws is not None and hasattr(self._ws, "exit"):
+                self._ws.exit()
+        except Exception:
+            pass
+        self._conectado = False
+
+    def activo(self) -> bool:
+        return self._ws is not None and self._conectado
+
+    def _chequear_conexion(self):
+        now = time.time()
+        try:
+            ok = bool(self._ws.is_connected()) if self._ws is not None else False
+        except Exception:
+            ok = False
+        if ok:
+            if not self._conectado:
+                LOG.warning("STREAM reconectado: se pide resync REST")
+                self._resync_pendiente = True
+            self._conectado = True
+            self._ultimo_ok = now
+        else:
+            if self._conectado and (now - self._ultimo_ok) >= self.stale_s:
+                LOG.warning("STREAM sin conexión hace %.0fs", now - self._ultimo_ok)
+                self._conectado = False
+        return self._conectado
+
+    def marcar_gap(self, motivo: str = ""):
+        LOG.warning("STREAM gap (%s): resync REST pendiente", motivo or "manual")
+        self._resync_pendiente = True
+
+    def resync_si_corresponde(self) -> bool:
+        """
+        Si hubo (re)conexión o gap, lee snapshot REST por símbolo y lo encola
+        como evento 'snapshot'. Se llama desde el hilo del loop (no del WS).
+        Si el REST falla para un símbolo no se encola nada para él y el resync
+        queda pendiente (se reintenta en la próxima llamada).
+        """
+        self._chequear_conexion()
+        if not self._resync_pendiente or not callable(self._snapshot):
+            return False
+        self._resync_pendiente = False
+        for s in sorted(self.simbolos):
+            try:
+                p = self._snapshot(s)
+            except Exception as e:
+                LOG.error("STREAM resync %s fallo: %s", s, e)
+                self._resync_pendiente = True
+                continue
+            ev = {"tipo": "snapshot", "symbol": s, "side": "", "qty": 0.0, "avgPrice": 0.0,
+                  "stopLoss": None, "takeProfit": None, "trailingStop": None,
+                  "ts": int(time.time() * 1000)}
+            if p:
+                ev.update({
+                    "side": p.get("side", ""),
+                    "qty": _f(p.get("qty")),
+                    "avgPrice": _f(p.get("avgPrice")),
+                    "stopLoss": p.get("stopLoss"),
+                    "takeProfit": p.get("takeProfit"),
+                    "trailingStop": p.get("trailingStop"),
+                })
+            self.eventos.put(ev)
+        self.resyncs += 1
+        return True
+
+    # ---- mensajes crudos ----
+    def procesar(self, msg: dict):
+        """Callback del WebSocket: normaliza y encola. Nunca lanza."""
+        try:
+            self.ultimo_msg = time.time()
+            topic = str((msg or {}).get("topic") or "")
+            data = (msg or {}).get("data") or []
+            if isinstance(data, dict):
+                data = [data]
+            for d in data:
+                sym = d.get("symbol")
+                if self.simbolos and sym not in self.simbolos:
+                    continue
+                if topic.startswith("execution"):
+                    ev = normalizar_ejecucion(d)
+                    if str(d.get("execType") or "Trade") != "Trade":
+                        continue  # funding / ADL bookkeeping
+                    if ev["exec_id"]:
+                        if ev["exec_id"] in self._exec_set:
+                            continue
+                        if len(self._exec_ids) == self._exec_ids.maxlen:
+                            self._exec_set.discard(self._exec_ids[0])
+                        self._exec_ids.append(ev["exec_id"])
+                        self._exec_set.add(ev["exec_id"])
+                    self.eventos.put(ev)
+                elif topic.startswith("position"):
+                    ev = normalizar_posicion(d)
+                    last = self._seq_pos.get(sym)
+                    if last is not None and ev["seq"] and ev["seq"] < last:
+                        continue  # mensaje viejo (fuera de orden)
+                    if ev["seq"]:
+                        self._seq_pos[sym] = ev["seq"]
+                    self.eventos.put(ev)
+                elif topic.startswith("order"):
+                    self.eventos.put(normalizar_orden(d))
+        except Exception as e:
+            LOG.error("STREAM mensaje inválido: %s (%s)", e, str(msg)[:200])
+            self.marcar_gap("mensaje inválido")
+
+
+def _crear_ws_pybit():
+    """WebSocket privado con las mismas credenciales/entorno que el adapter REST."""
+    from pybit.unified_trading import WebSocket
+    env = (os.getenv("BYBIT_ENV") or "DEMO").upper()
+    key = os.getenv("BYBIT_API_KEY") or os.getenv("BYBIT_KEY")
+    secret = os.getenv("BYBIT_API_SECRET") or os.getenv("BYBIT_SECRET")
+    kw = {"channel_type": "private", "api_key": key, "api_secret": secret}
+    if env == "DEMO":
+        kw.update({"testnet": False, "demo": True})
+    elif env == "TESTNET":
+        kw.update({"testnet": True})
+    else:
+        kw.update({"testnet": False})
+    return WebSocket(**kw)
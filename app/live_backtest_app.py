@@ -19,14 +19,15 @@ try:
 except Exception:
     pass
 
-import json, copy, glob, time, shutil, datetime, sys, subprocess, os
+import json, copy, time, shutil, datetime, sys, subprocess, os
 from pathlib import Path
 import pandas as pd
 import plotly.graph_objects as go
-from io import BytesIO
 
 st.set_page_config(page_title="Live Backtest", page_icon="📈", layout="wide")
 ROOT = Path(__file__).resolve().parent
+if str(ROOT.parent) not in sys.path:
+    sys.path.insert(0, str(ROOT.parent))   # backtest.py / backtesting/ viven en la raíz
 
 # ==================== IMPORT BACKTEST ====================
 try:
@@ -80,49 +81,41 @@ st.markdown(BINANCE_CSS, unsafe_allow_html=True)
 
 # ==================== HELPERS ====================
 def load_settings(path=ROOT/"settings.json"):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Memoizado por mtime: los reruns de Streamlit no releen el JSON si no cambió."""
+    from backtesting.cache_resultados import json_por_mtime
+    return json_por_mtime(path)
+
+def firma_datos(symbol, tf):
+    """Identidad (archivo, mtime, tamaño) de los CSV base de símbolo/TF, para las claves de cache."""
+    from datos.cache_ohlcv import archivos_cache
+    from datos.resample import tf_base_para
+    from backtesting.cache_resultados import firma_archivos
+    cache_dir = ROOT.parent / "cache"
+    base = tf_base_para(symbol, tf, cache_dir)
+    return base, (firma_archivos(archivos_cache(symbol, base, cache_dir)) if base else [])
 
 def ensure_df(symbol="ETHUSDT", tf="15m", since="2025-01-01"):
-    """Lee el CSV más nuevo en cache/ que matchee símbolo/TF. No descarga nada."""
-    cache_dir = ROOT / "cache"
-    if not cache_dir.exists():
-        return None, "No existe la carpeta cache/ (corré backtest.py una vez).", None
-    patt = f"ohlcv_{symbol.replace('USDT','-USDT')}_{tf}_*.csv"
-    files = sorted(glob.glob(str(cache_dir / patt)))
-    if not files:
-        return None, f"No hay CSVs {patt}. Generá cache con backtest.py.", None
-    files.sort(key=lambda p: Path(p).stat().st_mtime, reverse=True)
-    path = Path(files[0])
-
+    """
+    Velas de símbolo/TF derivadas de la base más fina del cache (consolidado +
+    legados, sin duplicados). No descarga nada. Los frames quedan en el LRU en
+    memoria de backtesting.cache_resultados mientras los archivos no cambien.
+    """
+    from datos.cache_ohlcv import archivos_cache
+    from datos.resample import cargar_tf
+    from backtesting.cache_resultados import clave, por_defecto
+    cache_dir = ROOT.parent / "cache"
+    base, firma = firma_datos(symbol, tf)
+    if base is None:
+        return None, (f"No hay cache de {symbol} {tf} ni de un TF menor. Generalo con: "
+                      f"python -m datos.descarga --simbolos {symbol} --tfs {tf}"), None
+    path = archivos_cache(symbol, base, cache_dir)[-1]
     try:
-        df = pd.read_csv(path)
+        df, _ = por_defecto().memo(clave("df", symbol, tf, since, base, firma),
+                                   lambda: cargar_tf(symbol, tf, since=since, cache_dir=cache_dir, base=base),
+                                   disco=False)
     except Exception as e:
         return None, f"No pude leer {path.name}: {e}", path
-
-    # normalizar tiempo
-    if "ts" in df.columns:
-        df["time"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
-    elif "time" in df.columns:
-        if pd.api.types.is_integer_dtype(df["time"]):
-            df["time"] = pd.to_datetime(df["time"], unit="ms", utc=True)
-        else:
-            df["time"] = pd.to_datetime(df["time"], utc=True, errors="coerce")
-    else:
-        return None, f"El CSV {path.name} no tiene columna ts/time.", path
-
-    # desde 'since' si aplica
-    try:
-        since_ts = pd.to_datetime(since, utc=True)
-        df = df[df["time"] >= since_ts].reset_index(drop=True)
-    except Exception:
-        pass
-
-    for c in ("open","high","low","close","volume"):
-        if c not in df.columns:
-            return None, f"El CSV {path.name} no tiene '{c}'. Re-generalo con backtest.py.", path
-
-    return df, None, path
+    return (df.copy() if df is not None else None), None, path
 
 def apply_last_n_days(df, n_days):
     if df is None or df.empty or not n_days or n_days <= 0:
@@ -130,6 +123,27 @@ def apply_last_n_days(df, n_days):
     cutoff = df["time"].max() - pd.Timedelta(days=int(n_days))
     return df[df["time"] >= cutoff].reset_index(drop=True)
 
+def run_portfolio_live(cfg_ui, dfs, status=None):
+    """Como run_backtest_live pero con todos los símbolos y capital compartido."""
+    if not HAVE_BT:
+        return None, f"No se pudo importar backtest.py: {IMPORT_ERR}"
+    if not dfs:
+        return None, "No se cargaron velas desde cache."
+    t1 = time.time()
+    try:
+        from backtesting.portafolio import run_portfolio
+        CFGN = bt.normalize_cfg(cfg_ui)
+        tf = CFGN.get("estrategia", {}).get("tf", "15m")
+        trades, audit, eq = run_portfolio(dfs, tf, CFGN)
+    except Exception as e:
+        return None, f"Error en run_portfolio: {e}"
+    status and status.write(f"✅ run_portfolio OK ({', '.join(dfs)}) en {time.time()-t1:.2f}s")
+
+    df_eq = pd.DataFrame(eq, columns=["time","equity"])
+    if not df_eq.empty:
+        df_eq["time"] = pd.to_datetime(df_eq["time"], utc=True).dt.tz_convert(None)
+    return {"trades": pd.DataFrame(trades), "equity": df_eq, "audit": audit, "used_path": None}, None
+
 def run_backtest_live(cfg_ui, df_override=None, status=None):
     if not HAVE_BT:
         return None, f"No se pudo importar backtest.py: {IMPORT_ERR}"
@@ -251,95 +265,9 @@ def prepare_trades_csv(df_raw: pd.DataFrame) -> pd.DataFrame:
 
 # ---------- XLSX con formato y hoja Resumen ----------
 def df_to_pretty_xlsx(df: pd.DataFrame, resumen: dict) -> bytes:
-    # Renombrar encabezados a español
-    rename_es = {
-        "symbol": "Símbolo",
-        "side": "Dirección",
-        "qty": "Cantidad",
-        "price_entry": "Entrada",
-        "price_exit": "Salida",
-        "pnl": "PnL (USDT)",
-        "pnl_pct": "PnL (%)",
-        "ts_entry": "Fecha Entrada",
-        "ts_exit": "Fecha Salida",
-        "exit_reason": "Motivo",
-    }
-    df_es = df.rename(columns={k: v for k, v in rename_es.items() if k in df.columns}).copy()
-
-    # Preparar writer
-    output = BytesIO()
-    engine = None
-    try:
-        engine = "xlsxwriter"
-        writer = pd.ExcelWriter(output, engine=engine)
-    except Exception:
-        engine = "openpyxl"
-        writer = pd.ExcelWriter(output, engine=engine)
-
-    # ---- Hoja Trades ----
-    sheet_trades = "Trades"
-    df_es.to_excel(writer, index=False, sheet_name=sheet_trades)
-
-    if engine == "xlsxwriter":
-        wb  = writer.book
-        ws  = writer.sheets[sheet_trades]
-        fmt_hdr = wb.add_format({"bold": True, "align": "center", "valign":"vcenter",
-                                 "border":1, "bg_color":"#eaeaea"})
-        fmt_c   = wb.add_format({"align": "center", "valign":"vcenter", "border":1})
-        fmt_n2  = wb.add_format({"align": "center", "valign":"vcenter", "border":1, "num_format":"0.00"})
-        fmt_n4  = wb.add_format({"align": "center", "valign":"vcenter", "border":1, "num_format":"0.0000"})
-
-        # Encabezados
-        for col, col_name in enumerate(df_es.columns, start=1):
-            ws.write(1, col-1, col_name, fmt_hdr)
-
-        # Celdas
-        nrows, ncols = df_es.shape
-        for r in range(nrows):
-            for c in range(ncols):
-                val = df_es.iat[r, c]
-                # elegir formato
-                if isinstance(val, (int, float)):
-                    fmt = fmt_n2 if col_name not in ("Cantidad",) else fmt_n4
-                else:
-                    fmt = fmt_c
-                ws.write(r+2, c, val, fmt)
-
-        # Ancho de columnas
-        for i, c in enumerate(df_es.columns):
-            maxlen = max([len(str(c))] + [len(str(x)) for x in df_es[c].astype(str).tolist()])
-            ws.set_column(i, i, min(maxlen+2, 28))
-
-        # Freeze header
-        ws.freeze_panes(2, 0)
-
-        # ---- Hoja Resumen
-        sheet_res = "Resumen"
-        ws2 = wb.add_worksheet(sheet_res)
-        big = wb.add_format({"bold": True, "font_size": 18})
-        lbl = wb.add_format({"bold": True})
-        val = wb.add_format({"bold": True, "font_color":"#0a8754"})
-
-        ws2.write(0, 0, "Resumen de Resultados", big)
-        ws2.write(2, 0, "PnL total (USDT):", lbl); ws2.write(2, 1, resumen.get("pnl_total", 0.0), val)
-        ws2.write(3, 0, "Winrate (%):", lbl);      ws2.write(3, 1, resumen.get("winrate", 0.0), val)
-        ws2.write(4, 0, "Profit Factor:", lbl);    ws2.write(4, 1, resumen.get("pf", "NA"), val)
-        ws2.set_column(0, 1, 22)
-
-    else:
-        # openpyxl: formateo más simple para asegurar compatibilidad
-        writer.sheets[sheet_trades].freeze_panes = "A3"
-
-        # Resumen como segunda hoja
-        pd.DataFrame(
-            {
-                "Métrica": ["PnL total (USDT)", "Winrate (%)", "Profit Factor"],
-                "Valor": [resumen.get("pnl_total", 0.0), resumen.get("winrate", 0.0), resumen.get("pf", "NA")],
-            }
-        ).to_excel(writer, index=False, sheet_name="Resumen")
-
-    writer.close()
-    return output.getvalue()
+    """Trades + Resumen en streaming (backtesting.exportar: filas en bloque, formato por columna)."""
+    from backtesting.exportar import trades_xlsx
+    return trades_xlsx(df, resumen)
 
 # ==================== EXPORTAR AL BOT (bridge) ====================
 CORE_DIR = ROOT / "core"
@@ -438,6 +366,8 @@ with st.sidebar:
     sym_choice = st.selectbox("Símbolo", available_symbols,
                               index=available_symbols.index(symbol_hdr) if symbol_hdr in available_symbols else 0,
                               help="Símbolo a testear y a enviar al bot.")
+    modo_portafolio = st.checkbox("Portafolio (todos los símbolos seleccionados)", value=False,
+                                  help="Un solo run con capital compartido, anti-piramidado y risk_controls entre símbolos.")
 
     st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
     st.markdown("### Rango de datos")
@@ -709,98 +639,173 @@ with right:
 status = st.empty()  # progreso textual
 
 # ==================== RUN ====================
+# Los backtests corren como jobs en procesos aparte (backtesting.jobs): el script
+# envía, muestra el avance en cada rerun y el resultado cuando termina.
+from backtesting.cache_resultados import clave as _clave_cache, por_defecto as _cache_res
+from backtesting.metricas import metricas as _metricas
+from utils.graficos import FILAS_PAGINA, MAX_PUNTOS, pagina, rango_fechas, reducir, traza, ventana
+if "bt_jobs" not in st.session_state:
+    st.session_state["bt_jobs"] = []   # [{id, run_key, symbol, tf, since, n_days, cfg}]
+out, err, desde_cache, curva_parcial = None, None, False, False
 if run_bt:
-    if st.session_state.get("current_run") is not None:
-        st.session_state["last_run"] = st.session_state["current_run"]
-
     symbol = cfg2.get("simbolos", ["ETHUSDT"])[0]
     tf     = cfg2.get("estrategia", {}).get("tf", "15m")
     since  = cfg2.get("since", "2025-01-01")
 
-    df_all, err, used_path = ensure_df(symbol, tf, since)
-    if err:
-        st.error(err); st.stop()
-
-    df_used = apply_last_n_days(df_all, int(n_days)) if use_last_days else df_all
-    out, err = run_backtest_live(cfg2, df_override=df_used, status=status)
-    if err:
-        st.error(err)
+    # cache por (config normalizada, datos, versión del motor): repetir una corrida es instantáneo
+    es_portafolio = bool(modo_portafolio and len(cfg2.get("simbolos", [])) > 1)
+    simbolos_run = cfg2["simbolos"] if es_portafolio else [symbol]
+    run_n_days = int(n_days) if use_last_days else None
+    run_key = None
+    try:
+        run_key = _clave_cache("run", "portafolio" if es_portafolio else "simbolo",
+                               bt.normalize_cfg(cfg2) if HAVE_BT else cfg2, tf, since, run_n_days,
+                               {s_p: firma_datos(s_p, tf) for s_p in simbolos_run})
+    except Exception as e:
+        status.write(f"⚠️ Sin cache de resultados: {e}")
+    out = _cache_res().get(run_key) if run_key else None
+    desde_cache = out is not None
+    if desde_cache:
+        status.write("⚡ Resultado cacheado (misma config y mismos datos)")
+        symbol = out.get("symbol", symbol)
+    elif not HAVE_BT:
+        err = f"No se pudo importar backtest.py: {IMPORT_ERR}"
     else:
-        df_tr, df_eq, audit = out["trades"], out["equity"], out["audit"]
-
-        # Curva
-        if df_eq is None or df_eq.empty:
-            curve_slot.info("Sin datos de equity.")
+        try:
+            from backtesting.jobs import por_defecto as _jobs
+            params = {"tf": tf, "cfg": cfg2, "since": since, "n_days": run_n_days}
+            etiqueta = "+".join(simbolos_run)
+            if es_portafolio:
+                jid = _jobs().enviar("portafolio", etiqueta=etiqueta, simbolos=simbolos_run, **params)
+            else:
+                jid = _jobs().enviar("simbolo", etiqueta=etiqueta, symbol=symbol, **params)
+            # la config con la que se envió: los widgets pueden cambiar mientras corre
+            st.session_state["bt_jobs"].append({"id": jid, "run_key": run_key, "symbol": etiqueta,
+                                                "tf": tf, "since": since, "n_days": run_n_days,
+                                                "cfg": copy.deepcopy(cfg2)})
+        except Exception as e:
+            err = f"No pude lanzar el backtest: {e}"
+
+# Jobs: avance, equity parcial y cancelación; el último terminado se muestra abajo
+if st.session_state["bt_jobs"]:
+    from backtesting.jobs import por_defecto as _jobs
+    seguir = []
+    for info in st.session_state["bt_jobs"]:
+        est = _jobs().estado(info["id"])
+        if est["estado"] in ("en_cola", "corriendo"):
+            seguir.append(info)
+            pr = est.get("progreso") or {}
+            frac = pr.get("velas", 0) / pr["total"] if pr.get("total") else 0.0
+            with left:
+                st.progress(min(1.0, frac), text=f"{info['symbol']} {info['tf']} · {est['estado']} · "
+                                                 f"{pr.get('trades', 0)} trades · PnL {pr.get('pnl', 0.0):.2f}")
+                if st.button("Cancelar", key=f"cancelar_{info['id']}", use_container_width=True):
+                    _jobs().cancelar(info["id"])
+            if est.get("equity") and out is None:
+                eq_p = reducir(pd.DataFrame(est["equity"], columns=["ts", "equity"]), "ts", "equity")
+                fig_p = go.Figure(traza(pd.to_datetime(eq_p["ts"], unit="ms"), eq_p["equity"], "Equity (parcial)"))
+                fig_p.update_layout(height=420, margin=dict(l=10,r=10,t=10,b=10),
+                                    paper_bgcolor="#12161C", plot_bgcolor="#12161C")
+                curve_slot.plotly_chart(fig_p, use_container_width=True)
+                curva_parcial = True
+            continue
+        if est["estado"] == "listo":
+            out, err = _jobs().resultado(info["id"]), None
+            out["symbol"] = symbol = info["symbol"]
+            tf, since = info["tf"], info["since"]
+            cfg_job = info.get("cfg") or cfg2
+            met_run = _metricas(out["trades"].to_dict("records"),
+                                float(cfg_job.get("capital", {}).get("total_usdt", 1000.0)))
+            if info.get("run_key"):
+                _cache_res().put(info["run_key"], out, meta={
+                    "symbol": info["symbol"], "tf": info["tf"], "since": info["since"], "n_days": info["n_days"],
+                    "metricas": met_run})
+            try:   # almacén persistente de corridas (consultas / superposición sin recalcular)
+                from backtesting.almacen import por_defecto as _almacen
+                _almacen().guardar(info["symbol"], info["tf"], bt.normalize_cfg(cfg_job), out["trades"], out["equity"],
+                                   met_run, clave=info.get("run_key"), n_days=info["n_days"])
+            except Exception as e:
+                status.warning(f"No pude guardar la corrida en el almacén: {e}")
+            status.write(f"✅ Backtest {info['symbol']} listo en {est.get('fin', 0) - est.get('enviado', 0):.1f}s")
+        elif est["estado"] == "cancelado":
+            status.info(f"Backtest {info['symbol']} cancelado.")
         else:
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=df_eq["time"], y=df_eq["equity"], mode="lines", name="Equity"))
-            fig.update_layout(height=420, margin=dict(l=10,r=10,t=10,b=10),
-                              paper_bgcolor="#12161C", plot_bgcolor="#12161C",
-                              xaxis=dict(gridcolor="#1E2329"), yaxis=dict(gridcolor="#1E2329"))
-            curve_slot.plotly_chart(fig, use_container_width=True)
-
-        # Métricas
-        pnl_total = round(df_tr["pnl"].sum(),2) if not df_tr.empty else 0.0
-        wins = df_tr[df_tr["pnl"]>0]; losses = df_tr[df_tr["pnl"]<0]
-        winrate = round(len(wins)/len(df_tr)*100,2) if len(df_tr)>0 else 0.0
-        pf = round(wins["pnl"].sum()/abs(losses["pnl"].sum()),2) if (len(wins)>0 and len(losses)>0) else ("NA" if len(wins)>0 else 0.0)
-
-        motivo_col = None
-        for c in ["exit_reason","reason","motivo","Motivo salida","Motivo_salida","Motivo"]:
-            if c in df_tr.columns: motivo_col=c; break
-        counts = {}
-        if motivo_col:
-            val = df_tr[motivo_col].astype(str).str.upper().str.strip()
-            show = ["SL","TP"]
-            if cfg2["partials"]["enabled"]: show += ["PARCIAL"]
-            if cfg2["auto_trailing"]["enabled"]: show += ["TSL","BE"]
-            for k in show: counts[k] = int((val==k).sum())
-
-        m_html = f"""
-        <div class="metric">
-          <div class="k">PnL total</div><div class="v">{pnl_total} USDT</div>
-          <div class="k">Operaciones</div><div class="v">{int(len(df_tr))}</div>
-          <div class="k">Winrate</div><div class="v">{winrate}%</div>
-          <div class="k">Profit Factor</div><div class="v">{pf}</div>
-        """
-        for k in ["SL","TP","PARCIAL","TSL","BE"]:
-            if k in counts: m_html += f'<div class="k">Salidas {k}</div><div class="v">{counts[k]}</div>'
-        m_html += "</div>"
-        metrics_slot.markdown(m_html, unsafe_allow_html=True)
-
+            err = f"Error en el backtest {info['symbol']}: {est.get('error', est['estado'])}"
+        _jobs().olvidar(info["id"])
+    st.session_state["bt_jobs"] = seguir
+
+if out is not None and not err and st.session_state.get("current_run") is not None:
+    st.session_state["last_run"] = st.session_state["current_run"]
+if err:
+    st.error(err)
+elif out is not None:
+    df_tr, df_eq, audit = out["trades"], out["equity"], out["audit"]
+
+    # (la curva se dibuja más abajo desde current_run: sobrevive a los reruns)
+    # Métricas
+    pnl_total = round(df_tr["pnl"].sum(),2) if not df_tr.empty else 0.0
+    wins = df_tr[df_tr["pnl"]>0]; losses = df_tr[df_tr["pnl"]<0]
+    winrate = round(len(wins)/len(df_tr)*100,2) if len(df_tr)>0 else 0.0
+    pf = round(wins["pnl"].sum()/abs(losses["pnl"].sum()),2) if (len(wins)>0 and len(losses)>0) else ("NA" if len(wins)>0 else 0.0)
+
+    motivo_col = None
+    for c in ["exit_reason","reason","motivo","Motivo salida","Motivo_salida","Motivo"]:
+        if c in df_tr.columns: motivo_col=c; break
+    counts = {}
+    if motivo_col:
+        val = df_tr[motivo_col].astype(str).str.upper().str.strip()
+        show = ["SL","TP"]
+        if cfg2["partials"]["enabled"]: show += ["PARCIAL"]
+        if cfg2["auto_trailing"]["enabled"]: show += ["TSL","BE"]
+        for k in show: counts[k] = int((val==k).sum())
+
+    m_html = f"""
+    <div class="metric">
+      <div class="k">PnL total</div><div class="v">{pnl_total} USDT</div>
+      <div class="k">Operaciones</div><div class="v">{int(len(df_tr))}</div>
+      <div class="k">Winrate</div><div class="v">{winrate}%</div>
+      <div class="k">Profit Factor</div><div class="v">{pf}</div>
+    """
+    for k in ["SL","TP","PARCIAL","TSL","BE"]:
+        if k in counts: m_html += f'<div class="k">Salidas {k}</div><div class="v">{counts[k]}</div>'
+    m_html += "</div>"
+    metrics_slot.markdown(m_html, unsafe_allow_html=True)
+
+_hubo_run = out is not None and not err   # resultado nuevo en este rerun (no en los de polling)
 # === FAB: Auto-export Excel ===
-try:
-    import pandas as pd
-    # infer trades df name: prefer df_tr if exists else first displayed table var
-    df_trades_var = None
-    if 'df_tr' in locals(): df_trades_var = df_tr
-    elif 'df_trades' in locals(): df_trades_var = df_trades
-    # equity variable inference
-    eq_df = None
-    if 'df_eq' in locals(): 
-        eq_df = df_eq.rename(columns={'time':'ts'}) if 'time' in df_eq.columns else df_eq
-    # metrics inference
-    metrics_dict = {}
-    if 'pnl_total' in locals(): metrics_dict['PnL'] = pnl_total
-    if 'winrate' in locals(): metrics_dict['WR'] = winrate
-    if 'pf' in locals(): metrics_dict['PF'] = pf
-    # session persistence
-    st.session_state['equity_prev'] = st.session_state.get('equity_curr')
-    st.session_state['equity_curr'] = eq_df.copy() if eq_df is not None else None
-    st.session_state['last_config_used'] = _sanitize_riesgo(cfg2) if 'cfg2' in locals() else {}
-    out_dir = Path('out'); out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir / f"backtest_{_now_iso()}.xlsx"
-    export_excel_completo(
-        path_xlsx=str(out_path),
-        df_trades=df_trades_var,
-        equity_df=eq_df if eq_df is not None else pd.DataFrame(columns=['ts','equity']),
-        settings_dict=st.session_state.get('last_config_used') or {},
-        metrics_dict=metrics_dict,
-        equity_prev_df=st.session_state.get('equity_prev')
-    )
-    st.success(f"Excel auto-guardado: {out_path}")
-except Exception as _e_auto:
-    st.warning(f"No se pudo auto-exportar Excel: {_e_auto}")
+if _hubo_run:
+    try:
+        import pandas as pd
+        # infer trades df name: prefer df_tr if exists else first displayed table var
+        df_trades_var = None
+        if 'df_tr' in locals(): df_trades_var = df_tr
+        elif 'df_trades' in locals(): df_trades_var = df_trades
+        # equity variable inference
+        eq_df = None
+        if 'df_eq' in locals(): 
+            eq_df = df_eq.rename(columns={'time':'ts'}) if 'time' in df_eq.columns else df_eq
+        # metrics inference
+        metrics_dict = {}
+        if 'pnl_total' in locals(): metrics_dict['PnL'] = pnl_total
+        if 'winrate' in locals(): metrics_dict['WR'] = winrate
+        if 'pf' in locals(): metrics_dict['PF'] = pf
+        # session persistence
+        st.session_state['equity_prev'] = st.session_state.get('equity_curr')
+        st.session_state['equity_curr'] = eq_df.copy() if eq_df is not None else None
+        st.session_state['last_config_used'] = _sanitize_riesgo(cfg2) if 'cfg2' in locals() else {}
+        out_dir = Path('out'); out_dir.mkdir(parents=True, exist_ok=True)
+        out_path = out_dir / f"backtest_{_now_iso()}.xlsx"
+        export_excel_completo(
+            path_xlsx=str(out_path),
+            df_trades=df_trades_var,
+            equity_df=eq_df if eq_df is not None else pd.DataFrame(columns=['ts','equity']),
+            settings_dict=st.session_state.get('last_config_used') or {},
+            metrics_dict=metrics_dict,
+            equity_prev_df=st.session_state.get('equity_prev')
+        )
+        st.success(f"Excel auto-guardado: {out_path}")
+    except Exception as _e_auto:
+        st.warning(f"No se pudo auto-exportar Excel: {_e_auto}")
 
 # --- SAFE DEFAULTS FOR FIRST RUN (evita NameError si aún no corriste RUN) ---
 pnl_total   = locals().get('pnl_total', 0.0)
@@ -813,23 +818,65 @@ tf          = locals().get('tf', (cfg2.get('estrategia', {}).get('tf', '15m') if
 use_last_days = locals().get('use_last_days', False)
 n_days        = locals().get('n_days', None)
 
-st.session_state["current_run"] = {
-            "metrics": {
-                "PnL": pnl_total,
-                "Ops": int(len(df_tr)),
-                "WR": winrate,
-                "PF": pf,
-                **{f"Out_{k}": v for k, v in counts.items()}},
-            "trades": df_tr.copy(),
-            "symbol": symbol,
-            "tf": tf,
-            "n_days": int(n_days) if use_last_days else None
-        }
+if _hubo_run:
+    st.session_state["current_run"] = {
+                "metrics": {
+                    "PnL": pnl_total,
+                    "Ops": int(len(df_tr)),
+                    "WR": winrate,
+                    "PF": pf,
+                    **{f"Out_{k}": v for k, v in counts.items()}},
+                "trades": df_tr.copy(),
+                "equity": df_eq.copy() if locals().get("df_eq") is not None else pd.DataFrame(),
+                "symbol": symbol,
+                "tf": tf,
+                "n_days": int(n_days) if use_last_days else None
+            }
+
+# ==================== CURVA (LTTB + WebGL + ventana) ====================
+# Al navegador van <= MAX_PUNTOS puntos elegidos con LTTB; la ventana de
+# fechas re-submuestrea solo ese tramo desde la serie completa (detalle al
+# hacer "zoom") y las series grandes van como trazas WebGL.
+_cur_eq = (st.session_state.get("current_run") or {}).get("equity")
+if not curva_parcial and _cur_eq is not None:
+    if _cur_eq.empty:
+        curve_slot.info("Sin datos de equity.")
+    else:
+        t_ini, t_fin = rango_fechas(_cur_eq, "time")
+        desde, hasta = t_ini, t_fin
+        if len(_cur_eq) > MAX_PUNTOS and t_fin > t_ini:
+            with mid:
+                desde, hasta = st.slider("Ventana", min_value=t_ini.to_pydatetime(), max_value=t_fin.to_pydatetime(),
+                                         value=(t_ini.to_pydatetime(), t_fin.to_pydatetime()),
+                                         format="YYYY-MM-DD HH:mm", key=f"curva_ventana_{t_ini.value}_{t_fin.value}")
+        eq_v = ventana(_cur_eq, "time", pd.Timestamp(desde), pd.Timestamp(hasta))
+        eq_v = reducir(eq_v, "time", "equity")
+        fig = go.Figure(traza(eq_v["time"], eq_v["equity"], "Equity"))
+        fig.update_layout(height=420, margin=dict(l=10,r=10,t=10,b=10),
+                          paper_bgcolor="#12161C", plot_bgcolor="#12161C",
+                          xaxis=dict(gridcolor="#1E2329"), yaxis=dict(gridcolor="#1E2329"))
+        curve_slot.plotly_chart(fig, use_container_width=True)
 
 # ==================== COMPARADOR Y TRADES ====================
 st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
 st.markdown("#### Comparador: Anterior vs Actual")
 prev = st.session_state.get("last_run"); cur = st.session_state.get("current_run")
+# cualquier corrida del almacén persistente se puede traer como "Anterior"
+try:
+    from backtesting.almacen import por_defecto as _almacen
+    _hist = _almacen().buscar(n=50)
+except Exception:
+    _hist = pd.DataFrame()
+if not _hist.empty:
+    _opciones = ["Última corrida"] + [
+        f"{datetime.datetime.fromtimestamp(h.creado):%Y-%m-%d %H:%M} · {h.symbol} {h.tf} · "
+        f"PnL {h.pnl or 0.0:.2f} · PF {h.pf or 0.0:.2f} · {h.id[-6:]}" for h in _hist.itertuples()]
+    _sel = st.selectbox("Comparar contra", range(len(_opciones)), format_func=lambda i: _opciones[i])
+    if _sel:
+        _o = _almacen().cargar(_hist["id"].iloc[_sel - 1])
+        if _o is not None:
+            prev = {"metrics": _o["metricas"], "trades": _o["trades"], "symbol": _o["symbol"],
+                    "tf": _o["tf"], "n_days": _o["n_days"]}
 if prev is None or cur is None:
     st.info("Corré al menos dos veces para ver comparación.")
 else:
@@ -848,16 +895,23 @@ else:
         st.markdown('</div>', unsafe_allow_html=True)
 
 st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
-st.markdown("#### Trades (últimos 200)")
+st.markdown("#### Trades")
 if cur and not cur["trades"].empty:
-    df_show = cur["trades"].copy()
+    # paginado del lado del servidor: solo la página pedida se formatea y viaja al navegador
+    pg1, pg2, pg3 = st.columns([1, 1, 2])
+    filas_pag = pg2.selectbox("Filas por página", [50, 100, FILAS_PAGINA, 500], index=2)
+    total_pag = max(1, -(-len(cur["trades"]) // int(filas_pag)))
+    n_pag = pg1.number_input("Página", 1, total_pag, 1, step=1)
+    df_show, total_pag = pagina(cur["trades"], int(n_pag), int(filas_pag))
+    pg3.caption(f"{len(cur['trades']):,} trades · página {int(n_pag)} de {total_pag} (más nuevos primero)")
+    df_show = df_show.copy()
     for c in ("ts_entry","ts_exit"):
         if c in df_show.columns:
             df_show[c] = pd.to_datetime(df_show[c], unit="ms", errors="coerce")
     pref = ["symbol","side","qty","price_entry","price_exit","pnl","pnl_pct","ts_entry","ts_exit","exit_reason"]
     order = [c for c in pref if c in df_show.columns] + [c for c in df_show.columns if c not in pref]
     df_show = df_show[order]
-    st.dataframe(df_show.tail(200), use_container_width=True, height=420)
+    st.dataframe(df_show, use_container_width=True, height=420)
 
     # ===== DESCARGA **XLSX** ORDENADO + RESUMEN =====
     df_csv = prepare_trades_csv(cur["trades"])
@@ -875,9 +929,96 @@ if cur and not cur["trades"].empty:
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         use_container_width=True
     )
+    # sets grandes: CSV / Parquet en out/ (Parquet cae a .csv.gz si no hay pyarrow)
+    ex1, ex2 = st.columns(2)
+    for col_btn, ext in ((ex1, "csv.gz"), (ex2, "parquet")):
+        if col_btn.button(f"Guardar trades .{ext} en out/", use_container_width=True):
+            try:
+                from backtesting.exportar import exportar
+                dest = exportar(cur["trades"], Path("out") / f"trades_{datetime.datetime.now():%Y%m%d_%H%M%S}.{ext}")
+                st.success(f"Trades guardados: {dest}")
+            except Exception as e:
+                st.warning(f"No se pudo exportar: {e}")
 else:
     st.info("Sin trades para mostrar.")
 
+# ==================== CORRIDAS GUARDADAS ====================
+st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+st.markdown("#### Corridas guardadas")
+try:
+    from backtesting.almacen import METRICAS as _METRICAS, por_defecto as _almacen
+    _pares = _almacen().pares()
+except Exception as e:
+    _pares = []
+    st.caption(f"Almacén no disponible: {e}")
+if _pares:
+    q1, q2, q3, q4 = st.columns([2, 1, 1, 1])
+    _par = q1.selectbox("Símbolo / TF", [None] + _pares,
+                        format_func=lambda p: "Todos" if p is None else f"{p[0]} {p[1]}")
+    _met = q2.selectbox("Ordenar por", list(_METRICAS[1:]), index=2)   # pf
+    _n_top = q3.number_input("Top", 5, 500, 20, step=5)
+    _min_tr = q4.number_input("Mín. trades", 0, 10_000, 0, step=10)
+    _top = _almacen().top(_met, int(_n_top), *(_par or (None, None)), trades_min=int(_min_tr))
+    _top_show = _top.assign(creado=pd.to_datetime(_top["creado"], unit="s"),
+                            desde=pd.to_datetime(_top["desde_ms"], unit="ms"),
+                            hasta=pd.to_datetime(_top["hasta_ms"], unit="ms")).drop(columns=["desde_ms", "hasta_ms"])
+    st.dataframe(_top_show.round(3), use_container_width=True, height=320)
+    _sup = st.multiselect("Superponer equity", _top["id"].tolist(), max_selections=8)
+    if _sup:
+        fig_s = go.Figure()
+        for cid, eq_s in _almacen().equities(_sup).items():
+            if eq_s.empty:
+                continue
+            eq_s = reducir(eq_s, "time", "equity")
+            fig_s.add_trace(traza(eq_s["time"], eq_s["equity"], cid))
+        fig_s.update_layout(height=380, margin=dict(l=10,r=10,t=10,b=10),
+                            paper_bgcolor="#12161C", plot_bgcolor="#12161C",
+                            xaxis=dict(gridcolor="#1E2329"), yaxis=dict(gridcolor="#1E2329"))
+        st.plotly_chart(fig_s, use_container_width=True)
+else:
+    st.info("Todavía no hay corridas guardadas.")
+
+# ==================== MONTE CARLO (robustez) ====================
+st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+st.markdown("#### Monte Carlo (robustez)")
+if cur and not cur["trades"].empty:
+    mc1, mc2, mc3, mc4 = st.columns(4)
+    mc_caminos = mc1.number_input("Caminos", 1000, 500_000, 100_000, step=10_000)
+    mc_slip = mc2.number_input("Slippage máx (bps/lado)", 0.0, 50.0, 2.0, step=0.5)
+    mc_jit = mc3.number_input("Variación fee (±%)", 0.0, 100.0, 25.0, step=5.0)
+    mc_nivel = mc4.selectbox("IC", [0.90, 0.95, 0.99], index=1)
+    if st.button("Correr Monte Carlo", use_container_width=True):
+        try:
+            from backtesting.montecarlo import analizar as mc_analizar
+            with st.spinner("Simulando…"):
+                mc = mc_analizar(cur["trades"], cfg2, caminos=int(mc_caminos), nivel=float(mc_nivel),
+                                 slippage_bps=float(mc_slip), fee_jitter=float(mc_jit) / 100.0)
+            st.caption(f"{int(mc_caminos):,} caminos por modo en {mc['tiempo_s']}s")
+            filas = []
+            for modo in ("bootstrap", "shuffle"):
+                for met, r in mc[modo]["resumen"].items():
+                    filas.append({"modo": modo, "métrica": met, "media": r["media"], "p5": r["p5"],
+                                  "p50": r["p50"], "p95": r["p95"],
+                                  f"IC{int(mc_nivel*100)} inf": r["ic_inf"], f"IC{int(mc_nivel*100)} sup": r["ic_sup"],
+                                  "P(pérdida) %": r.get("prob_perdida")})
+            st.dataframe(pd.DataFrame(filas).round(2), use_container_width=True)
+            h1, h2 = st.columns(2)
+            for col, met, titulo in ((h1, "pnl", "PnL final"), (h2, "max_dd", "Max drawdown")):
+                fig_mc = go.Figure()
+                for modo in ("bootstrap", "shuffle"):
+                    fig_mc.add_trace(go.Histogram(x=mc[modo]["sim"][met], name=modo, opacity=0.6, nbinsx=80))
+                r = mc["bootstrap"]["resumen"][met]
+                for x in (r["ic_inf"], r["ic_sup"]):
+                    fig_mc.add_vline(x=x, line_dash="dash", line_color="#F0B90B")
+                fig_mc.update_layout(title=titulo, barmode="overlay", height=320,
+                                     margin=dict(l=10,r=10,t=30,b=10),
+                                     paper_bgcolor="#12161C", plot_bgcolor="#12161C")
+                col.plotly_chart(fig_mc, use_container_width=True)
+        except Exception as e:
+            st.error(f"Monte Carlo falló: {e}")
+else:
+    st.info("Corré un backtest para analizar su robustez.")
+
 # ==================== APLICAR AL BOT + RUN CORE (CMD) ====================
 st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
 st.markdown("### 📤 Aplicar esta configuración al bot (core)")
@@ -1084,99 +1225,8 @@ def export_excel_completo(
     metrics_dict: dict | None = None,
     equity_prev_df: _pd.DataFrame | None = None,
 ) -> str:
-    path = _Path(path_xlsx)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    eq = equity_df.copy() if equity_df is not None else _pd.DataFrame(columns=["ts","equity"])
-    if "ts" in eq.columns:
-        eq["ts"] = _pd.to_datetime(eq["ts"])
-    eq_prev = None
-    if equity_prev_df is not None and not equity_prev_df.empty:
-        eq_prev = equity_prev_df.copy()
-        if "ts" in eq_prev.columns:
-            eq_prev["ts"] = _pd.to_datetime(eq_prev["ts"])
-    with _pd.ExcelWriter(path, engine="xlsxwriter", datetime_format="yyyy-mm-dd hh:mm") as writer:
-        # Trades (+ PnL+/PnL- and totals)
-        if df_trades is not None and not df_trades.empty:
-            df_t = df_trades.copy()
-            pnl_col = None
-            for c in df_t.columns:
-                if c.lower() in ("pnl", "pnl_usdt", "pnl_net", "pnl_neto", "pnl (usdt)"):
-                    pnl_col = c
-                    break
-            if pnl_col is None and len([c for c in df_t.columns if "pnl" in c.lower()])>0:
-                pnl_col = [c for c in df_t.columns if "pnl" in c.lower()][0]
-            if pnl_col:
-                df_t["PnL_pos"] = df_t[pnl_col].clip(lower=0)
-                df_t["PnL_neg"] = df_t[pnl_col].clip(upper=0)
-                total_row = {col: "" for col in df_t.columns}
-                total_row[pnl_col] = df_t[pnl_col].sum()
-                total_row["PnL_pos"] = df_t["PnL_pos"].sum()
-                total_row["PnL_neg"] = df_t["PnL_neg"].sum()
-                wins = (df_t[pnl_col] > 0).sum()
-                losses = (df_t[pnl_col] <= 0).sum()
-                total = len(df_t)
-                total_row["TOTAL"] = "resumen"
-                total_row["wins"] = wins
-                total_row["losses"] = losses
-                total_row["total_ops"] = total
-                total_row["win_rate"] = round(100.0 * wins / total, 2) if total else 0.0
-                total_row["loss_rate"] = round(100.0 * losses / total, 2) if total else 0.0
-                df_t = _pd.concat([df_t, _pd.DataFrame([total_row])], ignore_index=True)
-            df_t.to_excel(writer, sheet_name="Trades", index=False)
-        # Curva
-        if not eq.empty:
-            eq.sort_values("ts", inplace=True)
-            eq.to_excel(writer, sheet_name="Curva", index=False)
-            wb  = writer.book
-            ws  = writer.sheets["Curva"]
-            chart = wb.add_chart({"type": "line"})
-            last_row = len(eq) + 1
-            chart.add_series({
-                "name":       "Equity",
-                "categories": ["Curva", 1, 0, last_row-1, 0],
-                "values":     ["Curva", 1, 1, last_row-1, 1],
-            })
-            chart.set_title({"name": "Curva de equity"})
-            chart.set_x_axis({"name": "Fecha"})
-            chart.set_y_axis({"name": "Equity"})
-            ws.insert_chart("D2", chart, {"x_offset": 10, "y_offset": 10})
-        # Config usada
-        if settings_dict:
-            cfg_items = []
-            def _flat(prefix, obj):
-                if isinstance(obj, dict):
-                    for k,v in obj.items():
-                        _flat(f"{prefix}.{k}" if prefix else str(k), v)
-                else:
-                    cfg_items.append((prefix, _json.dumps(obj) if isinstance(obj, (list,dict)) else obj))
-            _flat("", settings_dict)
-            _pd.DataFrame(cfg_items, columns=["clave","valor"]).to_excel(writer, sheet_name="Config usada", index=False)
-        # Metrics
-        if metrics_dict:
-            _pd.DataFrame(list(metrics_dict.items()), columns=["metric","value"]).to_excel(writer, sheet_name="Métricas", index=False)
-        # Comparador
-        if eq_prev is not None and not eq_prev.empty and not eq.empty:
-            comp = eq_prev.merge(eq, on="ts", how="outer", suffixes=("_prev","_curr")).sort_values("ts")
-            comp.to_excel(writer, sheet_name="Comparador", index=False)
-            wb  = writer.book
-            ws  = writer.sheets["Comparador"]
-            chart2 = wb.add_chart({"type": "line"})
-            last_row = len(comp) + 1
-            chart2.add_series({
-                "name":       "Equity (Anterior)",
-                "categories": ["Comparador", 1, 0, last_row-1, 0],
-                "values":     ["Comparador", 1, 1, last_row-1, 1],
-            })
-            chart2.add_series({
-                "name":       "Equity (Actual)",
-                "categories": ["Comparador", 1, 0, last_row-1, 0],
-                "values":     ["Comparador", 1, 2, last_row-1, 2],
-            })
-            chart2.set_title({"name": "Comparador de curvas"})
-            chart2.set_x_axis({"name": "Fecha"})
-            chart2.set_y_axis({"name": "Equity"})
-            ws.insert_chart("E2", chart2, {"x_offset": 10, "y_offset": 10})
-    return str(path)
+    from backtesting.exportar import excel_completo
+    return excel_completo(path_xlsx, df_trades, equity_df, settings_dict, metrics_dict, equity_prev_df)
 
 
 
@@ -1235,3 +1285,8 @@ def _fab_auto_export_after_run():
         st.success(f"Excel auto-guardado: {out_path}")
     except Exception as _e_auto:
         st.warning(f"No se pudo auto-exportar Excel: {_e_auto}")
+
+# Con jobs en curso la página se refresca sola para mostrar el avance
+if st.session_state.get("bt_jobs"):
+    time.sleep(0.5)
+    st.rerun()
@@ -6,10 +6,8 @@ ROOT = Path(__file__).resolve().parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-# Reuso funciones del runner para ejecutar un escenario desde un archivo
-from tests.run_scenarios import load_core, run_scenario
-# Adaptador para tu settings real
-from tests.compat_cfg import load_settings, snapshot_for_runner
+# Motor de backtest sobre OHLCV (lo usa app/live_backtest_app.py)
+from backtesting.motor import normalize_cfg, run_symbol_on_df  # noqa: F401
 
 TMP_DIR = ROOT / "tests" / "scenarios_tmp"
 
@@ -50,6 +48,11 @@ def _prepare_for_runner(src_path: Path) -> Path:
     return out_path
 
 def main():
+    # Reuso funciones del runner para ejecutar un escenario desde un archivo
+    # (import diferido: importar backtest.py solo por el motor no depende de tests/)
+    from tests.run_scenarios import load_core, run_scenario
+    # Adaptador para tu settings real
+    from tests.compat_cfg import load_settings, snapshot_for_runner
     parser = argparse.ArgumentParser()
     parser.add_argument("--scenarios", default=str(ROOT / "tests" / "scenarios"),
                         help="Carpeta con escenarios .json")
@@ -0,0 +1 @@
+from backtesting.motor import normalize_cfg, run_symbol_on_df, resolver_salida  # noqa: F401
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Almacén persistente de corridas de backtest.
+
+- SQLite (cache/corridas/corridas.db): una fila por corrida con símbolo, tf,
+  rango de datos, hash de la config, la config completa (JSON) y las
+  métricas en columnas propias, con índices por (symbol, tf, fecha) y por
+  (symbol, tf, métrica) => "top 20 por PF en ETH 30m" es un index scan.
+- Blobs: trades y equity de cada corrida en Parquet (cae a pickle si no hay
+  pyarrow/fastparquet); la DB guarda solo la ruta. Superponer dos corridas
+  lee sus equity, sin recalcular nada.
+- `clave` (la del cache de resultados) es única: guardar dos veces la misma
+  corrida devuelve el id existente.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from backtesting.cache_resultados import canonico
+
+LOG = logging.getLogger("bibit")
+
+ROOT = Path(__file__).resolve().parents[1]
+ALMACEN_DIR = ROOT / "cache" / "corridas"
+METRICAS = ("trades", "pnl", "winrate", "pf", "max_dd", "pnl_dd")
+
+_ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS corridas (
+    id          TEXT PRIMARY KEY,
+    clave       TEXT UNIQUE,
+    creado      REAL NOT NULL,
+    symbol      TEXT NOT NULL,
+    tf          TEXT NOT NULL,
+    desde_ms    INTEGER,
+    hasta_ms    INTEGER,
+    n_days      INTEGER,
+    config_hash TEXT NOT NULL,
+    config      TEXT NOT NULL,
+    etiqueta    TEXT,
+    {", ".join(f"{m} REAL" for m in METRICAS)},
+    trades_path TEXT,
+    equity_path TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_corridas_fecha ON corridas(symbol, tf, creado);
+CREATE INDEX IF NOT EXISTS ix_corridas_config ON corridas(config_hash);
+{"".join(f"CREATE INDEX IF NOT EXISTS ix_corridas_{m} ON corridas(symbol, tf, {m});" for m in METRICAS)}
+"""
+
+
+def hash_config(cfg: Dict) -> str:
+    return hashlib.sha256(canonico(cfg).encode("utf-8")).hexdigest()[:16]
+
+
+def _rango_ms(equity: Optional[pd.DataFrame]):
+    if equity is None or equity.empty:
+        return None, None
+    col = "time" if "time" in equity.columns else equity.columns[0]
+    t = pd.to_datetime(equity[col], utc=True, errors="coerce").dropna()
+    if t.empty:
+        return None, None
+    return int(t.iloc[0].value // 1_000_000), int(t.iloc[-1].value // 1_000_000)
+
+
+class AlmacenCorridas:
+    def __init__(self, directorio: Optional[Path] = None):
+        self.dir = Path(directorio or ALMACEN_DIR)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.db = self.dir / "corridas.db"
+        with self._con() as con:
+            con.executescript(_ESQUEMA)
+
+    @contextmanager
+    def _con(self):
+        con = sqlite3.connect(self.db, timeout=10.0)
+        con.row_factory = sqlite3.Row
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # ---- blobs ----
+    def _escribir(self, df: Optional[pd.DataFrame], nombre: str) -> Optional[str]:
+        if df is None:
+            return None
+        p = self.dir / "blobs" / f"{nombre}.parquet"
+        p.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            df.to_parquet(p, index=False)
+        except ImportError:
+            p = p.with_suffix(".pkl")
+            df.to_pickle(p)
+        return str(p.relative_to(self.dir))
+
+    def _leer(self, rel: Optional[str]) -> pd.DataFrame:
+        if not rel:
+            return pd.DataFrame()
+        p = self.dir / rel
+        try:
+            return pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_pickle(p)
+        except Exception as e:
+            LOG.warning("ALMACEN blob ilegible %s: %s", rel, e)
+            return pd.DataFrame()
+
+    # ---- escritura ----
+    def guardar(self, symbol: str, tf: str, cfg: Dict, trades: pd.DataFrame, equity: Optional[pd.DataFrame],
+                metricas: Dict, clave: Optional[str] = None, n_days: Optional[int] = None,
+                etiqueta: str = "") -> str:
+        """Registra la corrida y devuelve su id (el existente si `clave` ya estaba)."""
+        if clave:
+            with self._con() as con:
+                fila = con.execute("SELECT id FROM corridas WHERE clave = ?", (clave,)).fetchone()
+            if fila:
+                return fila["id"]
+        cid = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        desde, hasta = _rango_ms(equity)
+        fila = {
+            "id": cid, "clave": clave, "creado": time.time(), "symbol": symbol, "tf": tf,
+            "desde_ms": desde, "hasta_ms": hasta, "n_days": n_days,
+            "config_hash": hash_config(cfg), "config": canonico(cfg), "etiqueta": etiqueta,
+            **{m: (float(metricas[m]) if metricas.get(m) is not None else None) for m in METRICAS},
+            "trades_path": self._escribir(trades, f"{cid}_trades"),
+            "equity_path": self._escribir(equity, f"{cid}_equity"),
+        }
+        with self._con() as con:
+            con.execute(f"INSERT INTO corridas ({', '.join(fila)}) VALUES ({', '.join('?' * len(fila))})",
+                        tuple(fila.values()))
+        return cid
+
+    def borrar(self, cid: str):
+        with self._con() as con:
+            fila = con.execute("SELECT trades_path, equity_path FROM corridas WHERE id = ?", (cid,)).fetchone()
+            con.execute("DELETE FROM corridas WHERE id = ?", (cid,))
+        for rel in (fila or ()):
+            if rel:
+                (self.dir / rel).unlink(missing_ok=True)
+
+    # ---- consultas ----
+    def buscar(self, symbol: Optional[str] = None, tf: Optional[str] = None, orden: str = "creado",
+               desc: bool = True, n: int = 50, desde: Optional[float] = None, hasta: Optional[float] = None,
+               config_hash: Optional[str] = None, **minimos) -> pd.DataFrame:
+        """
+        Corridas filtradas (sin blobs). `orden` es "creado" o una de METRICAS;
+        `desde`/`hasta` filtran por fecha de la corrida (epoch s) y los kwargs
+        `<metrica>_min` exigen un mínimo (p. ej. trades_min=30).
+        """
+        if orden not in ("creado",) + METRICAS:
+            raise ValueError(f"orden desconocido: {orden}")
+        where, args = [], []
+        for col, val in (("symbol", symbol), ("tf", tf), ("config_hash", config_hash)):
+            if val is not None:
+                where.append(f"{col} = ?")
+                args.append(val)
+        if desde is not None:
+            where.append("creado >= ?")
+            args.append(float(desde))
+        if hasta is not None:
+            where.append("creado <= ?")
+            args.append(float(hasta))
+        for k, v in minimos.items():
+            m = k[:-4] if k.endswith("_min") else None
+            if m not in METRICAS:
+                raise ValueError(f"filtro desconocido: {k}")
+            where.append(f"{m} >= ?")
+            args.append(float(v))
+        sql = (f"SELECT id, creado, symbol, tf, desde_ms, hasta_ms, n_days, config_hash, etiqueta, "
+               f"{', '.join(METRICAS)} FROM corridas"
+               + (f" WHERE {' AND '.join(where)}" if where else "")
+               + f" ORDER BY {orden} {'DESC' if desc else 'ASC'} LIMIT ?")
+        with self._con() as con:
+            filas = con.execute(sql, (*args, int(n))).fetchall()
+        return pd.DataFrame([dict(f) for f in filas],
+                            columns=["id", "creado", "symbol", "tf", "desde_ms", "hasta_ms", "n_days",
+                                     "config_hash", "etiqueta", *METRICAS])
+
+    def top(self, metrica: str = "pf", n: int = 20, symbol: Optional[str] = None, tf: Optional[str] = None,
+            **filtros) -> pd.DataFrame:
+        """Mejores corridas por `metrica` (max_dd: menor es mejor)."""
+        return self.buscar(symbol, tf, orden=metrica, desc=(metrica != "max_dd"), n=n, **filtros)
+
+    def cargar(self, cid: str) -> Optional[Dict]:
+        with self._con() as con:
+            fila = con.execute("SELECT * FROM corridas WHERE id = ?", (cid,)).fetchone()
+        if fila is None:
+            return None
+        d = dict(fila)
+        d["config"] = json.loads(d["config"])
+        d["metricas"] = {m: d.pop(m) for m in METRICAS}
+        d["trades"] = self._leer(d.pop("trades_path"))
+        d["equity"] = self._leer(d.pop("equity_path"))
+        return d
+
+    def equities(self, ids: Iterable[str]) -> Dict[str, pd.DataFrame]:
+        """Equity de cada corrida (para superponerlas); solo lee los blobs de equity."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        with self._con() as con:
+            filas = con.execute(f"SELECT id, equity_path FROM corridas WHERE id IN ({', '.join('?' * len(ids))})",
+                                ids).fetchall()
+        rutas = {f["id"]: f["equity_path"] for f in filas}
+        return {i: self._leer(rutas[i]) for i in ids if i in rutas}
+
+    def pares(self) -> List[tuple]:
+        """(symbol, tf) con corridas guardadas."""
+        with self._con() as con:
+            return [tuple(f) for f in con.execute("SELECT DISTINCT symbol, tf FROM corridas ORDER BY symbol, tf")]
+
+
+_por_defecto: Optional[AlmacenCorridas] = None
+
+
+def por_defecto() -> AlmacenCorridas:
+    global _por_defecto
+    if _por_defecto is None:
+        _por_defecto = AlmacenCorridas()
+    return _por_defecto
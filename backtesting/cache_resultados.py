@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Cache de resultados para la UI de backtest.
+
+Clave = sha256 del JSON canónico (llaves ordenadas) de:
+  - la config ya normalizada (normalize_cfg) y los parámetros de la corrida;
+  - la identidad de los datos: (archivo, mtime_ns, tamaño) de cada CSV usado;
+  - la versión del motor: hash del código de backtesting/, estrategia/,
+    gestion/ y datos/ más los módulos del repo que importan (core/partials.py)
+    (cambiar el motor invalida todo sin tocar nada a mano).
+
+Dos niveles: LRU en memoria (`max_memoria` entradas, vive mientras viva el
+proceso de Streamlit) y pickles en cache/.resultados/ con un índice JSON
+(metadatos de cada corrida para listarlas y compararlas). El disco se poda
+por tamaño (`max_disco_mb`), las más viejas primero.
+"""
+import ast
+import copy
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+LOG = logging.getLogger("bibit")
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / "cache" / ".resultados"
+INDICE = "indice.json"
+PAQUETES_MOTOR = ("backtesting", "estrategia", "gestion", "datos")
+
+
+def canonico(obj) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def firma_archivos(paths: Iterable) -> List[Tuple[str, int, int]]:
+    out = []
+    for p in paths:
+        p = Path(p)
+        try:
+            st = p.stat()
+            out.append((p.name, st.st_mtime_ns, st.st_size))
+        except OSError:
+            out.append((p.name, 0, 0))
+    return out
+
+
+def archivos_motor() -> List[Path]:
+    """Los .py de PAQUETES_MOTOR y, transitivamente, los del repo que importan."""
+    pendientes = [p for paquete in PAQUETES_MOTOR for p in (ROOT / paquete).glob("*.py")]
+    vistos = set()
+    while pendientes:
+        p = pendientes.pop()
+        if p in vistos:
+            continue
+        vistos.add(p)
+        try:
+            arbol = ast.parse(p.read_bytes(), filename=str(p))
+        except SyntaxError:
+            continue
+        for nodo in ast.walk(arbol):
+            if isinstance(nodo, ast.Import):
+                modulos = [a.name for a in nodo.names]
+            elif isinstance(nodo, ast.ImportFrom) and nodo.module and not nodo.level:
+                modulos = [nodo.module] + [f"{nodo.module}.{a.name}" for a in nodo.names]
+            else:
+                continue
+            for m in modulos:
+                f = ROOT.joinpath(*m.split(".")).with_suffix(".py")
+                if f.is_file():
+                    pendientes.append(f)
+    return sorted(vistos)
+
+
+@lru_cache(maxsize=1)
+def version_motor() -> str:
+    h = hashlib.sha256()
+    for p in archivos_motor():
+        if p.name == "cache_resultados.py":
+            continue
+        h.update(p.relative_to(ROOT).as_posix().encode())
+        h.update(p.read_bytes())
+    return h.hexdigest()[:16]
+
+
+def clave(*partes) -> str:
+    return hashlib.sha256(canonico([version_motor(), *partes]).encode("utf-8")).hexdigest()[:32]
+
+
+class CacheResultados:
+    def __init__(self, directorio: Optional[Path] = None, max_memoria: int = 32, max_disco_mb: float = 512.0):
+        self.dir = Path(directorio or CACHE_DIR)
+        self.max_memoria = int(max_memoria)
+        self.max_disco = int(float(max_disco_mb) * 1e6)
+        self._mem: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = self.misses = 0
+
+    # ---- índice ----
+    def _indice(self) -> Dict[str, Dict]:
+        try:
+            return json.loads((self.dir / INDICE).read_text(encoding="utf-8"))
+        except Exception:
+            return {}
+
+    def _guardar_indice(self, idx: Dict[str, Dict]):
+        tmp = self.dir / (INDICE + ".tmp")
+        tmp.write_text(json.dumps(idx, ensure_ascii=False, default=str), encoding="utf-8")
+        os.replace(tmp, self.dir / INDICE)
+
+    # ---- lectura / escritura ----
+    def _recordar(self, k: str, valor):
+        self._mem[k] = valor
+        self._mem.move_to_end(k)
+        while len(self._mem) > self.max_memoria:
+            self._mem.popitem(last=False)
+
+    def get(self, k: str):
+        if k in self._mem:
+            self._mem.move_to_end(k)
+            self.hits += 1
+            return self._mem[k]
+        p = self.dir / f"{k}.pkl"
+        if p.exists():
+            try:
+                with open(p, "rb") as f:
+                    valor = pickle.load(f)
+                self._recordar(k, valor)
+                self.hits += 1
+                return valor
+            except Exception as e:
+                LOG.warning("CACHE resultado %s ilegible: %s", k, e)
+        self.misses += 1
+        return None
+
+    def put(self, k: str, valor, meta: Optional[Dict] = None, disco: bool = True):
+        self._recordar(k, valor)
+        if not disco:
+            return
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.dir / f"{k}.pkl.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.dir / f"{k}.pkl")
+            idx = self._indice()
+            idx[k] = {**(meta or {}), "clave": k, "guardado": time.time()}
+            self._podar(idx)
+            self._guardar_indice(idx)
+        except Exception as e:
+            LOG.warning("CACHE no pude guardar %s: %s", k, e)
+
+    def memo(self, k: str, fn: Callable[[], Any], meta: Optional[Dict] = None, disco: bool = True):
+        """(valor, hit): devuelve el cacheado o calcula con `fn` y lo guarda."""
+        valor = self.get(k)
+        if valor is not None:
+            return valor, True
+        valor = fn()
+        if valor is not None:
+            self.put(k, valor, meta, disco)
+        return valor, False
+
+    def historial(self) -> List[Dict]:
+        """Metadatos de las corridas en disco, más nuevas primero."""
+        return sorted(self._indice().values(), key=lambda m: m.get("guardado", 0), reverse=True)
+
+    def _podar(self, idx: Dict[str, Dict]):
+        pkls = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.dir.glob("*.pkl")]
+        total = sum(s for _, s, _ in pkls)
+        for _, s, p in sorted(pkls):
+            if total <= self.max_disco:
+                break
+            p.unlink(missing_ok=True)
+            idx.pop(p.stem, None)
+            self._mem.pop(p.stem, None)
+            total -= s
+
+
+_por_defecto: Optional[CacheResultados] = None
+
+
+def por_defecto() -> CacheResultados:
+    """Instancia del proceso: sobrevive a los reruns de Streamlit (módulo importado una vez)."""
+    global _por_defecto
+    if _por_defecto is None:
+        _por_defecto = CacheResultados()
+    return _por_defecto
+
+
+_json_memo: Dict[str, Tuple[int, Any]] = {}
+
+
+def json_por_mtime(path) -> Any:
+    """json.load memoizado por mtime; devuelve una copia (los callers la mutan)."""
+    p = str(path)
+    m = os.stat(p).st_mtime_ns
+    previo = _json_memo.get(p)
+    if previo is None or previo[0] != m:
+        with open(p, "r", encoding="utf-8") as f:
+            previo = (m, json.load(f))
+        _json_memo[p] = previo
+    return copy.deepcopy(previo[1])
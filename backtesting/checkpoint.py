@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Backtest incremental: checkpoint al final de un run y reanudación cuando el
+cache de velas crece.
+
+- Al terminar, `run_incremental` guarda el estado del loop (motor.correr):
+  trades cerrados, PnL por vela, posición abierta (se deshace y se vuelve a
+  resolver), `libre`/cooldown, racha de SL y contadores diarios.
+- Un run posterior con la misma config (normalizada), símbolo, tf y versión
+  del motor reanuda si los datos EXTIENDEN a los del checkpoint: la huella
+  (sha256 de ts/OHLC) de las primeras `n` velas tiene que coincidir, y en
+  modo intrabar también la de las velas finas hasta el final de entonces.
+  Si no coincide (otro `since`, velas corregidas, ventana de n días) se corre
+  completo y se reemplaza el checkpoint.
+- Las señales se recalculan vectorizadas sobre todo el df: las EMAs son
+  recursivas y un recorte con warm-up daría valores distintos; es O(N) numpy.
+  Lo caro (resolver salidas trade por trade) solo corre sobre las velas nuevas.
+
+Un archivo por (símbolo, tf, config): cache/.checkpoints/<clave>.pkl.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtesting.cache_resultados import clave
+from backtesting.motor import correr, normalize_cfg, preparar
+
+LOG = logging.getLogger("bibit")
+
+ROOT = Path(__file__).resolve().parents[1]
+CHECKPOINT_DIR = ROOT / "cache" / ".checkpoints"
+
+
+def huella(X: Dict[str, np.ndarray], n: int) -> str:
+    """sha256 de ts/o/h/l/c de las primeras n velas."""
+    h = hashlib.sha256()
+    for k in ("ts", "o", "h", "l", "c"):
+        h.update(np.ascontiguousarray(X[k][:n]).tobytes())
+    return h.hexdigest()
+
+
+def _huella_fina(ctx: Dict, n: int) -> Optional[str]:
+    F = ctx["F"]
+    if F is None or n == 0:
+        return None
+    tope = int(ctx["A"]["ts"][n - 1] + ctx["tf_ms"])
+    return huella(F, int(np.searchsorted(F["ts"], tope)))
+
+
+def _ruta(directorio: Optional[Path], symbol: str, tf: str, cfg: Dict) -> Path:
+    return Path(directorio or CHECKPOINT_DIR) / f"{clave('checkpoint', symbol, tf, cfg)}.pkl"
+
+
+def cargar(ruta: Path) -> Optional[Dict]:
+    try:
+        with open(ruta, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        LOG.warning("CHECKPOINT ilegible %s: %s", ruta.name, e)
+        return None
+
+
+def guardar(ruta: Path, ckpt: Dict):
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        tmp = ruta.with_suffix(".pkl.tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(ckpt, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, ruta)
+    except Exception as e:
+        LOG.warning("CHECKPOINT no pude guardar %s: %s", ruta.name, e)
+
+
+def valido(ckpt: Optional[Dict], ctx: Dict) -> bool:
+    """El checkpoint sirve si los datos actuales extienden a los suyos."""
+    if not ckpt:
+        return False
+    n = int(ckpt["estado"]["n"])
+    if n == 0 or n > ctx["N"]:
+        return False
+    return ckpt["huella"] == huella(ctx["A"], n) and ckpt.get("huella_fina") == _huella_fina(ctx, n)
+
+
+def run_incremental(symbol: str, tf: str, df: pd.DataFrame, cfg: Dict,
+                    df_fino: Optional[pd.DataFrame] = None,
+                    progreso: Optional[Callable[[Dict], None]] = None,
+                    directorio: Optional[Path] = None) -> Tuple[List[Dict], Dict, List]:
+    """
+    Igual que motor.run_symbol_on_df, pero reanuda desde el checkpoint si lo
+    hay y deja uno nuevo. audit["reanudado"] = velas que venían del checkpoint
+    (0 si corrió completo).
+    """
+    t0 = time.time()
+    c = normalize_cfg(cfg)
+    ruta = _ruta(directorio, symbol, tf, c)
+    ctx = preparar(symbol, tf, df, c, df_fino)
+    ckpt = cargar(ruta)
+    estado = ckpt["estado"] if valido(ckpt, ctx) else None
+    trades, audit, eq, fin = correr(ctx, estado, progreso)
+    audit.update({"reanudado": int(estado["n"]) if estado else 0, "tiempo_s": round(time.time() - t0, 4)})
+    guardar(ruta, {"estado": fin, "huella": huella(ctx["A"], ctx["N"]),
+                   "huella_fina": _huella_fina(ctx, ctx["N"]), "guardado": time.time()})
+    return trades, audit, eq
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Cola de barridos distribuida sobre un directorio compartido (NFS/SMB/local),
+sin broker.
+
+Un barrido es un directorio bajo la raíz compartida:
+    <raiz>/<barrido>/barrido.json        símbolo, tf, config base (SECCIONES_MOTOR), since/n_days, lease_s
+    <raiz>/<barrido>/unidades/u0007.json lista de combinaciones (params) a evaluar
+    <raiz>/<barrido>/leases/u0007.lease  quién la tiene (creado con O_EXCL = reclamo atómico)
+    <raiz>/<barrido>/resultados/u0007.json métricas por combinación + huella de los datos
+    <raiz>/<barrido>/resultados.csv      merge final (coordinador)
+
+- `publicar` parte la grilla (o una muestra) en unidades de `por_unidad`
+  combinaciones, agrupadas por parámetros de estrategia para que cada unidad
+  calcule sus señales una vez.
+- `worker` (cualquier host / proceso) reclama unidades libres, las corre
+  contra SU copia local de cache/ y escribe el resultado (tmp + os.replace).
+  Mientras corre, un hilo renueva el lease (mtime) cada lease_s/4.
+- `coordinar` junta resultados y reemite las unidades cuyo lease no se
+  renovó en lease_s (worker caído): lo mide con su propio reloj sobre los
+  cambios de mtime, no compara relojes entre hosts. Una unidad reemitida
+  puede terminar dos veces: el resultado es determinista y el último gana.
+- Cada resultado lleva la huella (sha256 de ts/OHLC) de las velas del
+  worker; si los hosts tienen caches distintos el merge lo avisa.
+
+CLI:
+    python -m backtesting.cola_distribuida publicar --raiz /mnt/cola --symbol ETHUSDT --tf 15m
+    python -m backtesting.cola_distribuida worker --raiz /mnt/cola          (en cada host)
+    python -m backtesting.cola_distribuida coordinar --raiz /mnt/cola --barrido <id>
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from backtesting.walkforward import _clave_estrategia, _puntaje, aplicar, combinaciones
+
+LOG = logging.getLogger("bibit")
+
+LEASE_S = 120.0
+# solo lo que lee el motor: exchange/telegram (credenciales) no van al directorio compartido
+SECCIONES_MOTOR = ("estrategia", "riesgo", "partials", "trailing", "auto_trailing", "session_filter",
+                   "risk_controls", "capital", "fees", "backtest")
+
+
+def _escribir_json(ruta: Path, datos: Dict):
+    tmp = ruta.with_name(f".{ruta.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(datos, ensure_ascii=False, default=str), encoding="utf-8")
+    os.replace(tmp, ruta)
+
+
+def _leer_json(ruta: Path) -> Optional[Dict]:
+    try:
+        return json.loads(ruta.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        LOG.warning("COLA json ilegible %s: %s", ruta, e)
+        return None
+
+
+# ------------------ publicar ------------------
+def publicar(raiz, symbol: str, tf: str, cfg: Dict, grilla: Dict[str, list], por_unidad: int = 8,
+             muestras: int = 0, since=None, n_days: Optional[int] = None, objetivo: str = "pnl_dd",
+             min_trades: int = 10, lease_s: float = LEASE_S, semilla: int = 0) -> Path:
+    """Crea el barrido en `raiz` y devuelve su directorio."""
+    combos = combinaciones(grilla) or [{}]
+    if muestras and muestras < len(combos):
+        combos = random.Random(semilla).sample(combos, int(muestras))
+    combos.sort(key=lambda p: repr(_clave_estrategia(p)))      # misma estrategia => misma unidad
+    bid = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    d = Path(raiz) / bid
+    for sub in ("unidades", "leases", "resultados"):
+        (d / sub).mkdir(parents=True, exist_ok=True)
+    por_unidad = max(1, int(por_unidad))
+    n = 0
+    for n, i in enumerate(range(0, len(combos), por_unidad)):
+        _escribir_json(d / "unidades" / f"u{n:04d}.json", {"id": f"u{n:04d}", "params": combos[i:i + por_unidad]})
+    # barrido.json al final: los workers solo toman barridos completos
+    cfg = {k: v for k, v in cfg.items() if k in SECCIONES_MOTOR}
+    _escribir_json(d / "barrido.json", {"id": bid, "symbol": symbol, "tf": tf, "cfg": cfg, "since": since,
+                                        "n_days": n_days, "objetivo": objetivo, "min_trades": int(min_trades),
+                                        "lease_s": float(lease_s), "unidades": n + 1, "candidatos": len(combos),
+                                        "creado": time.time()})
+    LOG.info("COLA barrido %s: %d candidatos en %d unidades", bid, len(combos), n + 1)
+    return d
+
+
+# ------------------ worker ------------------
+class _Lease:
+    """
+    Reclamo de una unidad: archivo creado con O_EXCL y renovado (mtime) por un
+    hilo. Lleva un token por reclamo: si el coordinador lo reemitió y otro
+    worker lo tomó, este no lo renueva ni lo borra.
+    """
+
+    def __init__(self, ruta: Path, lease_s: float, dueno: str):
+        self.ruta, self.lease_s, self.dueno = ruta, float(lease_s), dueno
+        self.token = uuid.uuid4().hex
+        self._fin = threading.Event()
+        self.perdido = False
+
+    def tomar(self) -> bool:
+        try:
+            fd = os.open(self.ruta, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"worker": self.dueno, "token": self.token, "desde": time.time()}, f)
+        threading.Thread(target=self._latir, daemon=True).start()
+        return True
+
+    def _mio(self) -> bool:
+        if not self.perdido and (_leer_json(self.ruta) or {}).get("token") != self.token:
+            # el coordinador la dio por vencida y la reemitió (quizás ya es de otro worker)
+            self.perdido = True
+            LOG.warning("COLA lease perdido %s (%s)", self.ruta.name, self.dueno)
+        return not self.perdido
+
+    def _latir(self):
+        while not self._fin.wait(self.lease_s / 4):
+            if not self._mio():
+                return
+            try:
+                os.utime(self.ruta)
+            except FileNotFoundError:
+                self._mio()
+                return
+
+    def soltar(self):
+        self._fin.set()
+        if self._mio():
+            self.ruta.unlink(missing_ok=True)
+
+
+def _datos(b: Dict, cache_dir: Optional[Path]) -> pd.DataFrame:
+    from datos.resample import cargar_tf
+    df = cargar_tf(b["symbol"], b["tf"], since=b.get("since"), cache_dir=cache_dir)
+    if df is None or df.empty:
+        raise ValueError(f"No hay velas en cache para {b['symbol']} {b['tf']}")
+    if b.get("n_days"):
+        df = df[df["time"] >= df["time"].max() - pd.Timedelta(days=int(b["n_days"]))].reset_index(drop=True)
+    return df
+
+
+def evaluar_unidad(b: Dict, unidad: Dict, df: pd.DataFrame) -> Dict:
+    """Corre las combinaciones de la unidad sobre `df`; una fila de métricas por combinación."""
+    from backtesting.checkpoint import huella
+    from backtesting.metricas import metricas
+    from backtesting.motor import correr, normalize_cfg, preparar
+    from estrategia.bollinger_vol import senales_vectorizadas
+    from estrategia.cache_indicadores import desde_cfg
+
+    t0 = time.time()
+    senales, filas, firma = {}, [], None
+    for p in unidad["params"]:
+        c = normalize_cfg(aplicar(b["cfg"], p))
+        k = _clave_estrategia(p)
+        if k not in senales:
+            senales[k] = senales_vectorizadas(df, c["estrategia"], cache=desde_cfg(c))
+        ctx = preparar(b["symbol"], b["tf"], df, c, senales=senales[k])
+        firma = firma or huella(ctx["A"], ctx["N"])
+        trades, _, _, _ = correr(ctx)
+        m = metricas(trades, float(c["capital"].get("total_usdt", 1000.0)))
+        filas.append({"params": p, "metricas": m, "puntaje": _puntaje(m, b["objetivo"], b["min_trades"])})
+    return {"id": unidad["id"], "filas": filas, "huella": firma, "velas": len(df),
+            "worker": f"{socket.gethostname()}:{os.getpid()}", "tiempo_s": round(time.time() - t0, 3)}
+
+
+def _libres(d: Path) -> List[Path]:
+    hechas = {p.stem for p in (d / "resultados").glob("u*.json")}
+    tomadas = {p.stem for p in (d / "leases").glob("u*.lease")}
+    return [p for p in sorted((d / "unidades").glob("u*.json")) if p.stem not in hechas | tomadas]
+
+
+def worker(raiz, cache_dir: Optional[Path] = None, barrido: Optional[str] = None, esperar: bool = False,
+           intervalo: float = 5.0, max_unidades: Optional[int] = None) -> int:
+    """
+    Reclama y corre unidades de los barridos abiertos en `raiz` (o solo
+    `barrido`). Sin `esperar` termina cuando no queda nada libre; con
+    `esperar` sigue sondeando cada `intervalo` s. Una unidad que falló no se
+    vuelve a tomar en este worker. Devuelve unidades hechas.
+    """
+    raiz = Path(raiz)
+    dueno = f"{socket.gethostname()}:{os.getpid()}"
+    datos: Dict[tuple, pd.DataFrame] = {}
+    fallidas = set()
+    hechas = 0
+    while max_unidades is None or hechas < max_unidades:
+        dirs = [raiz / barrido] if barrido else sorted(p for p in raiz.iterdir() if p.is_dir())
+        tomada = False
+        for d in dirs:
+            b = _leer_json(d / "barrido.json")
+            if b is None or (d / "resultados.csv").exists():
+                continue
+            libres = _libres(d)
+            random.shuffle(libres)                       # menos choques entre workers que arrancan juntos
+            for u in libres:
+                if (d.name, u.stem) in fallidas:
+                    continue
+                lease = _Lease(d / "leases" / f"{u.stem}.lease", b.get("lease_s", LEASE_S), dueno)
+                if not lease.tomar():
+                    continue
+                try:
+                    clave_df = (b["symbol"], b["tf"], b.get("since"), b.get("n_days"))
+                    if clave_df not in datos:
+                        datos[clave_df] = _datos(b, cache_dir)
+                    res = evaluar_unidad(b, _leer_json(u), datos[clave_df])
+                    _escribir_json(d / "resultados" / f"{u.stem}.json", res)
+                    hechas += 1
+                    tomada = True
+                    LOG.info("COLA %s %s: %d combinaciones en %.1fs", d.name, u.stem, len(res["filas"]),
+                             res["tiempo_s"])
+                except Exception as e:
+                    # fallaría igual en la próxima vuelta: queda libre para otro worker, no para este
+                    fallidas.add((d.name, u.stem))
+                    LOG.exception("COLA falló %s %s (no la reintento): %s", d.name, u.stem, e)
+                finally:
+                    lease.soltar()
+                if tomada:
+                    break
+            if tomada:
+                break
+        if not tomada:
+            if not esperar:
+                break
+            time.sleep(intervalo)
+    return hechas
+
+
+# ------------------ coordinador ------------------
+def estado(d) -> Dict:
+    d = Path(d)
+    b = _leer_json(d / "barrido.json") or {}
+    return {"unidades": int(b.get("unidades", 0)),
+            "hechas": len(list((d / "resultados").glob("u*.json"))),
+            "en_curso": len(list((d / "leases").glob("u*.lease")))}
+
+
+def reemitir_vencidos(d, vistos: Dict[str, tuple], lease_s: float) -> List[str]:
+    """
+    Borra los leases sin renovar hace más de `lease_s` (reloj local). `vistos`
+    guarda (mtime, visto_en) por lease entre llamadas.
+    """
+    d, ahora, vencidos = Path(d), time.time(), []
+    for p in (d / "leases").glob("u*.lease"):
+        try:
+            mtime = p.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        previo = vistos.get(p.stem)
+        if previo is None or previo[0] != mtime:
+            vistos[p.stem] = (mtime, ahora)
+        elif ahora - previo[1] > lease_s and not (d / "resultados" / f"{p.stem}.json").exists():
+            info = _leer_json(p) or {}
+            p.unlink(missing_ok=True)
+            vistos.pop(p.stem, None)
+            vencidos.append(p.stem)
+            LOG.warning("COLA lease vencido %s/%s (%s): reemitida", d.name, p.stem, info.get("worker", "?"))
+    return vencidos
+
+
+def merge(d) -> pd.DataFrame:
+    """Junta los resultados: una fila por combinación (params + métricas + puntaje), de mejor a peor."""
+    d = Path(d)
+    filas, huellas = [], {}
+    for p in sorted((d / "resultados").glob("u*.json")):
+        r = _leer_json(p)
+        if r is None:
+            continue
+        huellas.setdefault(r.get("huella"), []).append(r.get("worker"))
+        for f in r["filas"]:
+            filas.append({**f["params"], **f["metricas"], "puntaje": f["puntaje"],
+                          "unidad": r["id"], "worker": r.get("worker")})
+    if len(huellas) > 1:
+        LOG.warning("COLA %s: los workers usaron datos distintos (%d huellas): %s", d.name, len(huellas),
+                    {h[:12] if h else None: sorted(set(w)) for h, w in huellas.items()})
+    df = pd.DataFrame(filas)
+    return df.sort_values("puntaje", ascending=False, kind="stable").reset_index(drop=True) if not df.empty else df
+
+
+def coordinar(d, intervalo: float = 5.0, timeout: Optional[float] = None) -> pd.DataFrame:
+    """
+    Espera a que estén todas las unidades, reemitiendo leases vencidos, y
+    deja resultados.csv. Con `timeout` (s) devuelve el merge parcial.
+    """
+    d = Path(d)
+    b = _leer_json(d / "barrido.json")
+    if b is None:
+        raise FileNotFoundError(f"barrido sin barrido.json: {d}")
+    t0, vistos = time.time(), {}
+    while True:
+        reemitir_vencidos(d, vistos, float(b.get("lease_s", LEASE_S)))
+        est = estado(d)
+        if est["hechas"] >= est["unidades"]:
+            break
+        if timeout is not None and time.time() - t0 > timeout:
+            LOG.warning("COLA %s: timeout con %d/%d unidades", d.name, est["hechas"], est["unidades"])
+            return merge(d)
+        time.sleep(intervalo)
+    df = merge(d)
+    df.to_csv(d / "resultados.csv", index=False)
+    LOG.info("COLA %s completo: %d combinaciones en %.1fs", d.name, len(df), time.time() - b["creado"])
+    return df
+
+
+def main():
+    import argparse
+    from utils.settings import load_settings
+
+    ap = argparse.ArgumentParser(description="Barridos distribuidos sobre un directorio compartido")
+    ap.add_argument("accion", choices=["publicar", "worker", "coordinar"])
+    ap.add_argument("--raiz", required=True, help="directorio compartido de la cola")
+    ap.add_argument("--barrido", default=None)
+    ap.add_argument("--symbol", default="ETHUSDT")
+    ap.add_argument("--tf", default=None)
+    ap.add_argument("--settings", default="config/settings.json")
+    ap.add_argument("--por-unidad", type=int, default=8)
+    ap.add_argument("--lease", type=float, default=LEASE_S)
+    ap.add_argument("--esperar", action="store_true", help="worker: seguir sondeando la cola")
+    args = ap.parse_args()
+
+    if args.accion == "worker":
+        print(f"{worker(args.raiz, barrido=args.barrido, esperar=args.esperar)} unidades")
+        return
+    if args.accion == "coordinar":
+        if not args.barrido:
+            ap.error("coordinar requiere --barrido")
+        df = coordinar(Path(args.raiz) / args.barrido)
+        print(df.head(20).to_string())
+        return
+    cfg, _ = load_settings(args.settings)
+    bt = cfg.get("backtest", {}) or {}
+    op = bt.get("optimizador", {}) or {}
+    tf = args.tf or cfg.get("estrategia", {}).get("tf", "15m")
+    cfg.setdefault("estrategia", {})["tf"] = tf
+    d = publicar(args.raiz, args.symbol, tf, cfg,
+                 op.get("grilla") or (bt.get("walkforward", {}) or {}).get("grilla", {}),
+                 por_unidad=args.por_unidad, muestras=op.get("muestras", 0), since=cfg.get("since"),
+                 objetivo=op.get("objetivo", "pnl_dd"), min_trades=op.get("min_trades", 10), lease_s=args.lease)
+    print(d.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Exportación de resultados (trades, curva, config, métricas).
+
+XLSX con xlsxwriter en modo `constant_memory`: las filas se escriben en
+orden con `write_row` por bloques de `BLOQUE` filas (memoria acotada: solo
+un bloque convertido a objetos Python a la vez), los formatos van por
+columna (`set_column`) y no por celda, y el ancho se estima con una muestra
+de filas en lugar de convertir columnas enteras a texto. Las fechas se
+escriben como número serial de Excel con formato de fecha de la columna.
+
+Para sets grandes `exportar` también escribe CSV (por bloques) y Parquet;
+si no hay motor de Parquet (pyarrow/fastparquet) cae a .csv.gz y lo avisa.
+"""
+import json
+import logging
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+LOG = logging.getLogger("bibit")
+
+BLOQUE = 20_000
+MUESTRA = 1_000
+ANCHO_MAX = 28
+EXCEL_EPOCH_DIAS = 25_569.0          # 1970-01-01 en días seriales de Excel
+MS_DIA = 86_400_000
+
+RENOMBRE_ES = {
+    "symbol": "Símbolo", "side": "Dirección", "qty": "Cantidad",
+    "price_entry": "Entrada", "price_exit": "Salida", "pnl": "PnL (USDT)",
+    "pnl_pct": "PnL (%)", "ts_entry": "Fecha Entrada", "ts_exit": "Fecha Salida",
+    "exit_reason": "Motivo",
+}
+DECIMALES_4 = ("Cantidad", "qty")
+
+
+# ------------------ columnas ------------------
+def _tipo(s: pd.Series) -> str:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return "fecha"
+    if pd.api.types.is_bool_dtype(s):
+        return "texto"
+    if pd.api.types.is_numeric_dtype(s):
+        return "numero"
+    return "texto"
+
+
+def _valores(s: pd.Series, tipo: str) -> list:
+    """Serie -> lista lista para write_row (NaN/NaT -> celda vacía)."""
+    if tipo == "fecha":
+        if getattr(s.dt, "tz", None) is not None:
+            s = s.dt.tz_convert(None)
+        ms = s.to_numpy("datetime64[ms]").astype("int64")
+        out = ms / MS_DIA + EXCEL_EPOCH_DIAS
+        return [None if m else v for v, m in zip(out.tolist(), s.isna().to_numpy())]
+    if tipo == "numero":
+        arr = s.to_numpy(dtype=float, na_value=np.nan)
+        if not np.isnan(arr).any() and not np.isinf(arr).any():
+            return arr.tolist()
+        return [None if not np.isfinite(v) else v for v in arr.tolist()]
+    return ["" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v) for v in s.tolist()]
+
+
+def anchos(df: pd.DataFrame, muestra: int = MUESTRA, ancho_max: int = ANCHO_MAX) -> List[int]:
+    """Ancho por columna a partir del encabezado y una muestra de filas (extremos + equiespaciadas)."""
+    n = len(df)
+    if n > muestra:
+        idx = np.unique(np.concatenate([np.arange(muestra // 4), np.arange(n - muestra // 4, n),
+                                        np.linspace(0, n - 1, muestra // 2).astype(int)]))
+        m = df.iloc[idx]
+    else:
+        m = df
+    out = []
+    for c in df.columns:
+        s = m[c]
+        tipo = _tipo(s)
+        if tipo == "fecha":
+            largo = 16
+        elif tipo == "numero" and len(s):
+            largo = max(len(f"{v:,.4f}") for v in s.dropna().tolist()[:muestra]) if s.notna().any() else 4
+        else:
+            largo = int(s.astype(str).str.len().max()) if len(s) else 0
+        out.append(min(max(len(str(c)), largo) + 2, ancho_max))
+    return out
+
+
+# ------------------ xlsx ------------------
+def libro(destino):
+    """Workbook xlsxwriter en modo streaming (`destino`: ruta o BytesIO)."""
+    import xlsxwriter
+    return xlsxwriter.Workbook(destino, {"constant_memory": True, "strings_to_numbers": False,
+                                         "strings_to_formulas": False, "strings_to_urls": False})
+
+
+def _formatos(wb) -> Dict:
+    f = getattr(wb, "_bibit_formatos", None)
+    if f is None:
+        base = {"align": "center", "valign": "vcenter"}
+        f = {"hdr": wb.add_format({**base, "bold": True, "border": 1, "bg_color": "#eaeaea"}),
+             "texto": wb.add_format(base),
+             "numero": wb.add_format({**base, "num_format": "0.00"}),
+             "numero4": wb.add_format({**base, "num_format": "0.0000"}),
+             "fecha": wb.add_format({**base, "num_format": "yyyy-mm-dd hh:mm"}),
+             "titulo": wb.add_format({"bold": True, "font_size": 18}),
+             "lbl": wb.add_format({"bold": True}),
+             "val": wb.add_format({"bold": True, "font_color": "#0a8754"})}
+        wb._bibit_formatos = f
+    return f
+
+
+def hoja_df(wb, nombre: str, df: pd.DataFrame, congelar: bool = True,
+            extra: Optional[Sequence[Sequence]] = None, encabezado_extra: Sequence[str] = ()):
+    """
+    Escribe `df` en una hoja nueva: encabezado en la fila 0, datos por bloques
+    con formato de columna. `extra`: filas adicionales al final (p. ej. totales),
+    que pueden usar las columnas `encabezado_extra` a la derecha de `df`.
+    Devuelve (worksheet, filas de datos escritas).
+    """
+    ws = wb.add_worksheet(nombre)
+    fm = _formatos(wb)
+    tipos = [_tipo(df[c]) for c in df.columns]
+    for i, (c, w) in enumerate(zip(df.columns, anchos(df))):
+        clave = "numero4" if tipos[i] == "numero" and str(c) in DECIMALES_4 else tipos[i]
+        ws.set_column(i, i, w, fm[clave])
+    ws.write_row(0, 0, [str(c) for c in df.columns] + list(encabezado_extra), fm["hdr"])
+    fila = 1
+    for a in range(0, len(df), BLOQUE):
+        trozo = df.iloc[a:a + BLOQUE]
+        cols = [_valores(trozo.iloc[:, j], t) for j, t in enumerate(tipos)]
+        for valores in zip(*cols):
+            ws.write_row(fila, 0, valores)
+            fila += 1
+    for valores in (extra or []):
+        ws.write_row(fila, 0, [None if (isinstance(v, float) and not np.isfinite(v)) else v for v in valores])
+        fila += 1
+    if congelar:
+        ws.freeze_panes(1, 0)
+    return ws, len(df)
+
+
+def hoja_kv(wb, nombre: str, pares: Sequence[Tuple], titulo: Optional[str] = None, ancho: int = 22):
+    ws = wb.add_worksheet(nombre)
+    fm = _formatos(wb)
+    fila = 0
+    if titulo:
+        ws.write(0, 0, titulo, fm["titulo"])
+        fila = 2
+    ws.set_column(0, 1, ancho)
+    for k, v in pares:
+        ws.write(fila, 0, k, fm["lbl"])
+        if isinstance(v, (dict, list)):
+            v = json.dumps(v)
+        ws.write(fila, 1, v, fm["val"] if titulo else None)
+        fila += 1
+    return ws
+
+
+def grafico_lineas(wb, ws, hoja: str, n: int, series: Sequence[Tuple[str, int]], celda: str, titulo: str):
+    """Línea sobre la columna 0 (fecha) de `hoja`; series = [(nombre, columna)]."""
+    ch = wb.add_chart({"type": "line"})
+    for nombre, col in series:
+        ch.add_series({"name": nombre, "categories": [hoja, 1, 0, n, 0], "values": [hoja, 1, col, n, col]})
+    ch.set_title({"name": titulo})
+    ch.set_x_axis({"name": "Fecha"})
+    ch.set_y_axis({"name": "Equity"})
+    ws.insert_chart(celda, ch, {"x_offset": 10, "y_offset": 10})
+
+
+def trades_xlsx(df: pd.DataFrame, resumen: Dict) -> bytes:
+    """Hoja Trades (encabezados en español) + hoja Resumen, como bytes."""
+    df_es = df.rename(columns={k: v for k, v in RENOMBRE_ES.items() if k in df.columns})
+    out = BytesIO()
+    wb = libro(out)
+    hoja_df(wb, "Trades", df_es)
+    hoja_kv(wb, "Resumen", [("PnL total (USDT):", resumen.get("pnl_total", 0.0)),
+                            ("Winrate (%):", resumen.get("winrate", 0.0)),
+                            ("Profit Factor:", resumen.get("pf", "NA"))], titulo="Resumen de Resultados")
+    wb.close()
+    return out.getvalue()
+
+
+def _aplanar(obj, prefijo: str = "", out: Optional[List] = None) -> List[Tuple[str, object]]:
+    out = [] if out is None else out
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            _aplanar(v, f"{prefijo}.{k}" if prefijo else str(k), out)
+    else:
+        out.append((prefijo, json.dumps(obj) if isinstance(obj, list) else obj))
+    return out
+
+
+def _col_pnl(df: pd.DataFrame) -> Optional[str]:
+    for c in df.columns:
+        if str(c).lower() in ("pnl", "pnl_usdt", "pnl_net", "pnl_neto", "pnl (usdt)"):
+            return c
+    cands = [c for c in df.columns if "pnl" in str(c).lower()]
+    return cands[0] if cands else None
+
+
+def excel_completo(path_xlsx, df_trades: Optional[pd.DataFrame], equity_df: Optional[pd.DataFrame],
+                   settings_dict: Optional[Dict], metrics_dict: Optional[Dict] = None,
+                   equity_prev_df: Optional[pd.DataFrame] = None) -> str:
+    """Trades (+PnL+/PnL- y fila de totales), Curva, Config usada, Métricas y Comparador."""
+    path = Path(path_xlsx)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    eq = _equity(equity_df)
+    eq_prev = _equity(equity_prev_df)
+    wb = libro(str(path))
+    try:
+        if df_trades is not None and not df_trades.empty:
+            df_t = df_trades
+            extra = None
+            pnl_col = _col_pnl(df_t)
+            if pnl_col:
+                pnl = pd.to_numeric(df_t[pnl_col], errors="coerce").fillna(0.0)
+                df_t = df_t.assign(PnL_pos=pnl.clip(lower=0), PnL_neg=pnl.clip(upper=0))
+                total, wins = len(df_t), int((pnl > 0).sum())
+                resumen = {pnl_col: float(pnl.sum()), "PnL_pos": float(df_t["PnL_pos"].sum()),
+                           "PnL_neg": float(df_t["PnL_neg"].sum())}
+                cols = list(df_t.columns) + ["TOTAL", "wins", "losses", "total_ops", "win_rate", "loss_rate"]
+                resumen.update({"TOTAL": "resumen", "wins": wins, "losses": total - wins, "total_ops": total,
+                                "win_rate": round(100.0 * wins / total, 2) if total else 0.0,
+                                "loss_rate": round(100.0 * (total - wins) / total, 2) if total else 0.0})
+                extra = [[resumen.get(c, None) for c in cols]]
+            hoja_df(wb, "Trades", df_t, extra=extra,
+                    encabezado_extra=cols[len(df_t.columns):] if extra else ())
+        if not eq.empty:
+            ws, n = hoja_df(wb, "Curva", eq)
+            grafico_lineas(wb, ws, "Curva", n, [("Equity", 1)], "D2", "Curva de equity")
+        if settings_dict:
+            hoja_df(wb, "Config usada", pd.DataFrame(_aplanar(settings_dict), columns=["clave", "valor"]),
+                    congelar=False)
+        if metrics_dict:
+            hoja_kv(wb, "Métricas", list(metrics_dict.items()))
+        if not eq_prev.empty and not eq.empty:
+            comp = eq_prev.merge(eq, on="ts", how="outer", suffixes=("_prev", "_curr")).sort_values("ts")
+            ws, n = hoja_df(wb, "Comparador", comp)
+            grafico_lineas(wb, ws, "Comparador", n, [("Equity (Anterior)", 1), ("Equity (Actual)", 2)],
+                           "E2", "Comparador de curvas")
+    finally:
+        wb.close()
+    return str(path)
+
+
+def _equity(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    if df is None or df.empty:
+        return pd.DataFrame(columns=["ts", "equity"])
+    eq = df.copy()
+    if "ts" in eq.columns:
+        eq["ts"] = pd.to_datetime(eq["ts"])
+        eq = eq.sort_values("ts")
+    return eq.reset_index(drop=True)
+
+
+# ------------------ CSV / Parquet ------------------
+def exportar(df: pd.DataFrame, destino, resumen: Optional[Dict] = None) -> Path:
+    """
+    Escribe `df` según la extensión de `destino` (.xlsx, .csv, .csv.gz, .parquet).
+    Devuelve la ruta realmente escrita (Parquet sin motor -> .csv.gz).
+    """
+    p = Path(destino)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    nombre = p.name.lower()
+    if nombre.endswith(".xlsx"):
+        p.write_bytes(trades_xlsx(df, resumen or {}))
+    elif nombre.endswith(".parquet"):
+        try:
+            df.to_parquet(p, index=False)
+        except ImportError as e:
+            alt = p.with_name(p.name[: -len(".parquet")] + ".csv.gz")
+            LOG.warning("EXPORT sin motor Parquet (%s); escribo %s", e, alt.name)
+            return exportar(df, alt)
+    else:
+        df.to_csv(p, index=False, chunksize=BLOQUE,
+                  compression="gzip" if nombre.endswith(".gz") else None)
+    return p
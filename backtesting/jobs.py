@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Jobs de backtest en segundo plano para la UI.
+
+- `GestorJobs.enviar(tipo, **params)` manda el job a un pool de procesos
+  (por defecto un worker por núcleo) y devuelve un id; el script de
+  Streamlit queda libre y consulta `estado(id)` en cada rerun.
+- El worker reporta el avance del motor (`progreso` de run_symbol_on_df /
+  run_portfolio) en un dict compartido (Manager): velas procesadas, trades,
+  PnL y la equity parcial (submuestreada a MAX_PUNTOS).
+- `cancelar(id)`: si el job no arrancó se saca de la cola; si está corriendo
+  el worker ve la marca en el siguiente reporte y corta con `Cancelado`.
+
+Tipos:
+    "simbolo"     symbol, tf, cfg, since=None, n_days=None, df=None
+    "portafolio"  simbolos, tf, cfg, since=None, n_days=None, dfs=None
+    "barrido"     symbol, tf, cfgs (lista), since=None, n_days=None, df=None
+                  -> una fila de métricas por config
+Sin `df`/`dfs` el worker lee el cache (menos datos por el pipe); un
+"simbolo" así (sin n_days) reanuda desde su checkpoint (backtesting.checkpoint).
+"""
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+LOG = logging.getLogger("bibit")
+
+MAX_PUNTOS = 500
+FINALES = ("listo", "error", "cancelado")
+
+
+class Cancelado(Exception):
+    pass
+
+
+# ------------------ worker ------------------
+def _datos(symbol, tf, since, n_days, df=None):
+    if df is None:
+        from datos.resample import cargar_tf
+        df = cargar_tf(symbol, tf, since=since)
+    if df is None or df.empty:
+        raise ValueError(f"No hay velas en cache para {symbol} {tf}")
+    if n_days:
+        df = df[df["time"] >= df["time"].max() - pd.Timedelta(days=int(n_days))].reset_index(drop=True)
+    return df
+
+
+def _salida(trades, audit, eq) -> Dict:
+    df_eq = pd.DataFrame(eq, columns=["time", "equity"])
+    if not df_eq.empty:
+        df_eq["time"] = pd.to_datetime(df_eq["time"], utc=True).dt.tz_convert(None)
+    return {"trades": pd.DataFrame(trades), "equity": df_eq, "audit": audit, "used_path": None}
+
+
+class _Reporte:
+    """Callback de avance: acumula la equity parcial y publica en el dict compartido."""
+
+    def __init__(self, job_id, estado, cancelar, base: Optional[Dict] = None):
+        self.id, self.estado, self.cancelar = job_id, estado, cancelar
+        self.base = dict(base or {})
+        self.puntos: List = []
+
+    def __call__(self, av: Dict):
+        if self.cancelar.get(self.id):
+            raise Cancelado(self.id)
+        self.puntos.extend(av.get("nuevos", ()))
+        if len(self.puntos) > 2 * MAX_PUNTOS:
+            self.puntos = self.puntos[::2]
+        previo = self.estado.get(self.id, {})
+        self.estado[self.id] = {**previo, **self.base, "estado": "corriendo",
+                                "progreso": {k: v for k, v in av.items() if k != "nuevos"},
+                                "equity": list(self.puntos)}
+
+
+def _correr(job_id: str, tipo: str, params: Dict, estado, cancelar):
+    if cancelar.get(job_id):
+        raise Cancelado(job_id)
+    estado[job_id] = {**estado.get(job_id, {}), "estado": "corriendo", "inicio": time.time()}
+    from backtesting.motor import normalize_cfg, run_symbol_on_df
+    tf, since, n_days = params["tf"], params.get("since"), params.get("n_days")
+    if tipo == "simbolo":
+        df = _datos(params["symbol"], tf, since, n_days, params.get("df"))
+        rep = _Reporte(job_id, estado, cancelar)
+        if params.get("df") is None and not n_days:
+            # datos del cache desde `since`: reanuda del checkpoint si el cache solo creció
+            from backtesting.checkpoint import run_incremental
+            return _salida(*run_incremental(params["symbol"], tf, df, params["cfg"], progreso=rep))
+        return _salida(*run_symbol_on_df(params["symbol"], tf, df, normalize_cfg(params["cfg"]), progreso=rep))
+    if tipo == "portafolio":
+        from backtesting.portafolio import run_portfolio
+        dfs = params.get("dfs") or {s: _datos(s, tf, since, n_days) for s in params["simbolos"]}
+        rep = _Reporte(job_id, estado, cancelar)
+        return _salida(*run_portfolio(dfs, tf, normalize_cfg(params["cfg"]), progreso=rep))
+    if tipo == "barrido":
+        from backtesting.metricas import metricas
+        df = _datos(params["symbol"], tf, since, n_days, params.get("df"))
+        cfgs = params["cfgs"]
+        filas = []
+        for n, cfg in enumerate(cfgs):
+            rep = _Reporte(job_id, estado, cancelar, base={"config": n, "configs": len(cfgs)})
+            c = normalize_cfg(cfg)
+            trades, _, _ = run_symbol_on_df(params["symbol"], tf, df, c, progreso=rep)
+            filas.append({"config": n, **metricas(trades, float(c["capital"].get("total_usdt", 1000.0)))})
+        return pd.DataFrame(filas)
+    raise ValueError(f"tipo de job desconocido: {tipo}")
+
+
+# ------------------ gestor ------------------
+class GestorJobs:
+    def __init__(self, max_workers: Optional[int] = None, contexto: str = "spawn"):
+        self._ctx = mp.get_context(contexto)
+        self._mgr = self._ctx.Manager()
+        self._estado = self._mgr.dict()
+        self._cancelar = self._mgr.dict()
+        self.max_workers = int(max_workers or os.cpu_count() or 1)
+        self._pool = ProcessPoolExecutor(self.max_workers, mp_context=self._ctx)
+        self._futuros: Dict = {}
+        self._seq = itertools.count(1)
+
+    def enviar(self, tipo: str, etiqueta: str = "", **params) -> str:
+        job_id = f"{int(time.time())}-{next(self._seq)}"
+        self._estado[job_id] = {"estado": "en_cola", "tipo": tipo, "etiqueta": etiqueta,
+                                "enviado": time.time(), "progreso": {}, "equity": []}
+        self._futuros[job_id] = self._pool.submit(_correr, job_id, tipo, params, self._estado, self._cancelar)
+        return job_id
+
+    def estado(self, job_id: str) -> Dict:
+        """Copia del estado; los jobs terminados pasan a listo / error / cancelado."""
+        est = dict(self._estado.get(job_id, {"estado": "desconocido"}))
+        fut = self._futuros.get(job_id)
+        if fut is not None and fut.done() and est.get("estado") not in FINALES:
+            try:
+                fut.result()
+                est["estado"] = "listo"
+            except (Cancelado, CancelledError):
+                est["estado"] = "cancelado"
+            except Exception as e:
+                est.update({"estado": "error", "error": f"{type(e).__name__}: {e}"})
+            est["fin"] = time.time()
+            self._estado[job_id] = est
+        return est
+
+    def resultado(self, job_id: str, timeout: Optional[float] = None):
+        return self._futuros[job_id].result(timeout=timeout)
+
+    def cancelar(self, job_id: str) -> bool:
+        self._cancelar[job_id] = True
+        fut = self._futuros.get(job_id)
+        return bool(fut is not None and (fut.cancel() or not fut.done()))
+
+    def activos(self) -> List[str]:
+        return [j for j in self._futuros if self.estado(j)["estado"] not in FINALES]
+
+    def olvidar(self, job_id: str):
+        self._futuros.pop(job_id, None)
+        self._estado.pop(job_id, None)
+        self._cancelar.pop(job_id, None)
+
+    def cerrar(self):
+        for j in list(self._futuros):
+            self._cancelar[j] = True
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._mgr.shutdown()
+
+
+_por_defecto: Optional[GestorJobs] = None
+
+
+def por_defecto() -> GestorJobs:
+    """Gestor del proceso de Streamlit (el módulo sobrevive a los reruns)."""
+    global _por_defecto
+    if _por_defecto is None:
+        _por_defecto = GestorJobs()
+    return _por_defecto
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Métricas de un run (lista de trades del motor + capital inicial)."""
+from typing import Dict, List
+
+import numpy as np
+
+
+def metricas(trades: List[Dict], capital: float = 1000.0) -> Dict[str, float]:
+    pnl = np.array([float(t["pnl"]) for t in trades], dtype=float)
+    if pnl.size == 0:
+        return {"trades": 0, "pnl": 0.0, "winrate": 0.0, "pf": 0.0, "max_dd": 0.0, "pnl_dd": 0.0}
+    eq = float(capital) + np.cumsum(pnl)
+    pico = np.maximum.accumulate(np.concatenate(([float(capital)], eq)))[1:]
+    max_dd = float((pico - eq).max())
+    ganancia = float(pnl[pnl > 0].sum())
+    perdida = float(-pnl[pnl < 0].sum())
+    total = float(pnl.sum())
+    return {
+        "trades": int(pnl.size),
+        "pnl": total,
+        "winrate": float((pnl > 0).mean() * 100.0),
+        "pf": ganancia / perdida if perdida > 0 else (float("inf") if ganancia > 0 else 0.0),
+        "max_dd": max_dd,
+        "pnl_dd": total / max_dd if max_dd > 0 else total,
+    }
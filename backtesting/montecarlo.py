@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo de robustez sobre la lista de trades del backtest.
+
+Cada camino es una fila de una matriz (caminos x trades); todo se calcula por
+lotes con numpy (sin loop Python por camino):
+  - "bootstrap": trades remuestreados con reposición;
+  - "shuffle"  : mismo conjunto de trades en orden aleatorio;
+  - perturbación de costos (ambos modos): el fee por lado `fees.taker_rate`
+    se multiplica por U(1-fee_jitter, 1+fee_jitter) y se suma slippage
+    U(0, slippage_bps) por lado sobre el notional de entrada+salida.
+Salida por camino: PnL final, max drawdown y peor racha de pérdidas; más
+percentiles / intervalo de confianza y probabilidad de terminar en pérdida.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+MAX_CELDAS = 4_000_000   # caminos*trades por lote (~16 MB por matriz float32)
+
+
+def _columnas(trades: pd.DataFrame, fee_rate: float):
+    """(pnl bruto, notional entrada+salida) por trade."""
+    pnl = trades["pnl"].to_numpy(float)
+    if {"qty", "price_entry", "price_exit"} <= set(trades.columns):
+        notional = trades["qty"].to_numpy(float) * (trades["price_entry"].to_numpy(float)
+                                                     + trades["price_exit"].to_numpy(float))
+    else:
+        notional = np.zeros_like(pnl)
+    fees = trades["fees"].to_numpy(float) if "fees" in trades.columns else notional * fee_rate
+    return pnl + fees, notional
+
+
+def max_drawdown(pnl: np.ndarray) -> np.ndarray:
+    """Max DD (USDT) por fila de una matriz de PnL por trade."""
+    eq = np.cumsum(pnl, axis=1)
+    pico = np.maximum.accumulate(eq, axis=1)
+    np.maximum(pico, 0.0, out=pico)          # el pico arranca en el capital inicial
+    pico -= eq
+    return pico.max(axis=1).astype(np.float64)
+
+
+def peor_racha(perdida: np.ndarray) -> np.ndarray:
+    """Racha máxima de True consecutivos por fila (sin loops)."""
+    c = np.cumsum(perdida, axis=1, dtype=np.int16 if perdida.shape[1] < 2 ** 15 else np.int32)
+    base = np.maximum.accumulate(np.where(perdida, 0, c), axis=1)
+    c -= base
+    return c.max(axis=1).astype(np.int32)
+
+
+def _lote(bruto, notional, B: int, modo: str, fee_rate: float, fee_jitter: float,
+          slippage_bps: float, rng) -> Dict[str, np.ndarray]:
+    T = bruto.size
+    tipo_idx = np.int16 if T < 2 ** 15 else np.int32
+    if modo == "shuffle":
+        idx = rng.permuted(np.broadcast_to(np.arange(T, dtype=tipo_idx), (B, T)), axis=1)
+    else:
+        idx = rng.integers(0, T, size=(B, T), dtype=tipo_idx)
+    # costo por lado: fee * U(1-j, 1+j) + U(0, slippage)
+    costo = rng.random((B, T), dtype=np.float32)
+    costo *= np.float32(2.0 * fee_jitter * fee_rate)
+    costo += np.float32(fee_rate * (1.0 - fee_jitter))
+    if slippage_bps > 0:
+        costo += rng.random((B, T), dtype=np.float32) * np.float32(slippage_bps / 10_000.0)
+    pnl = notional[idx]
+    pnl *= costo
+    np.subtract(bruto[idx], pnl, out=pnl)
+    return {"pnl": pnl.sum(axis=1, dtype=np.float64), "max_dd": max_drawdown(pnl),
+            "racha": peor_racha(pnl < 0)}
+
+
+def simular(trades: pd.DataFrame, caminos: int = 100_000, modo: str = "bootstrap",
+            fee_rate: float = 0.0006, fee_jitter: float = 0.25, slippage_bps: float = 2.0,
+            seed: Optional[int] = None, hilos: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Devuelve {"pnl", "max_dd", "racha"} (un valor por camino).
+    Los lotes corren en `hilos` threads (numpy libera el GIL); cada lote usa
+    su propio generador derivado de `seed`, así el resultado no depende de
+    la cantidad de hilos.
+    """
+    caminos = int(caminos)
+    if trades is None or len(trades) == 0:
+        z = np.zeros(caminos)
+        return {"pnl": z, "max_dd": z.copy(), "racha": z.astype(np.int32)}
+    bruto, notional = (x.astype(np.float32) for x in _columnas(trades, fee_rate))
+    lote = max(1, MAX_CELDAS // bruto.size)
+    tamanos = [min(lote, caminos - i) for i in range(0, caminos, lote)]
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(tamanos))]
+    correr = lambda par: _lote(bruto, notional, par[0], modo, fee_rate, fee_jitter, slippage_bps, par[1])
+    hilos = hilos or os.cpu_count() or 1
+    if hilos > 1 and len(tamanos) > 1:
+        with ThreadPoolExecutor(max_workers=hilos) as ex:
+            partes = list(ex.map(correr, zip(tamanos, rngs)))
+    else:
+        partes = [correr(par) for par in zip(tamanos, rngs)]
+    return {k: np.concatenate([p[k] for p in partes]) for k in ("pnl", "max_dd", "racha")}
+
+
+def resumen(sim: Dict[str, np.ndarray], nivel: float = 0.95) -> Dict[str, Dict[str, float]]:
+    """Media, p5/p50/p95 e IC (`nivel`) de cada distribución."""
+    a = (1.0 - nivel) / 2.0
+    out = {}
+    for k, v in sim.items():
+        lo, p5, p50, p95, hi = np.quantile(v, [a, 0.05, 0.5, 0.95, 1.0 - a])
+        out[k] = {"media": float(v.mean()), "p5": float(p5), "p50": float(p50), "p95": float(p95),
+                  "ic_inf": float(lo), "ic_sup": float(hi)}
+    out["pnl"]["prob_perdida"] = float((sim["pnl"] < 0).mean() * 100.0)
+    return out
+
+
+def analizar(trades: pd.DataFrame, cfg: Dict, caminos: int = 100_000, nivel: float = 0.95,
+             slippage_bps: float = 2.0, fee_jitter: float = 0.25, seed: Optional[int] = None) -> Dict:
+    """Bootstrap + shuffle con costos de `cfg` (fees.taker_rate)."""
+    t0 = time.time()
+    fee = float((cfg.get("fees", {}) or {}).get("taker_rate", 0.0006))
+    res = {"caminos": int(caminos), "nivel": nivel}
+    for modo in ("bootstrap", "shuffle"):
+        sim = simular(trades, caminos, modo, fee, fee_jitter, slippage_bps, seed)
+        res[modo] = {"sim": sim, "resumen": resumen(sim, nivel)}
+    res["tiempo_s"] = round(time.time() - t0, 2)
+    return res
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de backtest por símbolo sobre OHLCV del cache.
+
+API que usa app/live_backtest_app.py:
+    CFGN = normalize_cfg(cfg_ui)
+    trades, audit, eq = run_symbol_on_df(symbol, tf, df, CFGN)
+Para seguir un run cuando se agregan velas: backtesting.checkpoint.run_incremental.
+
+- Señales: estrategia.bollinger_vol.senales_vectorizadas sobre `estrategia.tf`
+  (entrada al cierre de la vela de señal, una posición por símbolo).
+- Salidas: SL, TP, PARCIAL (at_R / fraction), BE y TSL (trailing en R), con la
+  misma semántica que core.trailing_base / core.partials.
+- Resolución:
+    * "barra": se recorren las velas de la señal; si SL y TP caen en la misma
+      vela decide `backtest.fill_policy` ("favorable" => TP/parcial primero,
+      otro valor => stop primero).
+    * "intrabar": las salidas se resuelven recorriendo velas más finas
+      (`backtest.intrabar_tf`, p.ej. 15m dentro de 1h). Sin velas finas para
+      una ventana, ese trade cae a "barra" (queda en audit).
+  En ambos casos cada trade se evalúa sobre una ventana numpy (acumulados y
+  primer índice que cumple), sin loop Python por vela.
+- Control de riesgo: daily_max_trades, daily_max_loss_usdt (PnL realizado
+  del día: cada trade cuenta el día de su salida, como en el portafolio),
+  cooldown_after_sl_streak {count, bars}; filtro de sesión por hora/día UTC.
+- backtest.integridad: sin entradas en velas cuyos indicadores cruzan un
+  hueco del OHLCV (datos.integridad.mascara_invalida).
+"""
+import copy
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.partials import _resolve_partials_cfg
+from gestion.riesgo import calcular_qty, calcular_pnl
+from estrategia.bollinger_vol import senales_vectorizadas
+from estrategia.cache_indicadores import desde_cfg
+
+_TF_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+VENTANA_INICIAL = 256   # velas por ventana de búsqueda (se duplica si no hay salida)
+PROGRESO_S = 0.25       # intervalo mínimo entre llamadas a `progreso`
+
+
+def tf_a_ms(tf: str) -> int:
+    tf = str(tf).strip().lower()
+    return int(tf[:-1]) * _TF_MS[tf[-1]]
+
+
+# ------------------ Config ------------------
+def normalize_cfg(cfg: Dict) -> Dict:
+    """
+    Copia profunda con defaults. Acepta el formato del bot (`trailing`:
+    trigger_R/distance_R) y el de la UI (`auto_trailing.enabled`).
+    """
+    c = copy.deepcopy(cfg or {})
+    c.setdefault("estrategia", {}).setdefault("tf", "15m")
+    r = c.setdefault("riesgo", {})
+    r.setdefault("stop_pct", 1.0); r.setdefault("take_pct", 3.0); r.setdefault("riesgo_usdt", 10.0)
+    c.setdefault("capital", {}).setdefault("total_usdt", 1000.0)
+    c.setdefault("fees", {}).setdefault("taker_rate", 0.0006)
+    c.setdefault("partials", {}).setdefault("enabled", True)
+
+    tr = c.setdefault("trailing", {})
+    at = c.get("auto_trailing") or {}
+    tr.setdefault("enabled", bool(at.get("enabled", tr.get("enabled", True))))
+    tr.setdefault("trigger_R", 1.0); tr.setdefault("distance_R", 0.5)
+
+    s = c.setdefault("session_filter", {})
+    s.setdefault("enabled", False); s.setdefault("blocked_hours", []); s.setdefault("blocked_weekdays", [])
+    rc = c.setdefault("risk_controls", {})
+    rc.setdefault("daily_max_trades", 0); rc.setdefault("daily_max_loss_usdt", 0.0)
+    rc.setdefault("cooldown_after_sl_streak", {}).setdefault("count", 0)
+    rc["cooldown_after_sl_streak"].setdefault("bars", 0)
+
+    b = c.setdefault("backtest", {})
+    b.setdefault("fill_policy", "favorable")
+    b.setdefault("intrabar", False)
+    b.setdefault("intrabar_tf", "15m")
+    ig = b.setdefault("integridad", {})
+    ig.setdefault("saltar_huecos", True); ig.setdefault("ventana", 250)
+    ig.setdefault("saltar_picos", False); ig.setdefault("atr_pico", 8.0)
+    ci = b.setdefault("cache_indicadores", {})
+    ci.setdefault("enabled", True); ci.setdefault("max_mb", 1024)
+    return c
+
+
+def _params(c: Dict) -> Dict:
+    at_R, fraction = _resolve_partials_cfg(c)
+    tr = c["trailing"]
+    return {
+        "stop": float(c["riesgo"]["stop_pct"]) / 100.0,
+        "take": float(c["riesgo"]["take_pct"]) / 100.0,
+        "parcial": bool(c["partials"].get("enabled", True)),
+        "at_R": float(at_R), "fraction": float(fraction),
+        "trailing": bool(tr.get("enabled", True)),
+        "trigger_R": float(tr.get("trigger_R", 1.0)), "distance_R": float(tr.get("distance_R", 0.5)),
+        "favorable": str(c["backtest"].get("fill_policy", "favorable")).lower() == "favorable",
+    }
+
+
+# ------------------ Resolución vectorizada de un trade ------------------
+def _primero(mask: np.ndarray) -> int:
+    """Índice del primer True (len(mask) si no hay)."""
+    return int(mask.argmax()) if mask.any() else len(mask)
+
+
+def resolver_salida(es_long: bool, entry: float, o: np.ndarray, h: np.ndarray, l: np.ndarray,
+                    p: Dict) -> Optional[Dict]:
+    """
+    Primer evento de salida dentro de la ventana (o, h, l) que arranca en la
+    vela siguiente a la entrada. None si la ventana no alcanza.
+    Un SHORT se resuelve como LONG en precios negados.
+    """
+    if not es_long:
+        entry, o, h, l = -entry, -o, -l, -h
+    R = abs(entry) * p["stop"]
+    sl0 = entry - R
+    tp = entry + abs(entry) * p["take"] if p["take"] > 0 else np.inf
+    act = entry + p["trigger_R"] * R if p["trailing"] else np.inf
+    dist = p["distance_R"] * R
+
+    # stop vigente en cada vela: depende del pico hasta la vela ANTERIOR
+    pico = np.maximum.accumulate(np.concatenate(([entry], h[:-1])))
+    activo = pico >= act
+    stop = np.where(activo, np.maximum(entry, pico - dist), sl0)
+
+    js = _primero(l <= stop)
+    jt = _primero(h >= tp)
+    n = len(h)
+    if js >= n and jt >= n:
+        return None
+    if jt < js or (jt == js and p["favorable"]):
+        j, precio, motivo = jt, tp, "TP"
+    else:
+        j = js
+        precio = min(o[j], stop[j])          # gap a través del stop: se llena en la apertura
+        if not activo[j]:
+            motivo = "SL"
+        else:
+            motivo = "BE" if stop[j] <= entry + R * 1e-9 else "TSL"
+
+    jp, pp = n, None
+    if p["parcial"] and 0 < p["fraction"] < 1.0:
+        pp = entry + p["at_R"] * R
+        jp = _primero(h[: j + 1] >= pp)
+        if jp == j and motivo != "TP" and not p["favorable"]:
+            jp = n                            # misma vela que el stop: política adversa
+    sgn = 1.0 if es_long else -1.0
+    return {
+        "j": j, "precio": sgn * float(precio), "motivo": motivo,
+        "j_parcial": jp if jp <= j else None,
+        "precio_parcial": sgn * float(pp) if (pp is not None and jp <= j) else None,
+    }
+
+
+# ------------------ Run por símbolo ------------------
+def _trade(symbol, es_long, qty, entry, salida, ts_in, ts_out, motivo, cfg) -> Dict:
+    side = "LONG" if es_long else "SHORT"
+    pnl = calcular_pnl(side, entry, salida, qty, cfg)
+    pct = ((salida / entry) - 1.0) * 100.0 if es_long else ((entry / salida) - 1.0) * 100.0
+    return {
+        "symbol": symbol, "side": side, "qty": float(qty),
+        "price_entry": float(entry), "price_exit": float(salida),
+        "pnl": float(pnl["neto"]), "pnl_pct": float(pct), "fees": float(pnl["fees"]),
+        "ts_entry": int(ts_in), "ts_exit": int(ts_out), "exit_reason": motivo,
+    }
+
+
+def _mascara_sesion(times: pd.Series, sf: Dict) -> np.ndarray:
+    if not sf.get("enabled"):
+        return np.ones(len(times), dtype=bool)
+    hrs = set(int(x) for x in sf.get("blocked_hours", []) or [])
+    dias = set(int(x) for x in sf.get("blocked_weekdays", []) or [])
+    t = pd.DatetimeIndex(times)
+    return ~(t.hour.isin(hrs) | t.weekday.isin(dias))
+
+
+def _arrays(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    if "ts" in df.columns:
+        ts = df["ts"].to_numpy("int64")
+    else:
+        ts = (pd.to_datetime(df["time"], utc=True).astype("int64") // 1_000_000).to_numpy()
+    return {
+        "ts": ts,
+        "o": df["open"].to_numpy(float), "h": df["high"].to_numpy(float),
+        "l": df["low"].to_numpy(float), "c": df["close"].to_numpy(float),
+    }
+
+
+def preparar(symbol: str, tf: str, df: pd.DataFrame, cfg: Dict,
+             df_fino: Optional[pd.DataFrame] = None,
+             senales: Optional[np.ndarray] = None) -> Dict:
+    """
+    Arrays del símbolo (velas, velas finas, señales, candidatos tras el filtro
+    de sesión). Todo lo vectorizable queda hecho acá; `ejecutar` resuelve un
+    trade puntual y el loop (por símbolo o de portafolio) solo lleva la cuenta.
+    """
+    c = cfg if "backtest" in cfg and "trailing" in cfg else normalize_cfg(cfg)
+    df = df.reset_index(drop=True)
+    A = _arrays(df)
+    N = len(df)
+    tf_ms = tf_a_ms(tf)
+    times = pd.to_datetime(A["ts"], unit="ms", utc=True)
+
+    audit = {"symbol": symbol, "tf": tf, "velas": N, "modo": "barra", "senales": 0,
+             "filtradas_sesion": 0, "bloqueadas_riesgo": 0, "cooldowns": 0,
+             "intrabar_fallback": 0, "sin_salida": 0}
+
+    F = None
+    if c["backtest"].get("intrabar"):
+        tf_f = str(c["backtest"].get("intrabar_tf") or "15m")
+        if tf_a_ms(tf_f) < tf_ms:
+            if df_fino is None:
+                from datos.cache_ohlcv import cargar
+                df_fino = cargar(symbol, tf_f)
+            if df_fino is not None and len(df_fino):
+                F = _arrays(df_fino.reset_index(drop=True))
+                audit.update({"modo": "intrabar", "tf_fino": tf_f})
+        if F is None:
+            audit["intrabar_sin_datos"] = True
+
+    if senales is None:
+        senales = senales_vectorizadas(df, c.get("estrategia", {}), tf_ms=tf_ms, cache=desde_cfg(c))
+    sig = np.asarray(senales, dtype=np.int8)[:N]
+    sesion = _mascara_sesion(times, c["session_filter"])
+    cand = np.flatnonzero(sig != 0)
+    audit["senales"] = int(len(cand))
+    audit["filtradas_sesion"] = int((~sesion[cand]).sum())
+    cand = cand[sesion[cand]]
+    cand = cand[cand < N - 1]
+    ig = c["backtest"]["integridad"]
+    if ig.get("saltar_huecos"):
+        from datos.integridad import mascara_invalida
+        mala = mascara_invalida(A["ts"], tf_ms, int(ig.get("ventana", 250)), df,
+                                float(ig.get("atr_pico", 8.0)) if ig.get("saltar_picos") else None)
+        audit["filtradas_integridad"] = int(mala[cand].sum())
+        cand = cand[~mala[cand]]
+    return {"symbol": symbol, "cfg": c, "p": _params(c), "A": A, "F": F, "N": N, "tf_ms": tf_ms,
+            "times": times, "sig": sig, "cand": cand, "audit": audit}
+
+
+def ejecutar(ctx: Dict, i: int) -> Dict:
+    """
+    Entrada al cierre de la vela `i` y su salida. Devuelve
+    {"trades": [PARCIAL?, salida], "k": vela de salida, "ts_out", "motivo", "pnl", "pnl_k": {k: pnl}}.
+    """
+    A, F, p, c, N, tf_ms, audit = (ctx[k] for k in ("A", "F", "p", "cfg", "N", "tf_ms", "audit"))
+    symbol = ctx["symbol"]
+    es_long = ctx["sig"][i] > 0
+    entry = A["c"][i]
+    ts_in = int(A["ts"][i] + tf_ms)
+    qty = calcular_qty(symbol, entry, c)
+
+    res, ts_of = None, None
+    if F is not None:
+        res, ts_of = _buscar(es_long, entry, F, int(np.searchsorted(F["ts"], ts_in)), p,
+                             tope_ts=int(A["ts"][-1] + tf_ms))
+        if res is None or not _cubierto(F, ts_in, ts_of[min(res["j"], len(ts_of) - 1)], tf_ms):
+            audit["intrabar_fallback"] += 1
+            res = None
+    if res is None:
+        res, ts_of = _buscar(es_long, entry, A, i + 1, p)
+    if res is None:
+        # sin salida hasta el final de los datos: cierre al último close
+        audit["sin_salida"] += 1
+        res = {"j": None, "precio": float(A["c"][-1]), "motivo": "FIN",
+               "j_parcial": None, "precio_parcial": None}
+        ts_out = int(A["ts"][-1] + tf_ms)
+    else:
+        ts_out = int(ts_of[res["j"]])
+    vela = lambda ts: min(N - 1, max(i + 1, int(np.searchsorted(A["ts"], ts, side="right")) - 1))
+    k = vela(ts_out)
+
+    out = {"trades": [], "k": k, "ts_out": ts_out, "motivo": res["motivo"], "pnl": 0.0,
+           "pnl_k": {}, "qty": qty, "entry": float(entry)}
+    qty_rest = qty
+    if res["j_parcial"] is not None:
+        q_p = qty * p["fraction"]
+        qty_rest = qty - q_p
+        ts_p = int(ts_of[res["j_parcial"]])
+        t = _trade(symbol, es_long, q_p, entry, res["precio_parcial"], ts_in, ts_p, "PARCIAL", c)
+        out["trades"].append(t)
+        out["pnl_k"][vela(ts_p)] = t["pnl"]
+    t = _trade(symbol, es_long, qty_rest, entry, res["precio"], ts_in, ts_out, res["motivo"], c)
+    out["trades"].append(t)
+    out["pnl_k"][k] = out["pnl_k"].get(k, 0.0) + t["pnl"]
+    out["pnl"] = sum(x["pnl"] for x in out["trades"])
+    return out
+
+
+class Avance:
+    """
+    Reporte de progreso para `progreso` (jobs de la UI), a lo sumo cada
+    PROGRESO_S: {"velas", "total", "trades", "pnl", "nuevos": [(ts_ms, equity)]}
+    con los puntos de equity de las salidas nuevas desde el reporte anterior.
+    Si el callback lanza una excepción (cancelación) el run se corta ahí.
+    """
+
+    def __init__(self, fn: Optional[Callable[[Dict], None]], total: int, capital: float):
+        self.fn, self.total, self.capital = fn, int(total), float(capital)
+        self.pnl, self.n, self._nuevos, self._t = 0.0, 0, [], 0.0
+
+    def salida(self, ts_ms: int, pnl: float, n_trades: int):
+        if self.fn is None:
+            return
+        self.pnl += pnl
+        self.n += n_trades
+        self._nuevos.append((int(ts_ms), self.capital + self.pnl))
+
+    def __call__(self, velas: int, final: bool = False):
+        if self.fn is None:
+            return
+        ahora = time.monotonic()
+        if final or ahora - self._t >= PROGRESO_S:
+            self._t = ahora
+            self.fn({"velas": int(velas), "total": self.total, "trades": self.n, "pnl": self.pnl,
+                     "nuevos": self._nuevos})
+            self._nuevos = []
+
+
+def run_symbol_on_df(symbol: str, tf: str, df: pd.DataFrame, cfg: Dict,
+                     df_fino: Optional[pd.DataFrame] = None,
+                     senales: Optional[np.ndarray] = None,
+                     progreso: Optional[Callable[[Dict], None]] = None) -> Tuple[List[Dict], Dict, List]:
+    """
+    Devuelve (trades, audit, eq):
+      trades: dicts symbol/side/qty/price_entry/price_exit/pnl/pnl_pct/fees/ts_entry/ts_exit(ms)/exit_reason
+      audit : contadores del run
+      eq    : [(time, equity)] por vela (PnL realizado)
+    `df_fino`: velas finas para modo intrabar (si None y backtest.intrabar, se
+    leen del cache). `senales`: precalculadas (walk-forward / optimizador).
+    `progreso`: callback de avance (ver Avance).
+    """
+    t0 = time.time()
+    trades, audit, eq, _ = correr(preparar(symbol, tf, df, cfg, df_fino, senales), progreso=progreso)
+    audit["tiempo_s"] = round(time.time() - t0, 4)
+    return trades, audit, eq
+
+
+CONTADORES_LOOP = ("bloqueadas_riesgo", "cooldowns", "intrabar_fallback", "sin_salida")
+
+
+def correr(ctx: Dict, estado: Optional[Dict] = None,
+           progreso: Optional[Callable[[Dict], None]] = None) -> Tuple[List[Dict], Dict, List, Dict]:
+    """
+    Loop de entradas sobre un contexto de `preparar`. Devuelve (trades, audit,
+    eq, estado): `estado` es el checkpoint para seguir cuando se agreguen velas
+    (ver backtesting.checkpoint): trades cerrados, PnL por vela, `libre`, racha
+    de SL, contadores diarios y del audit, y `desde` = primer candidato a
+    reprocesar. Un trade cuya salida toca la última vela (o sin salida, FIN)
+    no es definitivo: se deshace en el checkpoint y se vuelve a resolver con
+    más datos. Con `estado` el loop arranca en `estado["desde"]`.
+    """
+    c, A, N, audit = ctx["cfg"], ctx["A"], ctx["N"], ctx["audit"]
+
+    rc = c["risk_controls"]
+    max_tr = int(rc.get("daily_max_trades", 0) or 0)
+    max_loss = float(rc.get("daily_max_loss_usdt", 0.0) or 0.0)
+    cd_n = int(rc["cooldown_after_sl_streak"].get("count", 0) or 0)
+    cd_bars = int(rc["cooldown_after_sl_streak"].get("bars", 0) or 0)
+    dias = (A["ts"] // 86_400_000)
+    tf_ms = ctx["tf_ms"]
+
+    est = estado or {}
+    trades: List[Dict] = list(est.get("trades", ()))
+    pnl_barra = np.zeros(N)
+    n0 = min(int(est.get("n", 0)), N)
+    if n0:
+        pnl_barra[:n0] = np.asarray(est["pnl_barra"], dtype=float)[:n0]
+    libre = int(est.get("libre", 0))
+    racha_sl = int(est.get("racha_sl", 0))
+    # día -> [entradas del día, PnL realizado el día]: el PnL va al día de la salida (al cierre de su
+    # vela, como el portafolio), las entradas al de la entrada
+    por_dia: Dict[int, List[float]] = {d: list(v) for d, v in est.get("por_dia", {}).items()}
+    for k in CONTADORES_LOOP:
+        audit[k] += int(est.get("audit", {}).get(k, 0))
+    cand = ctx["cand"]
+    cand = cand[int(np.searchsorted(cand, int(est.get("desde", 0)))):]
+    capital = float(c["capital"].get("total_usdt", 1000.0))
+    avance = Avance(progreso, N, capital)
+    avance.pnl, avance.n = float(pnl_barra.sum()), len(trades)
+
+    abierta = None   # (i, estado previo, resultado) del último trade si toca el final
+    for i in cand:
+        avance(i)
+        if i < libre:
+            continue
+        d = int(dias[i])
+        cnt, pnl_d = por_dia.setdefault(d, [0, 0.0])
+        if (max_tr and cnt >= max_tr) or (max_loss and pnl_d <= -max_loss):
+            audit["bloqueadas_riesgo"] += 1
+            continue
+
+        r = ejecutar(ctx, i)
+        k = r["k"]
+        d_out = max(int(A["ts"][k]) + tf_ms, r["ts_out"]) // 86_400_000
+        dias_previos = {dd: (list(por_dia[dd]) if dd in por_dia else None) for dd in (d, d_out)}
+        previo = (len(trades), libre, racha_sl, dias_previos, {k: audit[k] for k in CONTADORES_LOOP})
+        trades.extend(r["trades"])
+        for kk, v in r["pnl_k"].items():
+            pnl_barra[kk] += v
+        avance.salida(r["ts_out"], r["pnl"], len(r["trades"]))
+        abierta = (i, previo, r) if k >= N - 1 else None
+
+        por_dia[d][0] += 1
+        por_dia.setdefault(d_out, [0, 0.0])[1] += r["pnl"]
+        libre = k + 1
+        if r["motivo"] == "SL":
+            racha_sl += 1
+            if cd_n and racha_sl >= cd_n:
+                libre = max(libre, k + 1 + cd_bars)
+                racha_sl = 0
+                audit["cooldowns"] += 1
+        else:
+            racha_sl = 0
+
+    avance(N, final=True)
+    equity = capital + np.cumsum(pnl_barra)
+    eq = list(zip(ctx["times"], equity.tolist()))
+    audit.update({"trades": len(trades), "pnl": float(pnl_barra.sum())})
+
+    fin = {"n": N, "desde": max(N - 1, 0), "trades": list(trades), "pnl_barra": pnl_barra.copy(),
+           "libre": libre, "racha_sl": racha_sl, "por_dia": {d: list(v) for d, v in por_dia.items()},
+           "audit": {k: audit[k] for k in CONTADORES_LOOP}}
+    if abierta is not None:
+        i, (n_tr, libre0, racha0, dias0, aud0), r = abierta
+        for kk, v in r["pnl_k"].items():
+            fin["pnl_barra"][kk] -= v
+        fin.update({"desde": int(i), "trades": fin["trades"][:n_tr], "libre": libre0, "racha_sl": racha0,
+                    "audit": aud0, "abierta": {"i": int(i), "pnl_k": dict(r["pnl_k"])}})
+        for dd, v in dias0.items():
+            if v is None:
+                fin["por_dia"].pop(dd, None)
+            else:
+                fin["por_dia"][dd] = v
+    return trades, audit, eq, fin
+
+
+def _buscar(es_long: bool, entry: float, X: Dict[str, np.ndarray], ini: int, p: Dict,
+            tope_ts: Optional[int] = None):
+    """Ventanas crecientes desde `ini` hasta encontrar salida. Devuelve (res, ts de la ventana)."""
+    n = len(X["ts"])
+    fin_max = n if tope_ts is None else int(np.searchsorted(X["ts"], tope_ts))
+    w = VENTANA_INICIAL
+    while ini < fin_max:
+        fin = min(fin_max, ini + w)
+        res = resolver_salida(es_long, entry, X["o"][ini:fin], X["h"][ini:fin], X["l"][ini:fin], p)
+        if res is not None:
+            return res, X["ts"][ini:fin]
+        if fin >= fin_max:
+            return None, X["ts"][ini:fin]
+        w *= 2
+    return None, X["ts"][ini:ini]
+
+
+def _cubierto(F: Dict[str, np.ndarray], ts_ini: int, ts_fin: int, tf_ms: int) -> bool:
+    """True si las velas finas cubren [ts_ini, ts_fin] sin huecos mayores a una vela de señal."""
+    a = int(np.searchsorted(F["ts"], ts_ini))
+    b = int(np.searchsorted(F["ts"], ts_fin, side="right"))
+    if b <= a or F["ts"][a] - ts_ini >= tf_ms:
+        return False
+    return bool((np.diff(F["ts"][a:b]) < tf_ms).all()) if b - a > 1 else True
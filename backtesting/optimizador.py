@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Optimizador por successive halving sobre el OHLCV del cache.
+
+- Candidatos: la grilla completa {"seccion.clave": [valores]} (mismo formato
+  que el walk-forward: estrategia.*, riesgo.*, partials.*, trailing.*) o una
+  muestra aleatoria de `muestras` combinaciones.
+- Rondas sobre prefijos crecientes de la historia: la ronda r evalúa a los
+  sobrevivientes sobre las primeras N / eta^(R-r) velas (la primera cubre al
+  menos `dias_min` días) y se queda con el mejor 1/eta; la última usa la
+  historia completa.
+- Extender la ventana no recorre de nuevo el prefijo: cada candidato sigue
+  desde el estado del loop de su ronda anterior (motor.correr, el mismo del
+  checkpoint incremental); las señales son causales, el prefijo de las de
+  toda la historia vale igual.
+- Workers en procesos: cada uno recibe df y config una sola vez
+  (initializer) y memoiza las señales por combinación de estrategia.
+- `min_trades` se escala con la fracción de historia de cada ronda.
+
+CLI:
+    python -m backtesting.optimizador --symbol ETHUSDT --tf 15m
+(lee backtest.optimizador de config/settings.json)
+"""
+import math
+import os
+import random
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backtesting.metricas import metricas
+from backtesting.motor import correr, normalize_cfg, preparar
+from backtesting.walkforward import DIA_MS, _clave_estrategia, _puntaje, aplicar, combinaciones
+from estrategia.bollinger_vol import senales_vectorizadas
+from estrategia.cache_indicadores import desde_cfg
+
+LOG = logging.getLogger("bibit")
+
+
+def rondas(n_velas: int, velas_min: int, eta: int) -> List[int]:
+    """Fin (en velas) del prefijo de cada ronda: ..., N/eta^2, N/eta, N."""
+    eta = max(2, int(eta))
+    out = [int(n_velas)]
+    while out[0] // eta >= max(1, int(velas_min)):
+        out.insert(0, out[0] // eta)
+    return out
+
+
+# ------------------ Worker ------------------
+_W: Dict = {}
+
+
+def _init_worker(symbol, tf, df, cfg):
+    _W.update(symbol=symbol, tf=tf, df=df, cfg=cfg, senales={})
+
+
+def _senales(params: Dict, cfg: Dict, b: int) -> np.ndarray:
+    k = _clave_estrategia(params)
+    sig = _W["senales"].get(k)
+    if sig is None or len(sig) < b:
+        # causales: las del prefijo [:b] son las mismas que sobre toda la historia
+        sig = senales_vectorizadas(_W["df"].iloc[:b], cfg["estrategia"], cache=desde_cfg(cfg))
+        _W["senales"][k] = sig
+    return sig[:b]
+
+
+def _evaluar(tarea):
+    ic, params, b, estado = tarea
+    cfg = normalize_cfg(aplicar(_W["cfg"], params))
+    ctx = preparar(_W["symbol"], _W["tf"], _W["df"].iloc[:b], cfg, senales=_senales(params, cfg, b))
+    trades, _, _, fin = correr(ctx, estado)
+    fin.update(n=0, pnl_barra=None)           # solo interesan trades y contadores, no la equity
+    return ic, metricas(trades, float(cfg["capital"].get("total_usdt", 1000.0))), fin
+
+
+# ------------------ Runner ------------------
+def halving(symbol: str, tf: str, df: pd.DataFrame, cfg: Dict, grilla: Dict[str, list],
+            eta: int = 3, dias_min: float = 30, muestras: int = 0, objetivo: str = "pnl_dd",
+            min_trades: int = 10, top: int = 10, procesos: Optional[int] = None, semilla: int = 0) -> Dict:
+    """
+    Devuelve {"mejores": [{"params", "metricas", "puntaje"}] (ronda final, de
+    mejor a peor), "rondas": [{"velas", "dias", "candidatos", "tiempo_s"}],
+    "candidatos", "evaluaciones_velas", "tiempo_s"}.
+    """
+    t0 = time.time()
+    base = normalize_cfg(cfg)
+    if base["backtest"].get("intrabar"):
+        LOG.warning("OPT successive halving en modo barra (intrabar desactivado)")
+        base["backtest"]["intrabar"] = False
+    df = df.reset_index(drop=True)
+    combos = combinaciones(grilla) or [{}]
+    if muestras and muestras < len(combos):
+        combos = random.Random(semilla).sample(combos, int(muestras))
+
+    ts = df["ts"].to_numpy("int64") if "ts" in df.columns else \
+        (pd.to_datetime(df["time"], utc=True).astype("int64") // 1_000_000).to_numpy()
+    N = len(df)
+    paso = int(np.median(np.diff(ts))) if N > 1 else DIA_MS
+    fines = rondas(N, int(dias_min * DIA_MS / max(1, paso)), eta)
+
+    vivos = list(range(len(combos)))
+    estados: Dict[int, Optional[Dict]] = {ic: None for ic in vivos}
+    res_rondas, ultimos, evaluadas = [], {}, 0
+    init = (symbol, tf, df, base)
+    workers = max(1, min(procesos or os.cpu_count() or 1, len(combos)))
+    ex = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init) if workers > 1 else None
+    if ex is None:
+        _init_worker(*init)
+    try:
+        for r, b in enumerate(fines):
+            tr0 = time.time()
+            tareas = [(ic, combos[ic], b, estados[ic]) for ic in vivos]
+            if ex is None:
+                resultados = list(map(_evaluar, tareas))
+            else:
+                resultados = list(ex.map(_evaluar, tareas, chunksize=max(1, len(tareas) // (4 * workers))))
+            evaluadas += len(tareas) * (b - (fines[r - 1] if r else 0))
+            minimo = max(1, int(round(min_trades * b / N)))
+            ultimos = {}
+            for ic, m, fin in resultados:
+                estados[ic] = fin
+                ultimos[ic] = (m, _puntaje(m, objetivo, minimo))
+            orden = sorted(vivos, key=lambda ic: ultimos[ic][1], reverse=True)
+            res_rondas.append({"velas": b, "dias": round(float(ts[b - 1] - ts[0]) / DIA_MS, 1),
+                               "candidatos": len(vivos), "min_trades": minimo,
+                               "tiempo_s": round(time.time() - tr0, 2)})
+            if r < len(fines) - 1:
+                vivos = orden[:max(1, math.ceil(len(vivos) / eta))]
+                estados = {ic: estados[ic] for ic in vivos}
+            else:
+                vivos = orden
+    finally:
+        if ex is not None:
+            ex.shutdown()
+
+    mejores = [{"params": combos[ic], "metricas": ultimos[ic][0], "puntaje": ultimos[ic][1]}
+               for ic in vivos[:max(1, int(top))]]
+    res = {"mejores": mejores, "rondas": res_rondas, "candidatos": len(combos),
+           "evaluaciones_velas": int(evaluadas), "tiempo_s": round(time.time() - t0, 2)}
+    LOG.info("OPT %s %s: %d candidatos, %d rondas en %.1fs | mejor %s=%.3f",
+             symbol, tf, len(combos), len(fines), res["tiempo_s"], objetivo,
+             mejores[0]["puntaje"] if mejores else float("nan"))
+    return res
+
+
+def main():
+    import argparse, json
+    from utils.settings import load_settings
+    from datos.resample import cargar_tf
+
+    ap = argparse.ArgumentParser(description="Optimizador successive halving sobre el cache OHLCV")
+    ap.add_argument("--symbol", default="ETHUSDT")
+    ap.add_argument("--tf", default=None)
+    ap.add_argument("--settings", default="config/settings.json")
+    ap.add_argument("--procesos", type=int, default=None)
+    ap.add_argument("--salida", default=None, help="JSON con el resultado")
+    args = ap.parse_args()
+
+    cfg, _ = load_settings(args.settings)
+    bt = cfg.get("backtest", {}) or {}
+    op = bt.get("optimizador", {}) or {}
+    tf = args.tf or cfg.get("estrategia", {}).get("tf", "15m")
+    cfg.setdefault("estrategia", {})["tf"] = tf
+    df = cargar_tf(args.symbol, tf, since=cfg.get("since"))
+    res = halving(args.symbol, tf, df, cfg, op.get("grilla") or (bt.get("walkforward", {}) or {}).get("grilla", {}),
+                  eta=op.get("eta", 3), dias_min=op.get("dias_min", 30), muestras=op.get("muestras", 0),
+                  objetivo=op.get("objetivo", "pnl_dd"), min_trades=op.get("min_trades", 10),
+                  top=op.get("top", 10), procesos=args.procesos)
+    for ro in res["rondas"]:
+        print(f"ronda {ro['dias']} días ({ro['velas']} velas): {ro['candidatos']} candidatos en {ro['tiempo_s']}s")
+    for i, m in enumerate(res["mejores"]):
+        print(f"#{i + 1} {m['params']} -> {m['puntaje']:.3f} | pnl={m['metricas']['pnl']:.2f} "
+              f"pf={m['metricas']['pf']:.2f} trades={m['metricas']['trades']}")
+    print(f"{res['candidatos']} candidatos | {res['tiempo_s']}s")
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Backtest de portafolio: varios símbolos con capital compartido.
+
+- Por símbolo, `motor.preparar` deja vectorizado todo lo que no depende de
+  los demás (velas, señales, filtro de sesión, candidatos). El resultado de un
+  trade tampoco depende del portafolio: `motor.ejecutar` lo resuelve solo si
+  el trade se toma.
+- El loop de eventos recorre las entradas candidatas de todos los símbolos en
+  orden de tiempo y lleva únicamente la cuenta cruzada:
+    * anti-piramidado: una posición por símbolo (como el core);
+    * capital compartido: margen = qty * entrada / futuros.leverage; la
+      entrada se descarta si supera el libre (capital + PnL realizado -
+      margen en uso);
+    * risk_controls globales: daily_max_trades (entradas del día UTC),
+      daily_max_loss_usdt (PnL realizado del día) y cooldown tras una racha
+      de SL (`bars` velas de `estrategia.tf` desde la última salida).
+- Las salidas se realizan (margen, PnL del día, racha) al cierre de su vela,
+  en orden (heap), antes de cada entrada.
+"""
+import heapq
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtesting.motor import Avance, normalize_cfg, preparar, ejecutar, tf_a_ms
+from gestion.riesgo import calcular_qty
+
+DIA_MS = 86_400_000
+
+
+def run_portfolio(dfs: Dict[str, pd.DataFrame], tf: str, cfg: Dict,
+                  dfs_finos: Optional[Dict[str, pd.DataFrame]] = None,
+                  senales: Optional[Dict[str, np.ndarray]] = None,
+                  progreso: Optional[Callable[[Dict], None]] = None) -> Tuple[List[Dict], Dict, List]:
+    """
+    dfs: {símbolo: OHLCV}. Devuelve (trades, audit, eq) con el mismo formato
+    que run_symbol_on_df; `eq` va sobre la unión de timestamps de todos los
+    símbolos y `audit["simbolos"]` trae el audit de cada uno. `progreso` como
+    en run_symbol_on_df (el avance se cuenta en entradas candidatas).
+    """
+    t0 = time.time()
+    c = normalize_cfg(cfg)
+    tf_ms = tf_a_ms(tf)
+    simbolos = [s for s in dfs if dfs[s] is not None and len(dfs[s])]
+    ctxs = {s: preparar(s, tf, dfs[s], c, (dfs_finos or {}).get(s), (senales or {}).get(s))
+            for s in simbolos}
+
+    # timeline de entradas: (ts de entrada, orden del símbolo, índice de vela)
+    ts_ev, sym_ev, i_ev = [], [], []
+    for n, s in enumerate(simbolos):
+        cand = ctxs[s]["cand"]
+        ts_ev.append(ctxs[s]["A"]["ts"][cand] + tf_ms)
+        sym_ev.append(np.full(len(cand), n, dtype=np.int32))
+        i_ev.append(cand)
+    if simbolos:
+        ts_ev, sym_ev, i_ev = (np.concatenate(x) for x in (ts_ev, sym_ev, i_ev))
+    else:
+        ts_ev = sym_ev = i_ev = np.zeros(0, dtype=np.int64)
+    orden = np.lexsort((sym_ev, ts_ev))
+
+    rc = c["risk_controls"]
+    max_tr = int(rc.get("daily_max_trades", 0) or 0)
+    max_loss = float(rc.get("daily_max_loss_usdt", 0.0) or 0.0)
+    cd_n = int(rc["cooldown_after_sl_streak"].get("count", 0) or 0)
+    cd_ms = int(rc["cooldown_after_sl_streak"].get("bars", 0) or 0) * tf_ms
+    leverage = max(1.0, float((c.get("futuros", {}) or {}).get("leverage", 1.0)))
+    capital = float(c["capital"].get("total_usdt", 1000.0))
+
+    audit = {"simbolos": {s: ctxs[s]["audit"] for s in simbolos}, "tf": tf,
+             "candidatas": int(len(orden)), "ocupado": 0, "sin_margen": 0,
+             "bloqueadas_riesgo": 0, "cooldown": 0, "cooldowns": 0, "max_simultaneas": 0}
+    trades: List[Dict] = []
+    abiertas: List = []                      # heap (ts_libre, seq, símbolo, margen, pnl, motivo)
+    libre = {s: 0 for s in simbolos}         # anti-piramidado: próxima vela permitida
+    realizado, margen_uso = 0.0, 0.0
+    entradas_dia: Dict[int, int] = {}
+    pnl_dia: Dict[int, float] = {}
+    racha_sl, cooldown_hasta = 0, -1
+
+    def _realizar(hasta_ts: int):
+        nonlocal realizado, margen_uso, racha_sl, cooldown_hasta
+        while abiertas and abiertas[0][0] <= hasta_ts:
+            ts_out, _, _, margen, pnl, motivo = heapq.heappop(abiertas)
+            realizado += pnl
+            margen_uso -= margen
+            d = ts_out // DIA_MS
+            pnl_dia[d] = pnl_dia.get(d, 0.0) + pnl
+            if motivo == "SL":
+                racha_sl += 1
+                if cd_n and racha_sl >= cd_n:
+                    cooldown_hasta = max(cooldown_hasta, ts_out + cd_ms)
+                    racha_sl = 0
+                    audit["cooldowns"] += 1
+            else:
+                racha_sl = 0
+
+    seq = 0
+    avance = Avance(progreso, len(orden), capital)
+    for n_ev, e in enumerate(orden):
+        avance(n_ev)
+        ts_in, s, i = int(ts_ev[e]), simbolos[int(sym_ev[e])], int(i_ev[e])
+        _realizar(ts_in)
+        if i < libre[s]:
+            audit["ocupado"] += 1
+            continue
+        if ts_in < cooldown_hasta:
+            audit["cooldown"] += 1
+            continue
+        d = ts_in // DIA_MS
+        if (max_tr and entradas_dia.get(d, 0) >= max_tr) or (max_loss and pnl_dia.get(d, 0.0) <= -max_loss):
+            audit["bloqueadas_riesgo"] += 1
+            continue
+        ctx = ctxs[s]
+        entry = float(ctx["A"]["c"][i])
+        margen = calcular_qty(s, entry, c) * entry / leverage
+        if margen > capital + realizado - margen_uso:
+            audit["sin_margen"] += 1
+            continue
+
+        r = ejecutar(ctx, i)
+        trades.extend(r["trades"])
+        avance.salida(r["ts_out"], r["pnl"], len(r["trades"]))
+        entradas_dia[d] = entradas_dia.get(d, 0) + 1
+        libre[s] = r["k"] + 1
+        margen_uso += margen
+        seq += 1
+        # el margen se libera al cierre de la vela de salida (el instante exacto dentro
+        # de la vela no se conoce)
+        fin_vela = int(ctx["A"]["ts"][r["k"]]) + tf_ms
+        heapq.heappush(abiertas, (max(fin_vela, r["ts_out"]), seq, s, margen, r["pnl"], r["motivo"]))
+        audit["max_simultaneas"] = max(audit["max_simultaneas"], len(abiertas))
+
+    avance(len(orden), final=True)
+    # equity sobre la unión de timestamps (PnL en la vela de cada salida)
+    ts_all = np.unique(np.concatenate([ctxs[s]["A"]["ts"] for s in simbolos])) if simbolos \
+        else np.zeros(0, dtype=np.int64)
+    pnl_barra = np.zeros(len(ts_all))
+    if trades and len(ts_all):
+        ts_out = np.array([t["ts_exit"] for t in trades], dtype=np.int64)
+        pos = np.clip(np.searchsorted(ts_all, ts_out, side="right") - 1, 0, len(ts_all) - 1)
+        np.add.at(pnl_barra, pos, [t["pnl"] for t in trades])
+    eq = list(zip(pd.to_datetime(ts_all, unit="ms", utc=True), (capital + np.cumsum(pnl_barra)).tolist()))
+
+    trades.sort(key=lambda t: (t["ts_entry"], t["ts_exit"]))
+    audit.update({"trades": len(trades), "pnl": float(pnl_barra.sum()),
+                  "tiempo_s": round(time.time() - t0, 4)})
+    return trades, audit, eq
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Backtest en streaming (fuera de memoria) para historias largas en TF finos.
+
+- Lee el cache por tramos (datos.cache_ohlcv.leer_tramos): nunca está la
+  historia entera en un DataFrame.
+- Señales por tramo con estrategia.bollinger_vol.SenalesStream (solape para
+  las ventanas móviles + semillas de EMA/RSI/EMA HTF) y máscara de
+  integridad con su propio solape.
+- El loop de entradas es motor.correr sobre una ventana que arranca en la
+  posición abierta (o en la última vela) del tramo anterior: el estado que
+  cruza el borde es el mismo del checkpoint incremental (libre/cooldown,
+  racha de SL, contadores diarios y del audit).
+- Trades y equity se escriben a disco (CSV) a medida que quedan definitivos;
+  al final, audit.json. La memoria pico depende del tramo (y de la duración
+  del trade más largo), no de la historia.
+
+Mismos trades, equity y contadores que run_symbol_on_df sobre el df completo,
+bit a bit: las medias móviles se calculan por ventana (ver SenalesStream).
+Sin modo intrabar: las velas finas se leen completas.
+"""
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtesting.motor import CONTADORES_LOOP, _mascara_sesion, correr, normalize_cfg, preparar, tf_a_ms
+
+LOG = logging.getLogger("bibit")
+
+
+class _Integridad:
+    """datos.integridad.mascara_invalida por tramos (solape = ventana post-hueco + ATR de picos)."""
+
+    def __init__(self, tf_ms: int, ig: Dict):
+        from datos.integridad import ATR_N
+        self.tf_ms = int(tf_ms)
+        self.ventana = int(ig.get("ventana", 250))
+        self.atr = float(ig.get("atr_pico", 8.0)) if ig.get("saltar_picos") else None
+        self.solape = self.ventana + ATR_N + 2
+        self.cola: Optional[pd.DataFrame] = None
+
+    def procesar(self, tramo: pd.DataFrame) -> np.ndarray:
+        from datos.integridad import mascara_invalida
+        df = tramo if self.cola is None else pd.concat([self.cola, tramo], ignore_index=True)
+        previas = 0 if self.cola is None else len(self.cola)
+        mala = mascara_invalida(df["ts"].to_numpy("int64"), self.tf_ms, self.ventana, df, self.atr)
+        self.cola = df.iloc[max(0, len(df) - self.solape):].reset_index(drop=True)
+        return mala[previas:]
+
+
+def _con_ultimo(it: Iterable) -> Iterator[Tuple[object, bool]]:
+    it = iter(it)
+    try:
+        previo = next(it)
+    except StopIteration:
+        return
+    for x in it:
+        yield previo, False
+        previo = x
+    yield previo, True
+
+
+class _Salida:
+    """trades.csv / equity.csv en `destino`, escritos por partes."""
+
+    def __init__(self, destino: Path):
+        self.dir = Path(destino)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.trades = self.dir / "trades.csv"
+        self.equity = self.dir / "equity.csv"
+        for p in (self.trades, self.equity):
+            p.unlink(missing_ok=True)
+        self.n_trades = 0
+        self._cab_eq = True
+
+    def escribir_trades(self, trades):
+        if trades:
+            pd.DataFrame(trades).to_csv(self.trades, mode="a", header=self.n_trades == 0, index=False)
+            self.n_trades += len(trades)
+
+    def escribir_equity(self, ts: np.ndarray, equity: np.ndarray):
+        if len(ts):
+            pd.DataFrame({"ts": ts, "equity": equity}).to_csv(self.equity, mode="a", header=self._cab_eq, index=False)
+            self._cab_eq = False
+
+
+def run_streaming(symbol: str, tf: str, cfg: Dict, destino, since=None, until=None,
+                  filas: Optional[int] = None, tramos: Optional[Iterable[pd.DataFrame]] = None) -> Dict:
+    """
+    Corre el backtest tramo a tramo y deja en `destino` trades.csv, equity.csv
+    (ts ms, equity por vela) y audit.json. `tramos`: iterable de DataFrames
+    OHLCV consecutivos (por defecto leer_tramos del cache con `filas`).
+    Devuelve {"trades", "equity", "audit"} (rutas y el audit).
+    """
+    t0 = time.time()
+    c = normalize_cfg(cfg)
+    if c["backtest"].get("intrabar"):
+        raise ValueError("backtest en streaming sin modo intrabar (las velas finas se leen completas)")
+    if tramos is None:
+        from datos.cache_ohlcv import FILAS_TRAMO, leer_tramos
+        tramos = leer_tramos(symbol, tf, since, until, filas or FILAS_TRAMO)
+    tf_ms = tf_a_ms(tf)
+    ig = c["backtest"]["integridad"]
+    c_ventana = {**c, "backtest": {**c["backtest"], "integridad": {**ig, "saltar_huecos": False}}}
+    capital = float(c["capital"].get("total_usdt", 1000.0))
+
+    from estrategia.bollinger_vol import SenalesStream
+    senales = SenalesStream(c.get("estrategia", {}), tf_ms)
+    integridad = _Integridad(tf_ms, ig) if ig.get("saltar_huecos") else None
+    out = _Salida(Path(destino))
+
+    audit = {"symbol": symbol, "tf": tf, "velas": 0, "modo": "barra", "streaming": True, "tramos": 0,
+             "senales": 0, "filtradas_sesion": 0, "filtradas_integridad": 0, **{k: 0 for k in CONTADORES_LOOP}}
+    buf: Optional[pd.DataFrame] = None       # velas desde la posición abierta / última vela
+    sig_buf = np.zeros(0, dtype=np.int8)
+    g0 = 0                                   # índice global de buf[0]
+    estado = {"desde": 0, "libre": 0, "racha_sl": 0, "por_dia": {}, "audit": {}}
+    acum = 0.0                               # suma acumulada de PnL (misma cuenta que np.cumsum)
+
+    for tramo, es_ultimo in _con_ultimo(tramos):
+        tramo = tramo.reset_index(drop=True)
+        n_t = len(tramo)
+        if n_t == 0 and not es_ultimo:
+            continue
+        audit["tramos"] += 1
+        sig = senales.procesar(tramo)
+        n_sig = sig != 0
+        audit["senales"] += int(n_sig.sum())
+        ses = _mascara_sesion(pd.to_datetime(tramo["ts"], unit="ms", utc=True), c["session_filter"])
+        audit["filtradas_sesion"] += int((n_sig & ~ses).sum())
+        sig = sig.copy()
+        if integridad is not None:
+            mala = integridad.procesar(tramo)
+            filtradas = n_sig & ses & mala
+            if es_ultimo and n_t:
+                filtradas[-1] = False            # la última vela nunca es candidata
+            audit["filtradas_integridad"] += int(filtradas.sum())
+            sig[mala] = 0
+        audit["velas"] += n_t
+
+        cols = ["ts", "open", "high", "low", "close", "volume"]
+        buf = tramo[cols] if buf is None else pd.concat([buf, tramo[cols]], ignore_index=True)
+        sig_buf = np.concatenate([sig_buf, sig])
+        ctx = preparar(symbol, tf, buf, c_ventana, senales=sig_buf)
+        rel = {**estado, "n": 0, "trades": [], "desde": estado["desde"] - g0, "libre": estado["libre"] - g0}
+        trades_w, audit_w, _, fin = correr(ctx, rel)
+        n_w = ctx["N"]
+        pnl = fin["pnl_barra"]
+        if es_ultimo:
+            # fin de los datos: la posición abierta queda cerrada (FIN) como en el motor en memoria
+            for kk, v in (fin.get("abierta") or {}).get("pnl_k", {}).items():
+                pnl[kk] += v
+            firmes, definitivos, contadores = n_w, trades_w, audit_w
+        else:
+            firmes, definitivos, contadores = fin["desde"], fin["trades"], fin["audit"]
+        out.escribir_trades(definitivos)
+        if firmes:
+            s = np.cumsum(np.concatenate(([acum], pnl[:firmes])))[1:]
+            acum = float(s[-1])
+            out.escribir_equity(ctx["A"]["ts"][:firmes], capital + s)
+        for k in CONTADORES_LOOP:
+            audit[k] = int(contadores[k])
+
+        dia_0 = int(ctx["A"]["ts"][min(fin["desde"], n_w - 1)] // 86_400_000) if n_w else 0
+        estado = {"desde": g0 + fin["desde"], "libre": g0 + fin["libre"], "racha_sl": fin["racha_sl"],
+                  "audit": fin["audit"], "por_dia": {d: v for d, v in fin["por_dia"].items() if d >= dia_0}}
+        buf = buf.iloc[firmes:].reset_index(drop=True)
+        sig_buf = sig_buf[firmes:]
+        g0 += firmes
+
+    audit.update({"trades": out.n_trades, "pnl": acum, "tiempo_s": round(time.time() - t0, 4)})
+    (out.dir / "audit.json").write_text(json.dumps(audit, ensure_ascii=False, indent=2), encoding="utf-8")
+    return {"trades": out.trades, "equity": out.equity, "audit": audit}
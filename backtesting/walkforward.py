@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Walk-forward sobre el OHLCV del cache.
+
+- Ventanas por tiempo: `train_dias` de optimización seguidos de `test_dias`
+  fuera de muestra; avanzan de a `test_dias`. `anclada=True` => el train
+  arranca siempre al inicio de la historia.
+- Grilla: {"seccion.clave": [valores]} (p.ej. "riesgo.stop_pct",
+  "estrategia.bb_mult"). Las señales dependen solo de las claves
+  "estrategia.*": se calculan UNA vez por combinación de estrategia sobre toda
+  la historia y todas las ventanas usan cortes de esos arrays.
+- Optimización en paralelo (procesos): cada worker recibe df/señales una sola
+  vez (initializer) y evalúa (ventana, combinación).
+- El mejor set de cada train se corre en su test; las equities de test se
+  encadenan (OOS). `estabilidad` resume cuánto cambian los parámetros.
+
+CLI:
+    python -m backtesting.walkforward --symbol ETHUSDT --tf 15m
+(lee backtest.walkforward de config/settings.json)
+"""
+import copy
+import itertools
+import os
+import time
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtesting.motor import normalize_cfg, run_symbol_on_df
+from backtesting.metricas import metricas
+from estrategia.bollinger_vol import senales_vectorizadas
+from estrategia.cache_indicadores import desde_cfg
+
+LOG = logging.getLogger("bibit")
+DIA_MS = 86_400_000
+
+
+# ------------------ Ventanas / grilla ------------------
+def ventanas(ts: np.ndarray, train_dias: float, test_dias: float,
+             anclada: bool = False) -> List[Tuple[int, int, int]]:
+    """[(ini_train, ini_test, fin_test)] como índices sobre `ts` (ms, ordenado)."""
+    ts = np.asarray(ts, dtype="int64")
+    if ts.size == 0:
+        return []
+    out = []
+    t0 = int(ts[0])
+    train_ms, test_ms = int(train_dias * DIA_MS), int(test_dias * DIA_MS)
+    k = 0
+    while True:
+        corte = t0 + train_ms + k * test_ms
+        if corte >= int(ts[-1]):
+            break
+        ini = t0 if anclada else corte - train_ms
+        a, b, c = np.searchsorted(ts, [ini, corte, corte + test_ms])
+        if c > b and b > a:
+            out.append((int(a), int(b), int(c)))
+        k += 1
+    return out
+
+
+def combinaciones(grilla: Dict[str, list]) -> List[Dict]:
+    claves = sorted(grilla or {})
+    return [dict(zip(claves, vals)) for vals in itertools.product(*(grilla[k] for k in claves))]
+
+
+def aplicar(cfg: Dict, params: Dict) -> Dict:
+    c = copy.deepcopy(cfg)
+    for ruta, v in params.items():
+        d = c
+        partes = ruta.split(".")
+        for p in partes[:-1]:
+            d = d.setdefault(p, {})
+        d[partes[-1]] = v
+    return c
+
+
+def _clave_estrategia(params: Dict) -> Tuple:
+    return tuple(sorted((k, v) for k, v in params.items() if k.startswith("estrategia.")))
+
+
+def _puntaje(m: Dict, objetivo: str, min_trades: int) -> float:
+    if m["trades"] < min_trades:
+        return float("-inf")
+    v = float(m.get(objetivo, m["pnl"]))
+    return v if np.isfinite(v) else 1e9
+
+
+# ------------------ Worker ------------------
+_W: Dict = {}
+
+
+def _init_worker(symbol, tf, df, senales, cfg, df_fino):
+    _W.update(symbol=symbol, tf=tf, df=df, senales=senales, cfg=cfg, df_fino=df_fino)
+
+
+def _correr(params: Dict, a: int, b: int):
+    cfg = normalize_cfg(aplicar(_W["cfg"], params))
+    df = _W["df"].iloc[a:b]
+    sig = _W["senales"][_clave_estrategia(params)][a:b]
+    return run_symbol_on_df(_W["symbol"], _W["tf"], df, cfg, df_fino=_W["df_fino"], senales=sig)
+
+
+def _evaluar(tarea):
+    iv, ic, params, a, b = tarea
+    trades, _, _ = _correr(params, a, b)
+    return iv, ic, metricas(trades, _W["cfg"].get("capital", {}).get("total_usdt", 1000.0))
+
+
+# ------------------ Runner ------------------
+def walk_forward(symbol: str, tf: str, df: pd.DataFrame, cfg: Dict, grilla: Dict[str, list],
+                 train_dias: float = 90, test_dias: float = 30, anclada: bool = False,
+                 objetivo: str = "pnl_dd", min_trades: int = 10, procesos: Optional[int] = None,
+                 df_fino: Optional[pd.DataFrame] = None) -> Dict:
+    """
+    Devuelve {"ventanas": [...], "trades": [...], "equity": [(time, eq)],
+              "oos": metricas OOS, "estabilidad": {...}, "tiempo_s": float}.
+    """
+    t0 = time.time()
+    base = normalize_cfg(cfg)
+    df = df.reset_index(drop=True)
+    if df_fino is None and base["backtest"].get("intrabar"):
+        from datos.cache_ohlcv import cargar
+        df_fino = cargar(symbol, base["backtest"].get("intrabar_tf", "15m"))
+    combos = combinaciones(grilla) or [{}]
+
+    # señales una vez por combinación de estrategia (toda la historia)
+    senales = {}
+    for p in combos:
+        k = _clave_estrategia(p)
+        if k not in senales:
+            senales[k] = senales_vectorizadas(df, aplicar(base, p)["estrategia"], cache=desde_cfg(base))
+
+    ts = df["ts"].to_numpy("int64") if "ts" in df.columns else \
+        (pd.to_datetime(df["time"], utc=True).astype("int64") // 1_000_000).to_numpy()
+    vs = ventanas(ts, train_dias, test_dias, anclada)
+    tareas = [(iv, ic, p, a, b) for iv, (a, b, _) in enumerate(vs) for ic, p in enumerate(combos)]
+    puntajes = np.full((len(vs), len(combos)), -np.inf)
+    metricas_train: Dict[Tuple[int, int], Dict] = {}
+
+    init = (symbol, tf, df, senales, base, df_fino)
+    workers = procesos or os.cpu_count() or 1
+    if workers == 1 or len(tareas) <= 1:
+        _init_worker(*init)
+        resultados = list(map(_evaluar, tareas))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init) as ex:
+            resultados = list(ex.map(_evaluar, tareas, chunksize=max(1, len(tareas) // (4 * workers))))
+    for iv, ic, m in resultados:
+        metricas_train[(iv, ic)] = m
+        puntajes[iv, ic] = _puntaje(m, objetivo, min_trades)
+
+    # OOS: mejor set de cada train sobre su test, equity encadenada
+    _init_worker(*init)
+    capital = float(base["capital"].get("total_usdt", 1000.0))
+    acumulado = capital
+    filas, trades_oos, equity = [], [], []
+    for iv, (a, b, c) in enumerate(vs):
+        ic = int(np.argmax(puntajes[iv])) if np.isfinite(puntajes[iv]).any() else 0
+        params = combos[ic]
+        tr, audit, eq = _correr(params, b, c)
+        equity.extend((t, acumulado + (e - capital)) for t, e in eq)
+        m = metricas(tr, acumulado)
+        acumulado += m["pnl"]
+        trades_oos.extend(tr)
+        filas.append({
+            "ventana": iv,
+            "train": (int(ts[a]), int(ts[b - 1])), "test": (int(ts[b]), int(ts[c - 1])),
+            "params": params, "train_metricas": metricas_train.get((iv, ic)), "test_metricas": m,
+        })
+
+    res = {
+        "ventanas": filas, "trades": trades_oos, "equity": equity,
+        "oos": metricas(trades_oos, capital), "estabilidad": estabilidad([f["params"] for f in filas]),
+        "combinaciones": len(combos), "tiempo_s": round(time.time() - t0, 2),
+    }
+    LOG.info("WF %s %s: %d ventanas x %d combos en %.1fs | OOS pnl=%.2f",
+             symbol, tf, len(vs), len(combos), res["tiempo_s"], res["oos"]["pnl"])
+    return res
+
+
+def estabilidad(elegidos: List[Dict]) -> Dict[str, Dict]:
+    """Por parámetro: moda, % de ventanas con la moda, cambios entre ventanas y CV si es numérico."""
+    out = {}
+    claves = sorted({k for p in elegidos for k in p})
+    for k in claves:
+        vals = [p.get(k) for p in elegidos]
+        moda, n = Counter(map(repr, vals)).most_common(1)[0]
+        d = {
+            "valores": vals,
+            "moda": next(v for v in vals if repr(v) == moda),
+            "pct_moda": 100.0 * n / len(vals),
+            "cambios": sum(1 for x, y in zip(vals, vals[1:]) if x != y),
+        }
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in vals):
+            arr = np.asarray(vals, dtype=float)
+            d["cv"] = float(arr.std() / abs(arr.mean())) if arr.mean() else 0.0
+        out[k] = d
+    return out
+
+
+def main():
+    import argparse, json
+    from utils.settings import load_settings
+    from datos.cache_ohlcv import cargar
+
+    ap = argparse.ArgumentParser(description="Walk-forward sobre el cache OHLCV")
+    ap.add_argument("--symbol", default="ETHUSDT")
+    ap.add_argument("--tf", default=None)
+    ap.add_argument("--settings", default="config/settings.json")
+    ap.add_argument("--procesos", type=int, default=None)
+    ap.add_argument("--salida", default=None, help="JSON con el resultado")
+    args = ap.parse_args()
+
+    cfg, _ = load_settings(args.settings)
+    wf = (cfg.get("backtest", {}) or {}).get("walkforward", {}) or {}
+    tf = args.tf or cfg.get("estrategia", {}).get("tf", "15m")
+    cfg.setdefault("estrategia", {})["tf"] = tf
+    df = cargar(args.symbol, tf)
+    res = walk_forward(args.symbol, tf, df, cfg, wf.get("grilla", {}),
+                       train_dias=wf.get("train_dias", 90), test_dias=wf.get("test_dias", 30),
+                       anclada=wf.get("anclada", False), objetivo=wf.get("objetivo", "pnl_dd"),
+                       min_trades=wf.get("min_trades", 10), procesos=args.procesos)
+    for f in res["ventanas"]:
+        print(f"[{f['ventana']}] {f['params']} -> OOS pnl={f['test_metricas']['pnl']:.2f} "
+              f"trades={f['test_metricas']['trades']}")
+    print(f"OOS total: {res['oos']} | {res['combinaciones']} combos | {res['tiempo_s']}s")
+    for k, d in res["estabilidad"].items():
+        print(f"  {k}: moda={d['moda']} ({d['pct_moda']:.0f}%) cambios={d['cambios']}")
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in res.items() if k != "equity"}, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
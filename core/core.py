@@ -13,6 +13,7 @@ from pathlib import Path
 from typing import Callable, Tuple
 from utils.logging_ex import get_logger, Section
 from utils.settings import load_settings
+from utils.reloj import RelojExchange, formatear_hora
 LOG = get_logger("core")
 
 # --- opcional: trazas de decisiAA3n de parcial ---
@@ -63,15 +64,34 @@ from adapters.bybit_private import (
     get_last_price,
     get_balance,
     fetch_position_for_symbol,
-    set_symbol_leverage,
+    fetch_position_snapshot,
+    sync_account_config,
+    ensure_symbol_config,
     load_symbol_filters,
     round_qty_to_step,
     adjust_qty_by_filters,
     place_market,
     clear_tpsl,
     set_trading_stop,
+    set_native_trailing,
+    place_reduce_limit,
+    get_open_orders,
+    cancel_order,
+    get_server_time_ms,
 )
 
+# Stream privado (execution/order/position)
+from adapters.bybit_stream import StreamPrivado
+from core.eventos_stream import aplicar_evento as stream_aplicar, vencer_pendientes as stream_vencer
+from core.trailing_base import modo as tr_modo, niveles_nativos as tr_niveles_nativos
+from core.partials import modo as parciales_modo, nivel_parcial
+from core.stops import GestorStops
+from core.niveles import IndiceNiveles
+from core.planificador import Planificador, atr_rapido
+from core.velas import AlmacenVelas
+from datos.cache_ohlcv import tf_a_ms
+from estrategia.htf import ContextoHTF
+
 # Persistencia
 try:
     from core.estado import cargar_estado, guardar_estado
@@ -107,6 +127,20 @@ ordenes_24h = 0
 # Cooldown trailing
 TRAILING_COOLDOWN = float(CFG.get("trailing", {}).get("cooldown_seg", 45.0))
 
+# SL/TP: estado confirmado local + coalescencia de movimientos por ciclo
+STOPS = GestorStops(
+    enviar=set_trading_stop,
+    min_mov_sl_pct=float(CFG.get("trailing", {}).get("min_mov_sl_pct", 0.05)),
+    frescura_s=float(CFG.get("stops", {}).get("frescura_s", 30.0)),
+)
+
+# Niveles de disparo por posición: por tick solo se compara el precio con la banda
+INDICE = IndiceNiveles()
+
+# Planificador de refresco por urgencia (None => todos los símbolos cada ciclo)
+PLAN_CFG = CFG.get("planificador", {}) if isinstance(CFG, dict) else {}
+_plan = None  # Planificador | None
+
 # Anti-fantasmas
 MANUAL_DETECT_DEBOUNCE = float(CFG.get("anti_fantasmas", {}).get("manual_detect_debounce_s", 90.0))
 POST_CLOSE_HOLDOFF     = float(CFG.get("anti_fantasmas", {}).get("post_close_holdoff_s", 45.0))
@@ -114,6 +148,13 @@ _miss_count = {}   # { symbol: int }   -> debounce para cierres
 _manual_seen = {}  # { symbol: {"sig": str, "ts": float} }
 _last_closed = {}  # { symbol: float }
 
+# Stream privado: con stream sano la reconciliación REST pasa a ser red de seguridad
+STREAM_CFG = CFG.get("stream", {}) if isinstance(CFG, dict) else {}
+STREAM_ENABLED = bool(STREAM_CFG.get("enabled", False))
+STREAM_RESYNC_S = float(STREAM_CFG.get("resync_s", 300.0))
+STREAM_STALE_S = float(STREAM_CFG.get("stale_s", 60.0))
+_stream = None  # StreamPrivado | None
+
 # ------------------ Hora (Bybit 1:1) ------------------
 import os, sys
 from datetime import datetime, timezone
@@ -134,18 +175,9 @@ except Exception:
     except Exception as e:
         raise ImportError(f"No se pudo importar core.partials ni .partials: {e}")
 
-# Zona horaria (opcional)
-try:
-    from zoneinfo import ZoneInfo
-except Exception:
-    ZoneInfo = None
-
-def _tz_cfg():
-    tcfg = CFG.get("tiempo", {}) if isinstance(CFG, dict) else {}
-    tzname = tcfg.get("zona_horaria", "UTC")
-    fmt = (tcfg.get("formato") or "utc").lower()
-    return tzname, fmt
-
+# Reloj del exchange: offset/RTT estimados cada `tiempo.sync_s`, lectura sin I/O
+RELOJ = RelojExchange(fuente=get_server_time_ms,
+                      intervalo_s=float(CFG.get("tiempo", {}).get("sync_s", 600)))
 
 def _tz_cfg():
     tcfg = CFG.get("tiempo", {}) if isinstance(CFG, dict) else {}
@@ -155,24 +187,10 @@ def _tz_cfg():
 
 def _fmt_hora_from_ms(ts_ms: int) -> str:
     tzname, fmt = _tz_cfg()
-    if fmt == "utc":
-        dt = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc)
-        return dt.strftime("%H:%M UTC")
-    if ZoneInfo:
-        try:
-            dt = datetime.fromtimestamp(ts_ms / 1000.0, tz=ZoneInfo(tzname))
-            return dt.strftime("%H:%M")
-        except Exception:
-            pass
-    dt = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc)
-    return dt.strftime("%H:%M UTC")
+    return formatear_hora(ts_ms, tzname, fmt)
 
 def _exchange_time_ms_fallback() -> int:
-    try:
-        from adapters.bybit_private import get_server_time_ms
-        return int(get_server_time_ms())
-    except Exception:
-        return int(time.time() * 1000)
+    return RELOJ.now_ms()
 
 def _hora_exchange_str() -> str:
     return _fmt_hora_from_ms(_exchange_time_ms_fallback())
@@ -224,6 +242,40 @@ def obtener_velas(simbolo: str, tf: str, n: int):
     bars = _retry(get_klines, (simbolo, interval, n), label=f"get_klines({simbolo},{interval},{n})")
     return _mapear_velas_bybit(bars)
 
+# Velas en vivo: un request incremental del TF base por símbolo y ciclo; los TF
+# mayores (estrategia.tf, filtros HTF) se derivan en memoria
+VELAS_CFG = CFG.get("velas", {}) if isinstance(CFG, dict) else {}
+ALMACEN = AlmacenVelas(obtener_velas, VELAS_CFG.get("base_tf") or CFG["estrategia"]["tf"],
+                       max_base=int(VELAS_CFG.get("max_base", 1000)), reloj=RELOJ.now_s)
+
+# Contexto 1h/4h de la estrategia: sale de las velas derivadas del almacén (sin REST)
+HTF = ContextoHTF()
+
+def contexto_htf(simbolo: str, velas):
+    """Estado HTF para generar_senal; None si el almacén no tiene las velas (usa el fallback)."""
+    try:
+        if not velas or velas[-1].get("time") is None or not ALMACEN.velas(simbolo, None, 1):
+            return None
+        return HTF.actualizar(simbolo, lambda htf: ALMACEN.velas(simbolo, htf), float(velas[-1]["time"]),
+                              tf_a_ms(CFG["estrategia"]["tf"]) // 1000, CFG.get("estrategia", {}))
+    except Exception as e:
+        logger.debug("HTF contexto %s: %s", simbolo, e)
+        return None
+
+def velas_ciclo(simbolo: str, tf: str, n: int):
+    """
+    Velas de `tf` desde el almacén; si no hay derivadas (stub) o el almacén no
+    se pudo actualizar va directo al REST (vacío => el símbolo se saltea en el ciclo).
+    """
+    try:
+        ALMACEN.actualizar(simbolo)
+        out = ALMACEN.velas(simbolo, tf, n)
+        if len(out) >= min(n, 2):
+            return out
+    except Exception as e:
+        logger.warning("ALMACEN velas %s %s: %s; uso REST directo", simbolo, tf, e)
+    return obtener_velas(simbolo, tf, n)
+
 def enviar_mensaje(cfg: dict, texto: str):
     return _retry(enviar_mensaje_raw, (cfg, texto), label="enviar_mensaje")
 
@@ -243,6 +295,7 @@ def _fetch_positions_dict():
             "entry_price": float(p.get("avgPrice") or 0.0),
             "sl": p.get("stopLoss"),
             "tp": p.get("takeProfit"),
+            "trailing": p.get("trailingStop"),
             "qty": float(p.get("qty") or 0.0),
         })
     return out
@@ -258,6 +311,13 @@ def seguridad_al_iniciar():
 
     resumen = []
     if MODO == "real":
+        # Cache de config de cuenta: leer lo vigente y corregir solo el drift
+        try:
+            sync_account_config(SIMBOLOS)
+            enviados = sum(_asegurar_config_cuenta(s) for s in SIMBOLOS)
+            logger.info("Config de cuenta reconciliada (%s requests)", enviados)
+        except Exception as e:
+            logger.warning("No pude reconciliar config de cuenta: %s", e)
         try:
             abiertas = _fetch_positions_dict()
             logger.info("Posiciones vivas (inicio): %s", len(abiertas))
@@ -355,6 +415,37 @@ def seguridad_al_iniciar():
         logger.error("No se pudo enviar mensaje de reconciliaciAA3n: %s", e)
 
 # ------------------ ReconciliaciAA3n periAA3dica ------------------
+def _notificar_cierre(sim: str, reg: dict, salida: float, motivo: str, qty: float = None):
+    """Mensaje de operación cerrada (duración real + PnL con fees)."""
+    side = "LONG" if "COMPRA" in reg.get("direccion", "") else "SHORT"
+    entry = float(reg.get("entrada_precio") or salida)
+    salida = float(salida or entry)
+    qty = float(reg.get("qty", 0.0) if qty is None else qty)
+
+    t_in = float(reg.get("ts_entry", 0.0)) or 0.0
+    dur_min = int((RELOJ.now_s() - t_in) / 60) if t_in > 0 else 0
+
+    if side == "LONG":
+        resultado_pct = ((salida / entry) - 1.0) * 100.0
+    else:
+        resultado_pct = ((entry / salida) - 1.0) * 100.0
+    pnl = calcular_pnl(side, entry, salida, qty, CFG)
+    impacto_pct = impacto_sobre_capital(pnl["neto"], CFG)
+    enviar_mensaje(
+        CFG,
+        msg_operacion_cerrada(
+            sim,
+            reg["direccion"],
+            entry,
+            salida,
+            resultado_pct,
+            pnl["neto"],
+            duracion_min=dur_min,
+            impacto_pct=impacto_pct,
+            motivo=motivo,
+        ),
+    )
+
 def _desired_sl_tp(entry: float, side: str) -> Tuple[float, float]:
     stop = CFG["riesgo"]["stop_pct"] / 100.0
     take = CFG["riesgo"]["take_pct"] / 100.0
@@ -363,6 +454,25 @@ def _desired_sl_tp(entry: float, side: str) -> Tuple[float, float]:
     else:
         return entry * (1 + stop), entry * (1 - take)
 
+def _diff_pct(a, b) -> float:
+    try:
+        return abs((float(a) - float(b)) / float(b)) * 100.0
+    except Exception:
+        return 100.0
+
+def _asegurar_config_cuenta(simbolo: str) -> int:
+    """Leverage / modo posición / margen desde el cache local; reenvía solo el drift."""
+    fut = CFG.get("futuros", {}) or {}
+    try:
+        return ensure_symbol_config(
+            simbolo,
+            lev=int(fut.get("leverage", 10)),
+            margin_mode=str(fut.get("margin_mode", "isolated")),
+        )
+    except Exception as e:
+        logger.warning("No pude alinear config de cuenta en %s: %s", simbolo, e)
+        return 0
+
 def reconciliar_con_exchange_periodico():
     """Manual OPEN/CLOSE robusto + realineo SL/TP con debounce anti-fantasma."""
     global estado_pares, ordenes_24h, _miss_count
@@ -479,35 +589,11 @@ def reconciliar_con_exchange_periodico():
                         if salida >= sl_obj - tol: motivo = "Stop Loss"
                         elif salida <= tp_obj + tol: motivo = "Take Profit"
 
-                    # duraciAA3n real
-                    t_in = float(reg.get("ts_entry", 0.0)) or 0.0
-                    dur_min = int((time.time() - t_in) / 60) if t_in > 0 else 0
-
-                    qty = float(reg.get("qty", 0.0))
-                    if side == "LONG":
-                        resultado_pct = ((salida / entry) - 1.0) * 100.0
-                        pnl = calcular_pnl("LONG", entry, salida, qty, CFG)
-                    else:
-                        resultado_pct = ((entry / salida) - 1.0) * 100.0
-                        pnl = calcular_pnl("SHORT", entry, salida, qty, CFG)
-
-                    impacto_pct = impacto_sobre_capital(pnl["neto"], CFG)
-                    enviar_mensaje(
-                        CFG,
-                        msg_operacion_cerrada(
-                            sim,
-                            reg["direccion"],
-                            entry,
-                            salida,
-                            resultado_pct,
-                            pnl["neto"],
-                            duracion_min=dur_min,
-                            impacto_pct=impacto_pct,
-                            motivo=motivo,
-                        ),
-                    )
+                    _notificar_cierre(sim, reg, salida, motivo, qty=float(reg.get("qty", 0.0)))
                 except Exception as e:
                     logger.error("No pude notificar cierre %s: %s", sim, e)
+                _cancelar_parcial_residente(sim, reg)
+                STOPS.olvidar(sim)
                 ordenes_24h += 1
             else:
                 _miss_count[sim] = 0  # hay posiciAA3n, reseteo
@@ -522,18 +608,234 @@ def reconciliar_con_exchange_periodico():
                     except Exception:
                         return 100.0
                 need_set = (p["sl"] is None or p["tp"] is None) or (_diff_pct(p["sl"], sl_obj) > 0.1) or (_diff_pct(p["tp"], tp_obj) > 0.1)
+                STOPS.confirmar(sim, "Buy" if p["side"] == "LONG" else "Sell", p["entry_price"], p["sl"], p["tp"])
                 if MODO == "real" and need_set:
-                    with Section(LOG, "Heartbeat: alinear SL/TP", simbolo=sim, side=p["side"], sl=sl_obj, tp=tp_obj):
-                        ok, resp = set_trading_stop(sim, take_profit=tp_obj, stop_loss=sl_obj)
-                    if not ok and "not modified" not in str(resp).lower():
-                        logger.warning("No pude alinear SL/TP en %s: %s", sim, resp)
+                    # se coalesce con el trailing del mismo ciclo (flush al final del loop)
+                    STOPS.proponer(sim, sl=sl_obj, tp=tp_obj)
             except Exception as e:
                 logger.error("AlineaciAA3n SL/TP fallo %s: %s", sim, e)
 
+        # 4) Trailing/parcial residentes en el exchange
+        _supervisar_residentes(idx)
+        INDICE.invalidar()
+
         guardar_estado({"pares": estado_pares, "ordenes_24h": ordenes_24h})
     except Exception as e:
         logger.error("reconciliar_con_exchange_periodico fallo: %s", e)
 
+# ------------------ Protecciones residentes en el exchange ------------------
+def _residente(tipo: str) -> bool:
+    """trailing.modo / partials.modo == 'exchange' (solo REAL)."""
+    if MODO != "real":
+        return False
+    if tipo == "trailing":
+        return tr_modo(CFG) == "exchange"
+    return parciales_modo(CFG) == "exchange" and bool(CFG.get("partials", {}).get("enabled", True))
+
+def _armar_residente(sim: str, reg: dict) -> bool:
+    """
+    Deja en el exchange el trailing nativo (distancia/activación en R) y el
+    parcial como limit reduce-only al precio de at_R. Idempotente: solo arma
+    lo que falta según reg["residente"]. Devuelve True si envió algo.
+    """
+    res = reg.setdefault("residente", {})
+    enviado = False
+    es_long = "COMPRA" in str(reg.get("direccion", ""))
+
+    if _residente("trailing") and not res.get("trailing_armado"):
+        from core.trailing_base import inicializar as tr_init, preparar_posicion as tr_prep
+        tr = reg.get("trailing")
+        if not tr or tr.get("entry") is None:
+            tr = tr_prep(tr or tr_init(CFG), "LONG" if es_long else "SHORT", reg["entrada_precio"], CFG)
+            reg["trailing"] = tr
+        niv = tr_niveles_nativos(tr)
+        if niv:
+            with Section(LOG, "Trailing nativo", simbolo=sim, distancia=niv["distance"], activacion=niv["active_price"]):
+                ok, resp = set_native_trailing(sim, niv["distance"], niv["active_price"])
+            enviado = True
+            res["trailing_armado"] = bool(ok)
+            if not ok:
+                logger.warning("No pude armar trailing nativo en %s: %s", sim, resp)
+
+    if _residente("partials") and not reg.get("partial_done") and not res.get("parcial_order_id"):
+        precio, qty = nivel_parcial(reg, CFG)
+        f = load_symbol_filters(sim) or {}
+        qty = round_qty_to_step(qty, float(f.get("step") or 0.0))
+        if precio <= 0 or qty <= 0 or qty < float(f.get("min_qty") or 0.0):
+            logger.info("PARCIAL SKIPPED: sym=%s (qty residente=%.8f bajo min_qty/step)", sim, qty)
+            reg["partial_done"] = True
+            return enviado
+        with Section(LOG, "Parcial residente", simbolo=sim, precio=precio, qty=qty):
+            ok, oid = place_reduce_limit(sim, "sell" if es_long else "buy", qty, precio,
+                                         order_link_id=f"parcial-{sim}-{int(time.time())}")
+        enviado = True
+        if ok and oid:
+            res.update({"parcial_order_id": oid, "parcial_precio": precio, "parcial_qty": qty,
+                        "qty_base": float(reg.get("qty") or 0.0)})
+        else:
+            logger.warning("No pude dejar parcial residente en %s: %s", sim, oid)
+    return enviado
+
+def _cancelar_parcial_residente(sim: str, reg: dict):
+    """Al cerrar, retira el limit de parcial si quedó vivo."""
+    oid = (reg.get("residente") or {}).get("parcial_order_id")
+    if MODO != "real" or not oid:
+        return
+    ok, resp = cancel_order(sim, oid)
+    if not ok:
+        logger.warning("No pude cancelar parcial residente %s (%s): %s", sim, oid, resp)
+    reg.pop("residente", None)
+
+def _supervisar_residentes(idx: dict):
+    """
+    Re-sync de lo residente (en el ciclo de reconciliación, no por tick):
+    re-arma el trailing si desapareció y repone el limit del parcial si fue
+    cancelado sin llenarse.
+    """
+    for sim, reg in list(estado_pares.items()):
+        res = reg.get("residente")
+        p = idx.get(sim)
+        if not res or not reg.get("posicion_abierta") or not p:
+            continue
+        try:
+            if res.get("trailing_armado") and not p.get("trailing"):
+                logger.warning("[%s] Trailing nativo ausente en exchange: re-armo", sim)
+                res["trailing_armado"] = False
+            oid = res.get("parcial_order_id")
+            if oid and not reg.get("partial_done"):
+                ordenes = get_open_orders(sim)
+                if ordenes is None:
+                    logger.warning("[%s] No pude leer órdenes abiertas: supervisión residente en el próximo ciclo", sim)
+                    continue
+                vivas = {str(o.get("orderId")) for o in ordenes}
+                if oid not in vivas:
+                    if float(p.get("qty") or 0.0) < float(res.get("qty_base") or 0.0):
+                        reg["partial_done"] = True  # se llenó (el stream pudo perder el evento)
+                    else:
+                        logger.warning("[%s] Parcial residente %s no está en el libro: repongo", sim, oid)
+                    res.pop("parcial_order_id", None)
+            _armar_residente(sim, reg)
+        except Exception as e:
+            logger.error("Supervisión residente fallo %s: %s", sim, e)
+
+# ------------------ Stream privado ------------------
+def _iniciar_stream():
+    """Arranca el stream privado (solo REAL y si stream.enabled)."""
+    global _stream
+    if MODO != "real" or not STREAM_ENABLED:
+        return None
+    try:
+        _stream = StreamPrivado(SIMBOLOS, snapshot=fetch_position_snapshot,
+                                stale_s=STREAM_STALE_S).iniciar()
+    except Exception as e:
+        logger.error("No pude iniciar stream privado (sigo con polling): %s", e)
+        _stream = None
+    return _stream
+
+def _iniciar_planificador():
+    global _plan
+    if not PLAN_CFG.get("enabled", False):
+        return None
+    _plan = Planificador(
+        SIMBOLOS,
+        tf_s=float(_tf_to_interval(CFG["estrategia"]["tf"])) * 60.0,
+        min_s=float(PLAN_CFG.get("min_s", 2.0)),
+        max_s=float(PLAN_CFG.get("max_s", 60.0)),
+        presupuesto_rps=float(PLAN_CFG.get("presupuesto_rps", 2.0)),
+        rafaga=float(PLAN_CFG.get("rafaga", 6.0)),
+        escala_atr=float(PLAN_CFG.get("escala_atr", 1.0)),
+        escala_pct=float(PLAN_CFG.get("escala_pct", 0.5)),
+        ventana_vela_s=float(PLAN_CFG.get("ventana_vela_s", 30.0)),
+    )
+    logger.info("Planificador por urgencia activo (%s símbolos)", len(SIMBOLOS))
+    return _plan
+
+def _stream_sano() -> bool:
+    return _stream is not None and _stream.activo()
+
+def _procesar_acciones_stream(acciones):
+    global ordenes_24h
+    cambios = False
+    for a in acciones or []:
+        sim = a.get("symbol")
+        reg = estado_pares.get(sim) or {}
+        cambios = True
+        try:
+            if a["accion"] == "cierre":
+                _last_closed[sim] = time.time()
+                _miss_count[sim] = 0
+                ordenes_24h += 1
+                salida = a.get("precio") or get_last_price(sim) or reg.get("entrada_precio", 0.0)
+                logger.info("STREAM CIERRE %s motivo=%s precio=%s qty=%s", sim, a.get("motivo"), salida, a.get("qty"))
+                _notificar_cierre(sim, reg, salida, a.get("motivo") or "Cierre manual/externo", qty=a.get("qty"))
+                _cancelar_parcial_residente(sim, reg)
+                STOPS.olvidar(sim)
+            elif a["accion"] == "parcial":
+                logger.info("STREAM PARCIAL %s motivo=%s precio=%.6f qty=%.6f resto=%.6f",
+                            sim, a.get("motivo"), float(a.get("precio") or 0.0),
+                            float(a.get("qty_cerrada") or 0.0), float(a.get("qty_restante") or 0.0))
+                if a.get("notificar"):
+                    qty_prev = float(a.get("qty_cerrada") or 0.0) + float(a.get("qty_restante") or 0.0)
+                    notifier.parcial(
+                        CFG,
+                        simbolo=sim,
+                        is_long=str(reg.get("direccion", "")).upper().startswith("COMPRA"),
+                        fraction=(float(a.get("qty_cerrada") or 0.0) / qty_prev) if qty_prev > 0 else 0.0,
+                        pnl_usdt=float(reg.get("pnl_realizado") or 0.0),
+                        qty_restante=float(a.get("qty_restante") or 0.0),
+                        precio_ejecucion=float(a.get("precio") or 0.0),
+                        at_r=float(_resolve_partials_cfg(CFG)[0]),
+                    )
+            elif a["accion"] == "apertura_externa":
+                logger.info("STREAM apertura externa en %s -> reconciliar", sim)
+                reconciliar_con_exchange_periodico()
+            elif a["accion"] == "confirmar":
+                if _stream is not None:
+                    _stream.marcar_gap(f"confirmar cierre {sim}")
+        except Exception as e:
+            logger.error("Accion de stream fallo %s: %s", a, e)
+    if cambios:
+        guardar_estado({"pares": estado_pares, "ordenes_24h": ordenes_24h})
+
+def _esperar_eventos_stream(segundos: float):
+    """
+    Reemplaza el sleep del loop: aplica los eventos del stream apenas llegan
+    (latencia sub-segundo) y vuelve cuando se cumple el intervalo.
+    """
+    if _stream is None:
+        time.sleep(segundos)
+        return
+    import queue as _queue
+    fin = time.time() + float(segundos)
+    try:
+        _stream.resync_si_corresponde()
+    except Exception as e:
+        logger.error("STREAM resync fallo: %s", e)
+    while True:
+        restante = fin - time.time()
+        if restante <= 0:
+            break
+        try:
+            ev = _stream.eventos.get(timeout=min(restante, 0.5))
+        except _queue.Empty:
+            ev = None
+        acciones = []
+        if ev is not None:
+            try:
+                acciones = stream_aplicar(estado_pares, ev)
+            except Exception as e:
+                logger.error("STREAM evento fallo %s: %s", ev, e)
+            if ev.get("symbol"):
+                INDICE.invalidar(ev["symbol"])
+                if _plan is not None:
+                    _plan.forzar(ev["symbol"])
+            if ev.get("tipo") in ("posicion", "snapshot") and float(ev.get("qty") or 0.0) > 0:
+                STOPS.confirmar(ev["symbol"], ev.get("side"), ev.get("avgPrice"),
+                                ev.get("stopLoss"), ev.get("takeProfit"))
+        acciones += stream_vencer(estado_pares)
+        if acciones:
+            _procesar_acciones_stream(acciones)
+
 # ------------------ Utilidades ------------------
 def _hay_posicion_en_exchange(simbolo: str) -> bool:
     if MODO != "real":
@@ -682,6 +984,36 @@ def _ejecutar_parcial_si_corresponde(simbolo: str, reg: dict, precio_actual: flo
 
 
 
+def _notificar_trailing(sim: str, reg: dict, nuevo_sl_ex: float, now: float):
+    pivote_tf = _cfg_section(CFG, 'trailing').get("pivote_tf", "15m")
+    pivote_tf_txt = "15 minutos" if pivote_tf == "15m" else pivote_tf
+    enviar_mensaje(
+        CFG,
+        msg_trailing_seguimiento(
+            sim, pivote_tf_txt, _cfg_section(CFG, 'trailing')["buffer_pct"], nuevo_sl_ex
+        ) + f"\nHora: {_hora_exchange_str()}"
+    )
+    reg["trailing"]["ultimo_sl_notificado"] = float(nuevo_sl_ex)
+    reg["trailing"]["ultimo_ts_notif"] = now
+    guardar_estado({"pares": estado_pares, "ordenes_24h": ordenes_24h})
+
+def _flush_stops(trailing_propuesto: dict, now: float):
+    """Envía lo pendiente en STOPS y notifica los trailing que quedaron aplicados."""
+    if not STOPS.pendiente:
+        return
+    with Section(LOG, "Stops flush", pendientes=len(STOPS.pendiente)):
+        resultados = STOPS.flush()
+    for sim, r in resultados.items():
+        if not r["ok"]:
+            logger.warning("[Bybit] fallo al mover SL/TP en %s: %s", sim, r["resp"])
+            continue
+        reg = estado_pares.get(sim) or {}
+        if sim in trailing_propuesto and r["sl"] is not None and reg.get("trailing"):
+            try:
+                _notificar_trailing(sim, reg, r["sl"], now)
+            except Exception as e:
+                logger.error("No se pudo enviar trailing %s: %s", sim, e)
+
 def _partial_step(sim, reg, precio):
     """Chequea, ejecuta y loguea el PARCIAL una sola vez por ciclo."""
     # 1) Decidir si corresponde
@@ -714,8 +1046,8 @@ def _partial_step(sim, reg, precio):
 
     # 4) BLINDAJE min_qty/step (traza previa; el ajuste final lo hace el executor)
     try:
-        pos = fetch_position_for_symbol(sim) if "fetch_position_for_symbol" in globals() else {"qty": reg.get("qty", 0.0)}
-        qty_open = float(pos.get("qty", reg.get("qty", 0.0)) or 0.0)
+        # qty local (stream/reconciliación la mantienen); el executor ajusta contra el exchange
+        qty_open = float(reg.get("qty", 0.0) or 0.0)
         target = qty_open * float(frac_res)
 
         step = 0.0
@@ -807,13 +1139,19 @@ def _actualizar_estado_por_senal(simbolo: str, senal: dict):
     _ = float(qty_txt)
 
     entry_price = float(senal["precio"])
+    tpsl_adjunto = False
     if MODO == "real":
-        try:
-            set_symbol_leverage(simbolo, lev=int(CFG.get("futuros", {}).get("leverage", 10)))
-        except Exception as e:
-            logger.warning("No pude setear leverage en %s: %s", simbolo, e)
-
-        ok, resp = place_market(simbolo, side_bybit, qty_norm)
+        # leverage / modo posición / margen: solo se reenvían si hay drift
+        _asegurar_config_cuenta(simbolo)
+
+        # Market con TP/SL adjuntos (un solo request, sin ventana desprotegida)
+        sl_sig, tp_sig = _desired_sl_tp(entry_price, direccion_tr)
+        with Section(LOG, "Entrada MARKET + TP/SL", simbolo=simbolo, side=side_bybit, qty=qty_norm, sl=sl_sig, tp=tp_sig):
+            ok, resp = place_market(simbolo, side_bybit, qty_norm, take_profit=tp_sig, stop_loss=sl_sig)
+        tpsl_adjunto = ok
+        if not ok and any(k in str(resp).lower() for k in ("takeprofit", "stoploss", "tpsl", "tp/sl")):
+            logger.warning("TP/SL adjunto rechazado en %s (%s); reintento sin TP/SL", simbolo, resp)
+            ok, resp = place_market(simbolo, side_bybit, qty_norm)
         if not ok:
             logger.error("Fallo orden MARKET %s: %s", simbolo, resp)
             return
@@ -827,6 +1165,7 @@ def _actualizar_estado_por_senal(simbolo: str, senal: dict):
         qty_norm = float(pos.get("qty") or qty_norm)
 
     # Estado base
+    INDICE.invalidar(simbolo)
     estado_pares[simbolo] = {
         "posicion_abierta": True,
         "direccion": direccion_txt,
@@ -899,15 +1238,22 @@ def _actualizar_estado_por_senal(simbolo: str, senal: dict):
     else:
         sl_precio = entry_price * (1 + CFG["riesgo"]["stop_pct"] / 100.0)
         tp_precio = entry_price * (1 - CFG["riesgo"]["take_pct"] / 100.0)
-    if MODO == "real":
+    # Con TP/SL adjuntos solo se re-ancla al precio real si el fill se desvió > 0.1%
+    need_set = (not tpsl_adjunto) or (_diff_pct(sl_precio, sl_sig) > 0.1) or (_diff_pct(tp_precio, tp_sig) > 0.1)
+    if MODO == "real" and need_set:
         try:
             ok, resp = set_trading_stop(simbolo, take_profit=tp_precio, stop_loss=sl_precio)
             if not ok and "not modified" not in str(resp).lower():
                 logger.error("set_trading_stop fallo %s: %s", simbolo, resp)
         except Exception as e:
             logger.error("set_trading_stop error %s: %s", simbolo, e)
-        if not ok and "not modified" not in str(resp).lower():
-            logger.error("set_trading_stop fallo %s: %s", simbolo, resp)
+    if MODO == "real":
+        STOPS.confirmar(simbolo, side_bybit, entry_price,
+                        sl_precio if need_set else sl_sig, tp_precio if need_set else tp_sig)
+
+    # Trailing nativo + parcial limit: desde acá el loop solo supervisa
+    if MODO == "real" and _armar_residente(simbolo, estado_pares[simbolo]):
+        guardar_estado({"pares": estado_pares, "ordenes_24h": ordenes_24h})
 
     try:
         enviar_mensaje(
@@ -1049,51 +1395,89 @@ def loop():
     ultimo_hb = time.time()
     intervalo = int(CFG.get("heartbeat", {}).get("cada_minutos", 30)) * 60
 
+    # Stream privado: si está sano, el polling REST queda como red de seguridad
+    _iniciar_stream()
+
     ultimo_sync = time.time()
     sync_interval = 15  # s
 
+    # Refresco por urgencia (cerca de un disparo: rápido; plano y sin vela nueva: lento)
+    _iniciar_planificador()
+    ultimas_senales = {}
+
     from core.trailing_base import inicializar as tr_init, preparar_posicion as tr_prep, actualizar as tr_update
 
     while True:
         try:
+            RELOJ.tick()
             senal_por_simbolo = {}
 
             # 1) SeAAales
-            for sim in SIMBOLOS:
+            precios_ciclo = {}
+            for sim in (_plan.vencidos() if _plan is not None else SIMBOLOS):
                 try:
-                    velas = obtener_velas(sim, CFG["estrategia"]["tf"], 250)
+                    velas = velas_ciclo(sim, CFG["estrategia"]["tf"], 250)
+                    precios_ciclo[sim] = float(velas[-1]["close"])
                 except Exception as e:
                     logger.error("obtener_velas() fallo %s: %s", sim, e)
                     continue
 
                 try:
-                    s = generar_senal(velas, estado_estrategia.get(sim, {}), CFG)
+                    estado_sim = estado_estrategia.get(sim, {})
+                    htf = contexto_htf(sim, velas)
+                    if htf is not None:
+                        estado_sim = dict(estado_sim, htf=htf)
+                    s = generar_senal(velas, estado_sim, CFG)
                     senal_por_simbolo[sim] = s
                     _actualizar_estado_por_senal(sim, s)
                 except Exception as e:
                     logger.error("generar_senal/_actualizar_estado fallo %s: %s", sim, e)
 
+                if _plan is not None:
+                    reg_sim = estado_pares.get(sim) or {}
+                    _plan.registrar(sim, precios_ciclo[sim], niveles=INDICE.niveles.get(sim),
+                                    atr=atr_rapido(velas), abierta=bool(reg_sim.get("posicion_abierta")))
+            ultimas_senales.update(senal_por_simbolo)
+
             # 2) Trailing + (SIM: cierres por TP/SL)
             now = time.time()
+            trailing_propuesto = {}
             for sim, reg in list(estado_pares.items()):
+                precio = None
                 try:
                     if not reg.get("posicion_abierta"):
                         continue
 
                     direccion = "LONG" if "COMPRA" in reg["direccion"] else "SHORT"
+                    tr_ex, pa_ex = _residente("trailing"), _residente("partials")
+                    if tr_ex and pa_ex and _stream_sano():
+                        continue  # todo residente: nada que hacer por tick
+                    if _plan is not None and sim not in precios_ciclo:
+                        continue  # no le tocó refresco en este ciclo
                     try:
-                        velas_sim = obtener_velas(sim, CFG["estrategia"]["tf"], 250)
-                        precio = velas_sim[-1]["close"]
+                        # precio del paso 1 (evita pedir las velas dos veces)
+                        precio = precios_ciclo.get(sim)
+                        if precio is None:
+                            precio = float(obtener_velas(sim, CFG["estrategia"]["tf"], 250)[-1]["close"])
                         # === Sensores de notificaciones (parcial / trailing) ===
-                        _notify_partial_if_detected(CFG, sim, reg, float(precio))
-                        _notify_trailing_close_if_detected(CFG, sim, reg, float(precio))
+                        # Con stream, parciales y cierres llegan como eventos exactos.
+                        if not _stream_sano():
+                            _notify_partial_if_detected(CFG, sim, reg, float(precio))
+                            _notify_trailing_close_if_detected(CFG, sim, reg, float(precio))
                         # === fin sensores ===
+                        if not INDICE.cruzado(sim, float(precio)):
+                            continue  # ningún nivel cruzado: nada que hacer
+                        INDICE.invalidar(sim)  # se reconstruye tras el trabajo
                         # ---- Diag del parcial (R/MFE y motivo de skip) ----
-                        _partial_step(sim, reg, float(precio))
+                        if not pa_ex:
+                            _partial_step(sim, reg, float(precio))
                     except Exception as e:
                         logger.error("obtener_velas() fallo %s: %s", sim, e)
                         continue
 
+                    if tr_ex:
+                        continue  # el trailing corre en el exchange
+
                     tr_estado = reg.get("trailing")
                     if tr_estado is None:
                         tr_estado = tr_init(CFG.get("trailing", {}))
@@ -1145,35 +1529,12 @@ def loop():
                     if aplica_candidato:
                         try:
                             nuevo_sl_ex = _round_to_tick(sim, float(nuevo_sl))
-
-                            aplicado_en_exchange = False
                             if MODO == "real":
-                                with Section(LOG, "Trailing mover SL", simbolo=sim, nuevo_sl=nuevo_sl_ex):
-                                    ok_set, resp = set_trading_stop(sim, take_profit=None, stop_loss=nuevo_sl_ex)
-                                if ok_set:
-                                    aplicado_en_exchange = True
-                                else:
-                                    if "not modified" in str(resp).lower():
-                                        logger.info("[Bybit] trailing no cambiAA3 en %s: %s", sim, resp)
-                                    else:
-                                        logger.warning("[Bybit] fallo al mover SL trailing en %s: %s", sim, resp)
+                                # se envía en STOPS.flush() al final del ciclo
+                                STOPS.proponer(sim, sl=nuevo_sl_ex)
+                                trailing_propuesto[sim] = nuevo_sl_ex
                             else:
-                                aplicado_en_exchange = True  # en SIM
-
-                            if aplicado_en_exchange:
-                                pivote_tf = _cfg_section(CFG, 'trailing').get("pivote_tf", "15m")
-                                pivote_tf_txt = "15 minutos" if pivote_tf == "15m" else pivote_tf
-                                enviar_mensaje(
-                                    CFG,
-                                    msg_trailing_seguimiento(
-                                        sim, pivote_tf_txt, _cfg_section(CFG, 'trailing')["buffer_pct"], nuevo_sl_ex
-                                    ) + f"\nHora: {_hora_exchange_str()}"
-                                )
-
-                                reg["trailing"]["ultimo_sl_notificado"] = float(nuevo_sl_ex)
-                                reg["trailing"]["ultimo_ts_notif"] = now
-                                guardar_estado({"pares": estado_pares, "ordenes_24h": ordenes_24h})
-
+                                _notificar_trailing(sim, reg, nuevo_sl_ex, now)  # en SIM
                         except Exception as e:
                             logger.error("No se pudo aplicar/enviar trailing %s: %s", sim, e)
                     else:
@@ -1234,18 +1595,26 @@ def loop():
 
                 except Exception as e:
                     logger.error("Loop trailing/cierre fallo %s: %s", sim, e)
+                finally:
+                    if precio is not None and reg.get("posicion_abierta") and sim not in INDICE:
+                        INDICE.construir(sim, reg, CFG, float(precio))
 
             # 3) Heartbeat
             if time.time() - ultimo_hb >= intervalo:
-                _enviar_heartbeat_con_estado(senal_por_simbolo)
+                _enviar_heartbeat_con_estado(ultimas_senales)
                 ultimo_hb = time.time()
 
             # 4) ReconciliaciAA3n periAA3dica con exchange
-            if MODO == "real" and (time.time() - ultimo_sync >= sync_interval):
+            intervalo_sync = STREAM_RESYNC_S if _stream_sano() else sync_interval
+            if MODO == "real" and (time.time() - ultimo_sync >= intervalo_sync):
                 reconciliar_con_exchange_periodico()
                 ultimo_sync = time.time()
 
-            time.sleep(5)
+            # 5) SL/TP coalescidos: un request por símbolo con la mejor propuesta
+            if MODO == "real":
+                _flush_stops(trailing_propuesto, now)
+
+            _esperar_eventos_stream(_plan.espera(5.0) if _plan is not None else 5)
 
         except Exception as e:
             logger.exception("IteraciAA3n principal fallo: %s", e)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Aplica eventos del stream privado (adapters.bybit_stream) a estado_pares.
+
+No envía mensajes ni toca el exchange: devuelve una lista de "acciones"
+que el core ejecuta (notificar cierre/parcial, reconciliar apertura externa).
+Así se puede testear contra un stand-in con mensajes grabados.
+
+Acciones:
+  {"accion": "cierre",  "symbol", "precio", "motivo", "qty"}
+  {"accion": "parcial", "symbol", "precio", "motivo", "qty_cerrada", "qty_restante", "notificar"}
+  {"accion": "apertura_externa", "symbol"}
+  {"accion": "confirmar", "symbol"}   snapshot sin posición: pedir otro resync antes de cerrar
+"""
+import time
+from typing import Dict, List
+
+_EPS_QTY = 1e-9
+GRACIA_CIERRE_S = 2.0   # espera de la ejecución tras ver size=0 en 'position'
+SNAPSHOTS_CIERRE = 2    # snapshots seguidos sin posición para cerrar (mismo debounce que el polling)
+
+
+def _es_long(reg: Dict) -> bool:
+    return str(reg.get("direccion", "")).upper().startswith("COMPRA")
+
+
+def _reduce(reg: Dict, side_orden: str) -> bool:
+    """Una orden reduce si va en contra del lado de la posición."""
+    s = str(side_orden or "").lower()
+    return (s == "sell") if _es_long(reg) else (s == "buy")
+
+
+def _motivo_cierre(reg: Dict, motivo: str) -> str:
+    # El SL movido por trailing figura en Bybit como StopLoss
+    if motivo == "Stop Loss":
+        tr = reg.get("trailing") or {}
+        if tr.get("ultimo_sl_notificado") is not None or tr.get("be_moved"):
+            return "Trailing Stop"
+    return motivo
+
+
+def _cerrar(reg: Dict, sym: str, precio, motivo: str, qty: float) -> Dict:
+    reg["posicion_abierta"] = False
+    reg["qty"] = 0.0
+    reg["precio_cierre"] = precio
+    reg["close_reason"] = motivo
+    reg.pop("_stream_ordenes", None)
+    reg.pop("_cierre_pendiente", None)
+    reg.pop("_snapshot_miss", None)
+    return {"accion": "cierre", "symbol": sym, "precio": precio, "motivo": motivo, "qty": qty}
+
+
+def aplicar_ejecucion(estado_pares: Dict, ev: Dict) -> List[Dict]:
+    sym = ev.get("symbol")
+    reg = estado_pares.get(sym)
+    if not reg or not reg.get("posicion_abierta"):
+        return []
+    if not _reduce(reg, ev.get("side")):
+        return []  # fill de entrada/aumento: lo confirma el evento de posición
+
+    qty_prev = float(reg.get("qty") or 0.0)
+    qty_exec = float(ev.get("qty") or 0.0)
+    if qty_exec <= 0:
+        return []
+
+    # acumular por orden (una orden puede llenarse en varias ejecuciones)
+    ords = reg.setdefault("_stream_ordenes", {})
+    o = ords.setdefault(ev.get("order_id") or ev.get("exec_id") or "?",
+                        {"qty": 0.0, "valor": 0.0, "motivo": ev.get("motivo")})
+    o["qty"] += qty_exec
+    o["valor"] += qty_exec * float(ev.get("precio") or 0.0)
+
+    qty_rest = max(0.0, qty_prev - qty_exec)
+    reg["qty"] = qty_rest
+    reg["_prev_qty"] = qty_rest
+    reg["_prev_qty_tr"] = qty_rest
+    vwap = (o["valor"] / o["qty"]) if o["qty"] > 0 else float(ev.get("precio") or 0.0)
+    reg["_ultimo_precio_exec"] = vwap
+    reg["_ultimo_motivo"] = o["motivo"]
+
+    if qty_rest <= _EPS_QTY:
+        motivo = _motivo_cierre(reg, o["motivo"])
+        return [_cerrar(reg, sym, vwap, motivo, o["qty"])]
+
+    if float(ev.get("leaves_qty") or 0.0) > _EPS_QTY:
+        return []  # orden todavía llenándose
+
+    ords.pop(ev.get("order_id") or ev.get("exec_id") or "?", None)
+    # Parcial residente (limit reduce-only del bot): nadie más lo notifica
+    res = reg.get("residente") or {}
+    if ev.get("order_id") and ev.get("order_id") == res.get("parcial_order_id"):
+        reg["partial_done"] = True
+        res.pop("parcial_order_id", None)
+        return [{
+            "accion": "parcial", "symbol": sym, "precio": vwap, "motivo": "Parcial",
+            "qty_cerrada": o["qty"], "qty_restante": qty_rest, "notificar": True,
+        }]
+    # El parcial a mercado del propio bot ya lo notifica core.partials
+    propio = bool(reg.get("partial_done")) and not reg.get("_parcial_confirmado") \
+        and o["motivo"] == "Cierre manual/externo"
+    if propio:
+        reg["_parcial_confirmado"] = True
+    return [{
+        "accion": "parcial", "symbol": sym, "precio": vwap,
+        "motivo": "Parcial" if propio else o["motivo"],
+        "qty_cerrada": o["qty"], "qty_restante": qty_rest,
+        "notificar": not propio,
+    }]
+
+
+def aplicar_posicion(estado_pares: Dict, ev: Dict) -> List[Dict]:
+    """Evento 'posicion' (stream) o 'snapshot' (resync REST): la qty es autoritativa."""
+    sym = ev.get("symbol")
+    reg = estado_pares.get(sym)
+    qty = float(ev.get("qty") or 0.0)
+    abierta_local = bool(reg and reg.get("posicion_abierta"))
+
+    if qty <= _EPS_QTY:
+        if not abierta_local:
+            return []
+        if ev.get("tipo") == "posicion":
+            # Bybit suele publicar 'position' antes que 'execution':
+            # esperamos la ejecución para tener motivo y precio exactos.
+            reg.setdefault("_cierre_pendiente", time.time())
+            return []
+        # snapshot REST tras un gap: confirmar con otro antes de cerrar
+        reg["_snapshot_miss"] = int(reg.get("_snapshot_miss") or 0) + 1
+        if reg["_snapshot_miss"] < SNAPSHOTS_CIERRE:
+            return [{"accion": "confirmar", "symbol": sym}]
+        # confirmado: usar lo último conocido
+        motivo = _motivo_cierre(reg, reg.get("_ultimo_motivo") or "Cierre manual/externo")
+        precio = reg.get("_ultimo_precio_exec")
+        return [_cerrar(reg, sym, precio, motivo, float(reg.get("qty") or 0.0))]
+
+    if not abierta_local:
+        return [{"accion": "apertura_externa", "symbol": sym}]
+
+    # size>0 después de un size=0 (flip, re-entrada externa, publicación
+    # desordenada): la posición sigue viva, no hay cierre pendiente
+    reg.pop("_snapshot_miss", None)
+    reg.pop("_cierre_pendiente", None)
+    if ev.get("side") in ("Buy", "Sell"):
+        reg["direccion"] = "COMPRA (LONG)" if ev["side"] == "Buy" else "VENTA (SHORT)"
+    reg["qty"] = qty
+    reg["_prev_qty"] = qty
+    reg["_prev_qty_tr"] = qty
+    if float(ev.get("avgPrice") or 0.0) > 0:
+        reg["entrada_precio"] = float(ev["avgPrice"])
+    reg["sl_exchange"] = ev.get("stopLoss")
+    reg["tp_exchange"] = ev.get("takeProfit")
+    reg["trailing_exchange"] = ev.get("trailingStop")
+    return []
+
+
+def vencer_pendientes(estado_pares: Dict, ahora: float = None, gracia_s: float = GRACIA_CIERRE_S) -> List[Dict]:
+    """Cierra las posiciones con size=0 cuya ejecución no llegó dentro de la gracia."""
+    ahora = time.time() if ahora is None else ahora
+    out = []
+    for sym, reg in list(estado_pares.items()):
+        t0 = reg.get("_cierre_pendiente")
+        if t0 is None or not reg.get("posicion_abierta"):
+            continue
+        if ahora - float(t0) >= gracia_s:
+            motivo = _motivo_cierre(reg, reg.get("_ultimo_motivo") or "Cierre manual/externo")
+            out.append(_cerrar(reg, sym, reg.get("_ultimo_precio_exec"), motivo,
+                               float(reg.get("qty") or 0.0)))
+    return out
+
+
+def aplicar_evento(estado_pares: Dict, ev: Dict) -> List[Dict]:
+    tipo = (ev or {}).get("tipo")
+    if tipo == "ejecucion":
+        return aplicar_ejecucion(estado_pares, ev)
+    if tipo in ("posicion", "snapshot"):
+        return aplicar_posicion(estado_pares, ev)
+    return []
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de niveles de precio por posición abierta.
+
+Al abrir (o cuando cambia la posición) se precalculan los precios donde hay
+algo que hacer: BE del trailing, parcial en at_R, SL, TP y el próximo escalón
+del trailing (el precio a partir del cual el SL se movería al menos
+`min_mov_sl_pct`). Se guardan como una banda (abajo, arriba) alrededor del
+último precio: en cada tick basta `abajo < precio < arriba` para saber que no
+hay trabajo. Cuando se cruza la banda, el core corre partials/trailing y
+reconstruye el índice.
+"""
+from typing import Dict, List, Optional
+
+from core.partials import nivel_parcial
+
+_INF = float("inf")
+
+
+def niveles_posicion(reg: Dict, cfg: Dict) -> Dict[str, float]:
+    """Precios de disparo de una posición (solo los que aplican en su estado actual)."""
+    out = {}
+    entrada = float(reg.get("entrada_precio") or 0.0)
+    if entrada <= 0:
+        return out
+    es_long = str(reg.get("direccion", "")).upper().startswith("COMPRA")
+    sgn = 1.0 if es_long else -1.0
+
+    sl_pct = float(reg.get("sl_pct") or 0.0) / 100.0
+    tp_pct = float(reg.get("tp_pct") or 0.0) / 100.0
+    if sl_pct > 0:
+        out["sl"] = entrada * (1.0 - sgn * sl_pct)
+    if tp_pct > 0:
+        out["tp"] = entrada * (1.0 + sgn * tp_pct)
+
+    if (cfg.get("partials", {}) or {}).get("enabled", True) and not reg.get("partial_done"):
+        precio, _ = nivel_parcial(reg, cfg)
+        if precio > 0:
+            out["parcial"] = precio
+
+    tr = reg.get("trailing") or {}
+    if tr.get("activo", True) and tr.get("entry") is not None and tr.get("stop") is not None:
+        e = float(tr["entry"])
+        risk = abs(e - float(tr["stop"]))
+        if tr.get("sl") is not None:
+            out["sl"] = float(tr["sl"])
+        if risk > 0 and not tr.get("be_moved"):
+            out["be"] = e + sgn * float(tr.get("rr_trigger", 1.0)) * risk
+        elif risk > 0:
+            # próximo escalón: peak - d*R debe superar al último SL en min_mov
+            umbral = float(tr.get("min_mov_sl_pct", 0.05)) / 100.0
+            previo = tr.get("ultimo_sl_notificado") or tr.get("sl")
+            dist = float(tr.get("rr_distance", 0.5)) * risk
+            if previo:
+                out["trailing"] = float(previo) * (1.0 + sgn * umbral) + sgn * dist
+            else:
+                out["trailing"] = float(tr.get("peak") or e)
+    return out
+
+
+class IndiceNiveles:
+    def __init__(self):
+        self._banda: Dict[str, tuple] = {}    # sym -> (abajo, arriba)
+        self.niveles: Dict[str, Dict[str, float]] = {}
+
+    def construir(self, sym: str, reg: Dict, cfg: Dict, precio: float):
+        niv = niveles_posicion(reg, cfg)
+        precio = float(precio)
+        arriba = min([p for p in niv.values() if p > precio], default=_INF)
+        abajo = max([p for p in niv.values() if p < precio], default=-_INF)
+        self.niveles[sym] = niv
+        self._banda[sym] = (abajo, arriba)
+
+    def cruzado(self, sym: str, precio: float) -> bool:
+        """True si hay trabajo (nivel cruzado o símbolo sin índice)."""
+        b = self._banda.get(sym)
+        return b is None or not (b[0] < precio < b[1])
+
+    def __contains__(self, sym: str) -> bool:
+        return sym in self._banda
+
+    def invalidar(self, sym: Optional[str] = None):
+        if sym is None:
+            self._banda.clear()
+            self.niveles.clear()
+        else:
+            self._banda.pop(sym, None)
+            self.niveles.pop(sym, None)
+
+    def simbolos(self) -> List[str]:
+        return list(self._banda)
@@ -96,6 +96,24 @@ def should_execute_partial(reg: Dict, precio_actual: float, CFG: Any) -> Tuple[b
     }
     return ok, info
 
+def modo(cfg: Any) -> str:
+    """'cliente' (default: market al cruzar at_R) o 'exchange' (limit reduce-only residente)."""
+    return str(_pick_partials_view(cfg).get("modo") or "cliente").strip().lower()
+
+def nivel_parcial(reg: Dict, CFG: Any) -> Tuple[float, float]:
+    """
+    Precio en R y qty del parcial para dejarlo como orden en el exchange.
+    Misma R que should_execute_partial (entrada * sl_pct). (0, 0) si faltan datos.
+    """
+    at_R, fraction = _resolve_partials_cfg(CFG)
+    side_long = str(reg.get("direccion", "")).upper().startswith("COMPRA")
+    entrada = float(reg.get("entrada_precio") or 0.0)
+    risk = entrada * float(reg.get("sl_pct") or 0.0) / 100.0
+    if not entrada or not risk:
+        return 0.0, 0.0
+    precio = entrada + at_R * risk if side_long else entrada - at_R * risk
+    return float(precio), float(reg.get("qty") or 0.0) * float(fraction)
+
 def _idempotence_mark_done(reg: Dict):
     reg["partial_done"] = True
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Planificador de refresco por símbolo según urgencia.
+
+Urgencia (0..1) = máximo entre:
+  - cercanía al nivel de disparo más próximo (en ATR si hay ATR, si no en %),
+    solo con posición abierta;
+  - cierre de vela reciente (una vela nueva puede traer señal), para todos;
+  - piso para posiciones abiertas (`piso_abierta`).
+El intervalo de refresco va de `max_s` (urgencia 0) a `min_s` (urgencia 1).
+Un token bucket global (`presupuesto_rps` requests/s, ráfaga `rafaga`) limita
+cuántos símbolos se refrescan por ciclo: primero los más urgentes.
+"""
+import math
+import time
+from typing import Dict, List, Optional
+
+
+def atr_rapido(velas: List[Dict], n: int = 14) -> Optional[float]:
+    """ATR simple de las últimas `n` velas (dicts con high/low/close)."""
+    if not velas or len(velas) < n + 1:
+        return None
+    tr = []
+    for prev, v in zip(velas[-n - 1:-1], velas[-n:]):
+        h, l, pc = float(v["high"]), float(v["low"]), float(prev["close"])
+        tr.append(max(h - l, abs(h - pc), abs(l - pc)))
+    return sum(tr) / len(tr)
+
+
+class Planificador:
+    def __init__(self, simbolos, tf_s: float = 900.0, min_s: float = 2.0, max_s: float = 60.0,
+                 presupuesto_rps: float = 2.0, rafaga: float = 6.0, costo: float = 1.0,
+                 escala_atr: float = 1.0, escala_pct: float = 0.5, ventana_vela_s: float = 30.0,
+                 piso_abierta: float = 0.2, reloj=time.time):
+        self.tf_s = float(tf_s)
+        self.min_s, self.max_s = float(min_s), float(max_s)
+        self.rps, self.rafaga, self.costo = float(presupuesto_rps), float(rafaga), float(costo)
+        self.escala_atr, self.escala_pct = float(escala_atr), float(escala_pct)
+        self.ventana_vela_s = float(ventana_vela_s)
+        self.piso_abierta = float(piso_abierta)
+        self._reloj = reloj
+        self._tokens = self.rafaga
+        self._t_tokens = reloj()
+        # sym -> {"proximo": ts, "ultimo": ts, "dist": float|None, "abierta": bool}
+        self._est: Dict[str, Dict] = {s: self._nuevo() for s in (simbolos or [])}
+
+    @staticmethod
+    def _nuevo() -> Dict:
+        return {"proximo": 0.0, "ultimo": 0.0, "dist": None, "abierta": False}
+
+    # ---- urgencia ----
+    def _u_vela(self, ahora: float) -> float:
+        desde_cierre = ahora % self.tf_s if self.tf_s > 0 else self.ventana_vela_s
+        return max(0.0, 1.0 - desde_cierre / self.ventana_vela_s) if self.ventana_vela_s > 0 else 0.0
+
+    def urgencia(self, sym: str, ahora: float = None) -> float:
+        ahora = self._reloj() if ahora is None else ahora
+        e = self._est.get(sym) or {}
+        u = self._u_vela(ahora)
+        if e.get("abierta"):
+            u = max(u, self.piso_abierta)
+            if e.get("dist") is not None:
+                u = max(u, math.exp(-float(e["dist"])))
+        return min(1.0, u)
+
+    def intervalo(self, u: float) -> float:
+        return self.max_s - (self.max_s - self.min_s) * max(0.0, min(1.0, u))
+
+    # ---- registro tras cada refresco ----
+    def registrar(self, sym: str, precio: float, niveles: Dict[str, float] = None,
+                  atr: float = None, abierta: bool = False):
+        e = self._est.setdefault(sym, self._nuevo())
+        e["abierta"] = bool(abierta)
+        e["dist"] = None
+        if abierta and niveles and precio:
+            d = min(abs(float(precio) - float(l)) for l in niveles.values())
+            if atr and atr > 0:
+                e["dist"] = d / (float(atr) * self.escala_atr)
+            else:
+                e["dist"] = (d / float(precio) * 100.0) / self.escala_pct
+        ahora = self._reloj()
+        e["ultimo"] = ahora
+        e["proximo"] = ahora + self.intervalo(self.urgencia(sym, ahora))
+
+    def forzar(self, sym: str):
+        """El próximo ciclo lo refresca (ej. evento del stream)."""
+        if sym in self._est:
+            self._est[sym]["proximo"] = 0.0
+
+    # ---- selección ----
+    def _recargar(self, ahora: float):
+        self._tokens = min(self.rafaga, self._tokens + (ahora - self._t_tokens) * self.rps)
+        self._t_tokens = ahora
+
+    def vencidos(self) -> List[str]:
+        """Símbolos a refrescar ahora (más urgentes primero), dentro del presupuesto."""
+        ahora = self._reloj()
+        self._recargar(ahora)
+        cierre = ahora - (ahora % self.tf_s) if self.tf_s > 0 else 0.0
+        # vencidos por intervalo, o sin refresco desde el último cierre de vela
+        due = [s for s, e in self._est.items() if e["proximo"] <= ahora or e["ultimo"] < cierre]
+        due.sort(key=lambda s: -self.urgencia(s, ahora))
+        out = []
+        for s in due:
+            if self._tokens < self.costo:
+                break
+            self._tokens -= self.costo
+            out.append(s)
+        return out
+
+    def espera(self, tope_s: float = 5.0) -> float:
+        """Segundos hasta el próximo vencimiento (acotado a [0.5, tope_s])."""
+        ahora = self._reloj()
+        prox = min((e["proximo"] for e in self._est.values()), default=ahora + tope_s)
+        # vela por cerrar: despertar en el cierre
+        if self.tf_s > 0:
+            prox = min(prox, ahora - (ahora % self.tf_s) + self.tf_s)
+        if self._tokens < self.costo and self.rps > 0:
+            prox = max(prox, ahora + (self.costo - self._tokens) / self.rps)
+        return max(0.5, min(float(tope_s), prox - ahora))
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Gestor de SL/TP con estado local confirmado.
+
+- `conocido[sym]`: último SL/TP confirmado (stream 'position', reconciliación
+  REST o un envío aceptado), con el mismo formato que
+  adapters.bybit_private.fetch_position_for_symbol.
+- `proponer()` acumula movimientos dentro del ciclo (trailing, realineo de la
+  reconciliación, ...). Por símbolo queda solo el mejor SL monotónico y el
+  último TP.
+- `flush()` envía un request por símbolo y solo si mejora lo conocido en al
+  menos `min_mov_sl_pct` (o si cambia el TP). Con estado fresco se pasa como
+  `posicion=` y el adapter se ahorra la relectura de la posición.
+"""
+import time
+import logging
+from typing import Dict, Optional
+
+LOG = logging.getLogger("bibit")
+
+
+def _mejora(side: str, nuevo: float, previo: Optional[float]) -> bool:
+    if previo is None:
+        return True
+    return nuevo > previo if side == "Buy" else nuevo < previo
+
+
+class GestorStops:
+    def __init__(self, enviar, min_mov_sl_pct: float = 0.05, frescura_s: float = 30.0,
+                 reloj=time.time):
+        self._enviar = enviar                  # set_trading_stop(sym, take_profit, stop_loss, posicion=)
+        self.min_mov_sl_pct = float(min_mov_sl_pct)
+        self.frescura_s = float(frescura_s)
+        self._reloj = reloj
+        self.conocido: Dict[str, Dict] = {}
+        self.pendiente: Dict[str, Dict] = {}
+        self.enviados = 0
+        self.descartados = 0
+
+    # ---- estado confirmado ----
+    def confirmar(self, sym: str, side: str = None, avg_price: float = None,
+                  sl: float = None, tp: float = None):
+        k = self.conocido.setdefault(sym, {})
+        if side in ("Buy", "Sell"):
+            k["side"] = side
+        if avg_price:
+            k["avgPrice"] = float(avg_price)
+        k["stopLoss"] = None if sl in (None, 0, 0.0) else float(sl)
+        k["takeProfit"] = None if tp in (None, 0, 0.0) else float(tp)
+        k["ts"] = self._reloj()
+
+    def olvidar(self, sym: str):
+        self.conocido.pop(sym, None)
+        self.pendiente.pop(sym, None)
+
+    def fresco(self, sym: str) -> bool:
+        k = self.conocido.get(sym)
+        return bool(k and k.get("side") and k.get("avgPrice")
+                    and (self._reloj() - float(k.get("ts", 0.0))) <= self.frescura_s)
+
+    # ---- movimientos ----
+    def proponer(self, sym: str, sl: float = None, tp: float = None):
+        p = self.pendiente.setdefault(sym, {"sl": None, "tp": None})
+        side = (self.conocido.get(sym) or {}).get("side")
+        if sl is not None:
+            if p["sl"] is None or side is None or _mejora(side, float(sl), p["sl"]):
+                p["sl"] = float(sl)
+            else:
+                self.descartados += 1
+        if tp is not None:
+            p["tp"] = float(tp)
+
+    def _filtrar(self, sym: str, p: Dict):
+        k = self.conocido.get(sym) or {}
+        side = k.get("side")
+        sl, tp = p.get("sl"), p.get("tp")
+        sl_prev, tp_prev = k.get("stopLoss"), k.get("takeProfit")
+        if sl is not None and sl_prev is not None and side:
+            if not _mejora(side, sl, sl_prev):
+                sl = None
+            elif abs(sl - sl_prev) / sl_prev * 100.0 < self.min_mov_sl_pct:
+                sl = None
+        if tp is not None and tp_prev is not None and abs(tp - tp_prev) <= abs(tp_prev) * 1e-9:
+            tp = None
+        return sl, tp
+
+    def flush(self) -> Dict[str, Dict]:
+        """Envía lo pendiente (un request por símbolo). Devuelve {sym: {ok, sl, tp, resp}}."""
+        out = {}
+        pend, self.pendiente = self.pendiente, {}
+        for sym, p in pend.items():
+            sl, tp = self._filtrar(sym, p)
+            if sl is None and tp is None:
+                self.descartados += 1
+                continue
+            pos = dict(self.conocido[sym]) if self.fresco(sym) else None
+            try:
+                ok, resp = self._enviar(sym, take_profit=tp, stop_loss=sl, posicion=pos)
+            except Exception as e:
+                ok, resp = False, f"exception: {e}"
+            self.enviados += 1
+            if ok:
+                k = self.conocido.get(sym) or {}
+                self.confirmar(sym, k.get("side"), k.get("avgPrice"),
+                               sl if sl is not None else k.get("stopLoss"),
+                               tp if tp is not None else k.get("takeProfit"))
+            else:
+                LOG.warning("STOPS %s no aplicado (sl=%s tp=%s): %s", sym, sl, tp, resp)
+            out[sym] = {"ok": bool(ok), "sl": sl, "tp": tp, "resp": resp}
+        return out
@@ -131,3 +131,28 @@ def actualizar(state: dict, price: float, cfg: dict):
     state["sl"] = sl
     state["stop"] = stop0
     return {"activo": True, "sl": sl, "tp": tp, "movido": moved}
+
+def modo(cfg: dict) -> str:
+    """'cliente' (default: actualizar() cada ciclo) o 'exchange' (trailing nativo)."""
+    return str(_cfg_get(cfg, "modo", "cliente") or "cliente").strip().lower()
+
+def niveles_nativos(state: dict):
+    """
+    Traduce el trailing en R a los parámetros del trailing nativo de Bybit:
+      {"distance": rr_distance * R (en precio), "active_price": entry ± rr_trigger * R}
+    Devuelve None si falta entry/stop.
+    Nota: el nativo sigue al pico desde la activación; no hace el escalón a BE.
+    """
+    try:
+        side = state["side"]
+        entry = float(state["entry"])
+        risk = abs(entry - float(state["stop"]))
+    except Exception:
+        return None
+    if risk <= 0:
+        return None
+    trig = float(state.get("rr_trigger", 1.0)) * risk
+    return {
+        "distance": float(state.get("rr_distance", 0.5)) * risk,
+        "active_price": entry + trig if side == "LONG" else entry - trig,
+    }
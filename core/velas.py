@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Almacén de velas en vivo con TFs derivados.
+
+Se pide por REST solo el TF base (`tf_base`) y de forma incremental: la
+primera vez `max_base` velas, después solo las velas desde la última
+guardada (+`margen`, la última en curso se reemplaza). Los TF mayores
+(múltiplos del base) se derivan con datos.resample.agregar recalculando
+únicamente las cubetas tocadas por velas nuevas; la última cubeta puede
+estar en curso, igual que la última vela que devuelve el REST.
+
+Las velas son dicts open/high/low/close/volume/time (time en segundos,
+como core.obtener_velas). Sin `time` (stub) no hay incremental ni derivados.
+"""
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+from datos.cache_ohlcv import tf_a_ms
+from datos.resample import agregar
+
+LOG = logging.getLogger("bibit")
+
+
+class VelasSinActualizar(Exception):
+    """El REST no devolvió velas: el buffer quedó viejo y no hay que usarlo en el ciclo."""
+
+
+class AlmacenVelas:
+    def __init__(self, fetch: Callable[[str, str, int], List[Dict]], tf_base: str,
+                 max_base: int = 1000, margen: int = 2, reloj=time.time):
+        self._fetch = fetch                 # (simbolo, tf, n) -> velas ascendentes
+        self.tf_base = tf_base
+        self.base_s = tf_a_ms(tf_base) // 1000
+        self.max_base = int(max_base)
+        self.margen = int(margen)
+        self._reloj = reloj
+        self._base: Dict[str, List[Dict]] = {}
+        self._der: Dict[tuple, List[Dict]] = {}     # (sym, tf) -> velas derivadas
+        self._pend: Dict[tuple, float] = {}         # (sym, tf) -> time de la primera vela base cambiada
+        self.requests = 0
+
+    def actualizar(self, sym: str) -> List[Dict]:
+        """
+        Un request REST (incremental) del TF base. Si el fetch vuelve vacío
+        (error de REST) levanta VelasSinActualizar: el buffer no cambia.
+        """
+        base = self._base.get(sym)
+        if base and base[-1].get("time") is not None:
+            n = int((self._reloj() - float(base[-1]["time"])) // self.base_s) + self.margen
+            n = self.max_base if n > self.max_base else max(self.margen, n)
+        else:
+            n = self.max_base
+        nuevas = self._fetch(sym, self.tf_base, n) or []
+        self.requests += 1
+        if not nuevas:
+            raise VelasSinActualizar(f"{sym} {self.tf_base}: el REST no devolvió velas")
+        t0 = nuevas[0].get("time")
+        empalma = (base and t0 is not None and n < self.max_base
+                   and float(t0) <= float(base[-1]["time"]) + self.base_s)
+        if empalma:
+            base = [v for v in base if float(v["time"]) < float(t0)] + list(nuevas)
+            for clave in self._der:
+                if clave[0] == sym:
+                    self._pend[clave] = min(self._pend.get(clave, float(t0)), float(t0))
+        else:
+            base = list(nuevas)                          # carga completa (o hueco): se rederiva todo
+            for clave in [k for k in self._der if k[0] == sym]:
+                self._der.pop(clave, None)
+                self._pend.pop(clave, None)
+        self._base[sym] = base[-self.max_base:]
+        return self._base[sym]
+
+    def velas(self, sym: str, tf: Optional[str] = None, n: Optional[int] = None) -> List[Dict]:
+        """Últimas `n` velas de `tf` (por defecto el base), sin I/O."""
+        tf = tf or self.tf_base
+        base = self._base.get(sym) or []
+        if tf_a_ms(tf) == tf_a_ms(self.tf_base):
+            out = base
+        else:
+            out = self._derivar(sym, tf, base)
+        return out[-n:] if n else list(out)
+
+    def _derivar(self, sym: str, tf: str, base: List[Dict]) -> List[Dict]:
+        if not base or base[-1].get("time") is None:
+            return []
+        tf_s = tf_a_ms(tf) // 1000
+        clave = (sym, tf)
+        prev = self._der.get(clave)
+        if prev is not None and clave not in self._pend:
+            return prev                                   # sin velas base nuevas
+        corte = 0.0
+        if prev:
+            desde = self._pend[clave]
+            corte = desde - desde % tf_s
+            prev = [v for v in prev if float(v["time"]) < corte]
+            if float(base[0]["time"]) > corte:            # el buffer ya no cubre la cubeta
+                prev, corte = [], 0.0
+        else:
+            prev = []
+        sub = [v for v in base if float(v["time"]) >= corte]
+        ts, o, h, l, c, vol = agregar([int(float(v["time"]) * 1000) for v in sub],
+                                      [v["open"] for v in sub], [v["high"] for v in sub],
+                                      [v["low"] for v in sub], [v["close"] for v in sub],
+                                      [v["volume"] for v in sub], self.base_s * 1000, tf_s * 1000,
+                                      incluir_parcial=True)
+        # incluir_parcial solo admite la última cubeta incompleta (en curso);
+        # la primera cortada por el inicio del buffer ya queda afuera
+        prev = prev + [{"open": float(a), "high": float(b), "low": float(d), "close": float(e),
+                        "volume": float(f), "time": int(t) // 1000}
+                       for t, a, b, d, e, f in zip(ts, o, h, l, c, vol)]
+        self._der[clave] = prev
+        self._pend.pop(clave, None)
+        return prev
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Lectura del cache OHLCV local: cache/ohlcv_{SYM-USDT}_{tf}.csv (consolidado,
+lo mantiene datos.descarga) y los legados cache/ohlcv_{SYM-USDT}_{tf}_{desde}.csv.
+
+- Une todos los CSV del mismo símbolo/TF (p.ej. 2024-11-01 + 2025-01-01),
+  deduplica por `ts` y ordena.
+- Columnas de salida: ts (int64 ms, apertura de la vela), open, high, low,
+  close, volume (float64) y time (datetime UTC).
+- Memoiza por (rutas, mtimes): varios runs en el mismo proceso comparten los
+  datos ya parseados. El DataFrame devuelto es una copia.
+"""
+import glob
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / "cache"
+
+_TF_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+FILAS_TRAMO = 200_000
+_memo: Dict[Tuple, pd.DataFrame] = {}
+
+
+def tf_a_ms(tf: str) -> int:
+    tf = str(tf).strip().lower()
+    return int(tf[:-1]) * _TF_MS[tf[-1]]
+
+
+def _sym_archivo(symbol: str) -> str:
+    s = str(symbol).upper()
+    return s if "-" in s else s.replace("USDT", "-USDT")
+
+
+def archivo_unico(symbol: str, tf: str, cache_dir: Optional[Path] = None) -> Path:
+    """Dataset consolidado símbolo/TF (lo mantiene datos.descarga)."""
+    return Path(cache_dir or CACHE_DIR) / f"ohlcv_{_sym_archivo(symbol)}_{tf}.csv"
+
+
+def archivos_cache(symbol: str, tf: str, cache_dir: Optional[Path] = None) -> List[Path]:
+    """CSV con fecha (legado) + el consolidado al final (gana en duplicados)."""
+    d = Path(cache_dir or CACHE_DIR)
+    files = sorted(Path(p) for p in glob.glob(str(d / f"ohlcv_{_sym_archivo(symbol)}_{tf}_*.csv")))
+    unico = archivo_unico(symbol, tf, d)
+    return files + [unico] if unico.exists() else files
+
+
+def _normalizar(df: pd.DataFrame) -> pd.DataFrame:
+    if "ts" not in df.columns:
+        t = pd.to_datetime(df["time"], utc=True, errors="coerce")
+        df["ts"] = (t.astype("int64") // 1_000_000)
+    out = pd.DataFrame({"ts": df["ts"].astype("int64")})
+    for c in ("open", "high", "low", "close", "volume"):
+        out[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return out
+
+
+def _leer(path: Path) -> pd.DataFrame:
+    return _normalizar(pd.read_csv(path))
+
+
+def cargar(symbol: str, tf: str, since=None, until=None, cache_dir: Optional[Path] = None) -> Optional[pd.DataFrame]:
+    """DataFrame OHLCV del cache (None si no hay archivos)."""
+    files = archivos_cache(symbol, tf, cache_dir)
+    if not files:
+        return None
+    key = tuple((str(p), p.stat().st_mtime_ns) for p in files)
+    df = _memo.get(key)
+    if df is None:
+        df = pd.concat([_leer(p) for p in files], ignore_index=True)
+        df = (df.dropna(subset=["open", "high", "low", "close"])
+                .drop_duplicates("ts", keep="last")
+                .sort_values("ts")
+                .reset_index(drop=True))
+        df["time"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
+        _memo[key] = df
+    if since is not None:
+        df = df[df["time"] >= pd.to_datetime(since, utc=True)]
+    if until is not None:
+        df = df[df["time"] < pd.to_datetime(until, utc=True)]
+    return df.reset_index(drop=True).copy()
+
+
+def leer_tramos(symbol: str, tf: str, since=None, until=None, filas: int = FILAS_TRAMO,
+                cache_dir: Optional[Path] = None) -> Iterator[pd.DataFrame]:
+    """
+    Mismo dataset que cargar(), en tramos de a lo sumo `filas` velas (sin la
+    historia entera en memoria). Los CSV se leen en orden (legados por fecha
+    y el consolidado al final); de los legados solo entra lo anterior al
+    consolidado, que es el que gana en cargar(). Una vela con ts <= la última
+    ya emitida se descarta.
+    """
+    files = archivos_cache(symbol, tf, cache_dir)
+    unico = archivo_unico(symbol, tf, cache_dir)
+    tope_legado = None
+    if unico.exists():
+        try:
+            tope_legado = int(_normalizar(pd.read_csv(unico, nrows=1))["ts"].iloc[0])
+        except Exception:
+            tope_legado = None
+    desde = None if since is None else int(pd.to_datetime(since, utc=True).value // 1_000_000)
+    hasta = None if until is None else int(pd.to_datetime(until, utc=True).value // 1_000_000)
+    ultimo = None
+    for p in files:
+        for bloque in pd.read_csv(p, chunksize=int(filas)):
+            df = _normalizar(bloque).dropna(subset=["open", "high", "low", "close"])
+            df = df.sort_values("ts", kind="stable").drop_duplicates("ts", keep="last")
+            if p != unico and tope_legado is not None:
+                df = df[df["ts"] < tope_legado]
+            if ultimo is not None:
+                df = df[df["ts"] > ultimo]
+            if desde is not None:
+                df = df[df["ts"] >= desde]
+            if hasta is not None:
+                df = df[df["ts"] < hasta]
+            if df.empty:
+                continue
+            ultimo = int(df["ts"].iloc[-1])
+            df = df.reset_index(drop=True)
+            df["time"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
+            yield df
+
+
+def tfs_disponibles(symbol: str, cache_dir: Optional[Path] = None) -> List[str]:
+    """TFs presentes en cache para el símbolo, de menor a mayor."""
+    d = Path(cache_dir or CACHE_DIR)
+    pref = f"ohlcv_{_sym_archivo(symbol)}_"
+    tfs = {p.stem[len(pref):].split("_")[0] for p in d.glob(pref + "*.csv")}
+    return sorted(tfs, key=tf_a_ms)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Descarga de velas históricas (Bybit v5 /v5/market/kline, pública) al cache.
+
+- Un dataset por símbolo/TF: cache/ohlcv_{SYM-USDT}_{tf}.csv
+  (datos.cache_ohlcv.archivo_unico). Los CSV legados con fecha se funden en
+  él y se mueven a cache/legacy/.
+- Incremental: arranca en la última vela guardada + 1 (o en `desde` si no
+  hay nada) y llega hasta la última vela CERRADA.
+- Páginas de `LIMITE` velas alineadas al inicio; se bajan en paralelo
+  (threads) bajo un presupuesto global de requests/s (token bucket).
+- Checkpoint: cada página terminada queda en cache/.descarga/{SYM}_{tf}/
+  {ini}_{fin}.csv (escritura atómica). Si la corrida se corta, la siguiente
+  replanifica las mismas páginas y solo baja las que faltan. Con todas las
+  páginas presentes se consolida y se borra el directorio parcial.
+
+CLI:
+    python -m datos.descarga --simbolos BTCUSDT ETHUSDT --tfs 15m 1h --desde 2024-01-01
+(por defecto: simbolos + estrategia.tf + backtest.intrabar_tf de config/settings.json)
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import pandas as pd
+
+from datos.cache_ohlcv import CACHE_DIR, archivo_unico, archivos_cache, cargar, tf_a_ms, _sym_archivo
+
+LOG = logging.getLogger("bibit")
+
+BASE_URL = os.getenv("BYBIT_PUBLIC_URL") or "https://api.bybit.com"
+LIMITE = 1000   # máximo de velas por request en /v5/market/kline
+COLUMNAS = ["ts", "open", "high", "low", "close", "volume"]
+_INTERVALOS = {"1m": "1", "3m": "3", "5m": "5", "15m": "15", "30m": "30", "1h": "60", "2h": "120",
+               "4h": "240", "6h": "360", "12h": "720", "1d": "D"}
+
+
+def intervalo_bybit(tf: str) -> str:
+    tf = str(tf).strip().lower()
+    if tf not in _INTERVALOS:
+        raise ValueError(f"TF no soportado por Bybit: {tf}")
+    return _INTERVALOS[tf]
+
+
+class Cubeta:
+    """Token bucket compartido entre threads: `tomar()` bloquea hasta tener un token."""
+
+    def __init__(self, rps: float = 8.0, rafaga: float = 8.0, reloj=time.monotonic):
+        self.rps, self.rafaga = float(rps), float(rafaga)
+        self._tokens = self.rafaga
+        self._reloj = reloj
+        self._t = reloj()
+        self._lock = threading.Lock()
+
+    def tomar(self):
+        while True:
+            with self._lock:
+                ahora = self._reloj()
+                self._tokens = min(self.rafaga, self._tokens + (ahora - self._t) * self.rps)
+                self._t = ahora
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                espera = (1.0 - self._tokens) / self.rps if self.rps > 0 else 0.1
+            time.sleep(espera)
+
+
+class ClienteKlines:
+    def __init__(self, base_url: str = BASE_URL, presupuesto_rps: float = 8.0, rafaga: float = 8.0,
+                 timeout: float = 10.0, reintentos: int = 4, categoria: str = "linear"):
+        self.base_url = base_url.rstrip("/")
+        self.cubeta = Cubeta(presupuesto_rps, rafaga)
+        self.timeout = float(timeout)
+        self.reintentos = max(1, int(reintentos))
+        self.categoria = categoria
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def pagina(self, symbol: str, tf: str, ini_ms: int, fin_ms: int) -> List[list]:
+        """Velas [ts, o, h, l, c, v] con ts en [ini_ms, fin_ms), ascendentes."""
+        q = urlencode({"category": self.categoria, "symbol": symbol, "interval": intervalo_bybit(tf),
+                       "start": int(ini_ms), "end": int(fin_ms) - 1, "limit": LIMITE})
+        url = f"{self.base_url}/v5/market/kline?{q}"
+        ultimo_error = None
+        for intento in range(self.reintentos):
+            self.cubeta.tomar()
+            with self._lock:
+                self.requests += 1
+            try:
+                with urlopen(url, timeout=self.timeout) as r:
+                    data = json.loads(r.read().decode("utf-8"))
+                if int(data.get("retCode", -1)) == 0:
+                    filas = [[int(x[0])] + [float(v) for v in x[1:6]] for x in data["result"]["list"]]
+                    return sorted(f for f in filas if ini_ms <= f[0] < fin_ms)
+                ultimo_error = f"retCode={data.get('retCode')} {data.get('retMsg')}"
+            except (HTTPError, URLError, OSError, ValueError, KeyError) as e:
+                ultimo_error = str(e)
+            time.sleep(min(8.0, 0.5 * 2 ** intento))
+        raise RuntimeError(f"kline {symbol} {tf} {ini_ms}: {ultimo_error}")
+
+
+# ------------------ Plan / checkpoint ------------------
+def planificar(desde_ms: int, hasta_ms: int, tf_ms: int, limite: int = LIMITE) -> List[Tuple[int, int]]:
+    """Páginas [ini, fin) alineadas a `desde_ms` (mismas páginas al reanudar)."""
+    paso = int(limite) * int(tf_ms)
+    return [(ini, min(ini + paso, hasta_ms)) for ini in range(int(desde_ms), int(hasta_ms), paso)]
+
+
+def dir_parcial(symbol: str, tf: str, cache_dir: Optional[Path] = None) -> Path:
+    return Path(cache_dir or CACHE_DIR) / ".descarga" / f"{_sym_archivo(symbol)}_{tf}"
+
+
+def _partes(d: Path) -> Dict[int, int]:
+    out = {}
+    for p in d.glob("*.csv"):
+        try:
+            ini, fin = (int(x) for x in p.stem.split("_"))
+            out[ini] = max(fin, out.get(ini, fin))
+        except ValueError:
+            continue
+    return out
+
+
+def _escribir_atomico(df: pd.DataFrame, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def _guardar_pagina(d: Path, ini: int, fin: int, filas: List[list]):
+    _escribir_atomico(pd.DataFrame(filas, columns=COLUMNAS), d / f"{ini}_{fin}.csv")
+    for p in d.glob(f"{ini}_*.csv"):          # versión más corta de la misma página
+        if p.stem != f"{ini}_{fin}":
+            p.unlink(missing_ok=True)
+
+
+def consolidar(symbol: str, tf: str, cache_dir: Optional[Path] = None) -> Optional[Path]:
+    """Funde cache existente (legado + consolidado) con las páginas descargadas."""
+    d_cache = Path(cache_dir or CACHE_DIR)
+    d = dir_parcial(symbol, tf, d_cache)
+    legados = [p for p in archivos_cache(symbol, tf, d_cache) if p != archivo_unico(symbol, tf, d_cache)]
+    prev = cargar(symbol, tf, cache_dir=d_cache)
+    partes = [pd.read_csv(p) for p in sorted(d.glob("*.csv"))] if d.exists() else []
+    dfs = ([prev[COLUMNAS]] if prev is not None else []) + [x[COLUMNAS] for x in partes]
+    if not dfs:
+        return None
+    df = (pd.concat(dfs, ignore_index=True)
+            .drop_duplicates("ts", keep="last")
+            .sort_values("ts")
+            .reset_index(drop=True))
+    df["ts"] = df["ts"].astype("int64")
+    df["time"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
+    destino = archivo_unico(symbol, tf, d_cache)
+    _escribir_atomico(df, destino)
+    if legados:
+        (d_cache / "legacy").mkdir(exist_ok=True)
+        for p in legados:
+            shutil.move(str(p), str(d_cache / "legacy" / p.name))
+    if d.exists():
+        shutil.rmtree(d, ignore_errors=True)
+    return destino
+
+
+# ------------------ Descarga ------------------
+def descargar(simbolos: Iterable[str], tfs: Iterable[str], desde="2024-01-01", hasta=None,
+              cache_dir: Optional[Path] = None, cliente: Optional[ClienteKlines] = None,
+              hilos: int = 4, reloj=time.time) -> Dict[str, Dict]:
+    """
+    Completa/extiende el cache para simbolos x tfs. Devuelve por "SYM tf":
+    {"paginas", "pendientes", "errores", "filas", "archivo"}.
+    """
+    d_cache = Path(cache_dir or CACHE_DIR)
+    cliente = cliente or ClienteKlines()
+    hasta_base = int(pd.to_datetime(hasta, utc=True).value // 1_000_000) if hasta else int(reloj() * 1000)
+    trabajos, res = [], {}
+    for sym in simbolos:
+        for tf in tfs:
+            tf_ms = tf_a_ms(tf)
+            prev = cargar(sym, tf, cache_dir=d_cache)
+            if prev is not None and len(prev):
+                ini = int(prev["ts"].iloc[-1]) + tf_ms
+            else:
+                ini = int(pd.to_datetime(desde, utc=True).value // 1_000_000)
+                ini -= ini % tf_ms
+            fin = hasta_base - hasta_base % tf_ms        # solo velas cerradas
+            d = dir_parcial(sym, tf, d_cache)
+            hechas = _partes(d) if d.exists() else {}
+            plan = planificar(ini, fin, tf_ms)
+            pend = [(a, b) for a, b in plan if hechas.get(a, -1) < b]
+            res[f"{sym} {tf}"] = {"paginas": len(plan), "pendientes": len(pend), "errores": [],
+                                  "filas": 0, "archivo": None}
+            trabajos += [(sym, tf, a, b) for a, b in pend]
+
+    def _bajar(t):
+        sym, tf, a, b = t
+        filas = cliente.pagina(sym, tf, a, b)
+        _guardar_pagina(dir_parcial(sym, tf, d_cache), a, b, filas)
+        return len(filas)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(hilos))) as ex:
+        futs = {ex.submit(_bajar, t): t for t in trabajos}
+        for f in as_completed(futs):
+            sym, tf, a, b = futs[f]
+            r = res[f"{sym} {tf}"]
+            try:
+                r["filas"] += f.result()
+                r["pendientes"] -= 1
+            except Exception as e:
+                r["errores"].append(str(e))
+                LOG.warning("DESCARGA %s %s página %s falló: %s", sym, tf, a, e)
+
+    for clave, r in res.items():
+        sym, tf = clave.split(" ")
+        if r["pendientes"] == 0:
+            destino = consolidar(sym, tf, d_cache)
+            r["archivo"] = str(destino) if destino else None
+    return res
+
+
+def main():
+    import argparse
+    from utils.settings import load_settings
+
+    ap = argparse.ArgumentParser(description="Descarga/extiende el cache OHLCV desde Bybit")
+    ap.add_argument("--simbolos", nargs="*")
+    ap.add_argument("--tfs", nargs="*")
+    ap.add_argument("--desde", default="2024-01-01")
+    ap.add_argument("--hasta", default=None)
+    ap.add_argument("--rps", type=float, default=8.0, help="presupuesto global de requests/s")
+    ap.add_argument("--hilos", type=int, default=4)
+    ap.add_argument("--base-url", default=BASE_URL)
+    args = ap.parse_args()
+
+    simbolos, tfs = args.simbolos, args.tfs
+    if not simbolos or not tfs:
+        cfg, _ = load_settings("config/settings.json")
+        simbolos = simbolos or cfg.get("simbolos", ["ETHUSDT"])
+        # solo el TF base: los mayores se derivan con datos.resample
+        tfs = tfs or sorted({cfg.get("estrategia", {}).get("tf", "15m"),
+                             (cfg.get("backtest", {}) or {}).get("intrabar_tf", "15m")}, key=tf_a_ms)[:1]
+    cliente = ClienteKlines(args.base_url, presupuesto_rps=args.rps, rafaga=args.rps)
+    t0 = time.time()
+    res = descargar(simbolos, tfs, args.desde, args.hasta, cliente=cliente, hilos=args.hilos)
+    for k, r in res.items():
+        estado = "OK" if r["pendientes"] == 0 else f"INCOMPLETO ({r['pendientes']} páginas, reintentar)"
+        print(f"{k}: {r['paginas']} páginas, {r['filas']} velas nuevas -> {estado}")
+    print(f"{cliente.requests} requests en {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
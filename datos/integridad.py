@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de integridad de los CSV OHLCV del cache.
+
+Por archivo (vectorizado, sin loops por vela):
+  - esperadas vs presentes (grilla de `tf` entre la primera y la última vela),
+    huecos [[ini, fin, velas faltantes]] y timestamps desalineados;
+  - duplicados (y cuántos con valores distintos);
+  - velas con volumen 0, OHLC inconsistente (high < max(o,c), low > min(o,c),
+    precio <= 0) y picos: rango o salto de cierre > `atr_pico` x ATR previo.
+El índice se guarda en cache/.integridad.json por (mtime, tamaño): mientras el
+archivo no cambie no se vuelve a leer.
+
+Reparación:
+  - "refetch": baja los huecos con datos.descarga y reescribe el consolidado
+    (también elimina duplicados);
+  - "marcar": no toca datos; `mascara_invalida` marca las velas cuyo cálculo
+    de indicadores cruza un hueco (ventana posterior) o que son picos/OHLC
+    inválidos, y el motor no abre trades ahí (backtest.saltar_huecos).
+"""
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from datos.cache_ohlcv import CACHE_DIR, tf_a_ms
+
+LOG = logging.getLogger("bibit")
+
+INDICE = ".integridad.json"
+ATR_N = 14
+_memo: Dict[str, Dict] = {}
+
+
+def _atr_previo(h, l, c, n: int = ATR_N) -> np.ndarray:
+    """ATR simple de las `n` velas ANTERIORES a cada vela (NaN al inicio)."""
+    pc = np.concatenate(([c[0]], c[:-1]))
+    tr = np.maximum(h - l, np.maximum(np.abs(h - pc), np.abs(l - pc)))
+    atr = np.full(len(c), np.nan)
+    m = len(c) - n
+    if m > 0:
+        # suma por ventana, no cumsum: no arrastra redondeo desde el inicio (streaming igual al df entero)
+        acc = tr[:m].copy()
+        for k in range(1, n):
+            acc += tr[k:k + m]
+        atr[n:] = acc / n
+    return atr
+
+
+def picos(df: pd.DataFrame, atr_pico: float = 8.0) -> np.ndarray:
+    """Máscara de velas cuyo rango o salto de cierre supera atr_pico x ATR previo."""
+    h, l, c = (df[k].to_numpy(float) for k in ("high", "low", "close"))
+    if len(c) == 0:
+        return np.zeros(0, dtype=bool)
+    atr = _atr_previo(h, l, c)
+    salto = np.abs(c - np.concatenate(([c[0]], c[:-1])))
+    with np.errstate(invalid="ignore"):
+        return ((h - l) > atr_pico * atr) | (salto > atr_pico * atr)
+
+
+def analizar_df(df: pd.DataFrame, tf_ms: int, atr_pico: float = 8.0) -> Dict:
+    ts_raw = df["ts"].to_numpy("int64")
+    orden = np.argsort(ts_raw, kind="stable")
+    d = df.iloc[orden].reset_index(drop=True)
+    ts = ts_raw[orden]
+    out = {"filas": int(len(ts)), "esperadas": 0, "faltantes": 0, "huecos": [], "duplicados": 0,
+           "duplicados_conflicto": 0, "desalineadas": 0, "volumen_cero": 0, "ohlc_invalidas": 0,
+           "picos": [], "desordenado": bool((np.diff(ts_raw) < 0).any()) if len(ts_raw) > 1 else False}
+    if len(ts) == 0:
+        out["ok"] = True
+        return out
+
+    dup = np.concatenate(([False], ts[1:] == ts[:-1]))
+    out["duplicados"] = int(dup.sum())
+    if out["duplicados"]:
+        vals = d[["open", "high", "low", "close", "volume"]].to_numpy(float)
+        distinto = np.concatenate(([False], (vals[1:] != vals[:-1]).any(axis=1)))
+        out["duplicados_conflicto"] = int((dup & distinto).sum())
+    u = ~dup
+    ts_u, du = ts[u], d[u].reset_index(drop=True)
+
+    out["desalineadas"] = int((ts_u % tf_ms != 0).sum())
+    out["esperadas"] = int((ts_u[-1] - ts_u[0]) // tf_ms + 1)
+    paso = np.diff(ts_u)
+    j = np.flatnonzero(paso > tf_ms)
+    faltan = (paso[j] // tf_ms - 1).astype(int)
+    out["huecos"] = [[int(ts_u[k] + tf_ms), int(ts_u[k + 1]), int(n)] for k, n in zip(j, faltan)]
+    out["faltantes"] = int(faltan.sum())
+
+    o, h, l, c = (du[k].to_numpy(float) for k in ("open", "high", "low", "close"))
+    out["volumen_cero"] = int((du["volume"].to_numpy(float) <= 0).sum())
+    out["ohlc_invalidas"] = int(((h < np.maximum(o, c)) | (l > np.minimum(o, c)) |
+                                 (np.minimum.reduce([o, h, l, c]) <= 0)).sum())
+    out["picos"] = [int(x) for x in ts_u[picos(du, atr_pico)]]
+    # los picos son sospechosos, no necesariamente errores: se informan aparte
+    out["ok"] = not (out["faltantes"] or out["duplicados"] or out["desalineadas"] or out["ohlc_invalidas"])
+    return out
+
+
+def _parse_nombre(path: Path):
+    """ohlcv_ETH-USDT_15m[_2025-01-01].csv -> ("ETHUSDT", "15m")."""
+    partes = path.stem.split("_")
+    return partes[1].replace("-", ""), partes[2]
+
+
+def _cargar_indice(d: Path) -> Dict:
+    try:
+        return json.loads((d / INDICE).read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def validar_archivo(path: Path, atr_pico: float = 8.0, indice: Optional[Dict] = None) -> Dict:
+    path = Path(path)
+    st = path.stat()
+    firma = [st.st_mtime_ns, st.st_size, float(atr_pico)]
+    previo = (indice or {}).get(path.name) or _memo.get(str(path))
+    if previo and previo.get("firma") == firma:
+        return previo
+    _, tf = _parse_nombre(path)
+    df = pd.read_csv(path, usecols=["ts", "open", "high", "low", "close", "volume"])
+    res = analizar_df(df, tf_a_ms(tf), atr_pico)
+    res.update({"archivo": path.name, "tf": tf, "firma": firma})
+    _memo[str(path)] = res
+    return res
+
+
+def validar_cache(cache_dir: Optional[Path] = None, atr_pico: float = 8.0) -> Dict[str, Dict]:
+    """Índice de todos los ohlcv_*.csv; se persiste y solo relee archivos cambiados."""
+    d = Path(cache_dir or CACHE_DIR)
+    indice = _cargar_indice(d)
+    nuevo = {p.name: validar_archivo(p, atr_pico, indice) for p in sorted(d.glob("ohlcv_*.csv"))}
+    if nuevo != indice:
+        try:
+            (d / INDICE).write_text(json.dumps(nuevo), encoding="utf-8")
+        except Exception as e:
+            LOG.debug("INTEGRIDAD no pude guardar el índice: %s", e)
+    return nuevo
+
+
+# ------------------ Marcado para los motores ------------------
+def mascara_invalida(ts: np.ndarray, tf_ms: int, ventana: int = 250,
+                     df: Optional[pd.DataFrame] = None, atr_pico: Optional[float] = None) -> np.ndarray:
+    """
+    True en las velas que no deberían generar entradas: las `ventana` velas
+    posteriores a cada hueco (sus BB/EMA mezclan datos de ambos lados) y, si
+    se pasa `df`, las de OHLC inválido (y los picos si hay `atr_pico`).
+    """
+    ts = np.asarray(ts, dtype="int64")
+    n = len(ts)
+    marca = np.zeros(n + 1, dtype=np.int32)
+    if n > 1:
+        j = np.flatnonzero(np.diff(ts) > tf_ms) + 1     # primera vela después del hueco
+        np.add.at(marca, j, 1)
+        np.add.at(marca, np.minimum(j + int(ventana), n), -1)
+    mala = np.cumsum(marca[:n]) > 0
+    if df is not None and n:
+        o, h, l, c = (df[k].to_numpy(float) for k in ("open", "high", "low", "close"))
+        mala |= (h < np.maximum(o, c)) | (l > np.minimum(o, c)) | (np.minimum.reduce([o, h, l, c]) <= 0)
+        if atr_pico:
+            mala |= picos(df, atr_pico)
+    return mala
+
+
+# ------------------ Reparación ------------------
+def reparar(symbol: str, tf: str, cache_dir: Optional[Path] = None, cliente=None,
+            atr_pico: float = 8.0) -> Dict:
+    """
+    Rebaja los huecos del símbolo/TF y reescribe el consolidado sin duplicados.
+    Devuelve {"huecos", "recuperadas", "sin_datos": [(ini, fin)]}; lo que el
+    exchange no tiene queda como hueco (lo cubre `mascara_invalida`).
+    """
+    from datos.cache_ohlcv import cargar
+    from datos.descarga import ClienteKlines, LIMITE, consolidar, dir_parcial, _guardar_pagina
+
+    d = Path(cache_dir or CACHE_DIR)
+    cliente = cliente or ClienteKlines()
+    tf_ms = tf_a_ms(tf)
+    df = cargar(symbol, tf, cache_dir=d)
+    if df is None:
+        return {"huecos": 0, "recuperadas": 0, "sin_datos": []}
+    huecos = analizar_df(df, tf_ms, atr_pico)["huecos"]
+    recuperadas, sin_datos = 0, []
+    for ini, fin, _ in huecos:
+        for a in range(ini, fin, LIMITE * tf_ms):
+            b = min(a + LIMITE * tf_ms, fin)
+            try:
+                filas = cliente.pagina(symbol, tf, a, b)
+            except Exception as e:
+                LOG.warning("INTEGRIDAD %s %s refetch %s falló: %s", symbol, tf, a, e)
+                filas = []
+            if filas:
+                _guardar_pagina(dir_parcial(symbol, tf, d), a, b, filas)
+                recuperadas += len(filas)
+            else:
+                sin_datos.append((a, b))
+    consolidar(symbol, tf, d)
+    LOG.info("INTEGRIDAD %s %s: %d huecos, %d velas recuperadas", symbol, tf, len(huecos), recuperadas)
+    return {"huecos": len(huecos), "recuperadas": recuperadas, "sin_datos": sin_datos}
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Integridad del cache OHLCV")
+    ap.add_argument("--atr-pico", type=float, default=8.0)
+    ap.add_argument("--reparar", action="store_true", help="rebajar huecos y deduplicar")
+    args = ap.parse_args()
+    t0 = time.time()
+    idx = validar_cache(atr_pico=args.atr_pico)
+    for nombre, r in idx.items():
+        print(f"{nombre}: {'OK' if r['ok'] else 'REVISAR'} filas={r['filas']} faltantes={r['faltantes']} "
+              f"huecos={len(r['huecos'])} dup={r['duplicados']} vol0={r['volumen_cero']} "
+              f"ohlc={r['ohlc_invalidas']} picos={len(r['picos'])}")
+    print(f"{len(idx)} archivos en {time.time() - t0:.3f}s")
+    if args.reparar:
+        hechos = set()
+        for nombre, r in idx.items():
+            clave = _parse_nombre(Path(nombre))
+            if (r["faltantes"] or r["duplicados"]) and clave not in hechos:
+                hechos.add(clave)
+                print(clave, reparar(*clave, atr_pico=args.atr_pico))
+
+
+if __name__ == "__main__":
+    main()
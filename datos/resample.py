@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+TFs derivados a partir de las velas base más finas del cache.
+
+- Agregación vectorizada (reduceat) con cubetas alineadas como Bybit:
+  múltiplos del TF desde epoch UTC (30m, 1h, 2h, 4h, 1d a las 00:00 UTC).
+- Solo cubetas completas (todas sus velas base presentes) salvo
+  `incluir_parcial` (vela en curso del bot en vivo).
+- `cargar_tf` usa el TF base más fino del cache que divide al pedido y
+  memoiza el resultado por (archivos base, mtimes, TF).
+"""
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from datos.cache_ohlcv import archivos_cache, cargar, tf_a_ms, tfs_disponibles
+
+_memo: Dict[Tuple, pd.DataFrame] = {}
+
+
+def agregar(ts, o, h, l, c, v, tf_base_ms: int, tf_ms: int, incluir_parcial: bool = False):
+    """
+    Arrays base (ts ms ascendente) -> arrays del TF destino:
+    (ts, open, high, low, close, volume). `open` = primera, `close` = última.
+    """
+    ts = np.asarray(ts, dtype="int64")
+    if tf_ms % tf_base_ms:
+        raise ValueError(f"{tf_ms}ms no es múltiplo de {tf_base_ms}ms")
+    if ts.size == 0:
+        vacio = np.zeros(0)
+        return ts, vacio, vacio, vacio, vacio, vacio
+    cubeta = ts - ts % tf_ms
+    ini = np.flatnonzero(np.concatenate(([True], cubeta[1:] != cubeta[:-1])))
+    fin = np.concatenate((ini[1:], [ts.size])) - 1
+    o, h, l, c, v = (np.asarray(x, dtype=float) for x in (o, h, l, c, v))
+    out = (cubeta[ini], o[ini], np.maximum.reduceat(h, ini), np.minimum.reduceat(l, ini),
+           c[fin], np.add.reduceat(v, ini))
+    completa = (fin - ini + 1) == tf_ms // tf_base_ms
+    if incluir_parcial:
+        completa[-1] = True     # la última puede estar en curso
+    return tuple(x[completa] for x in out)
+
+
+def resamplear(df: pd.DataFrame, tf_base: str, tf: str, incluir_parcial: bool = False) -> pd.DataFrame:
+    """DataFrame OHLCV (ts ms) de `tf_base` -> `tf` (mismas columnas que cache_ohlcv.cargar)."""
+    if tf_a_ms(tf) == tf_a_ms(tf_base):
+        return df.reset_index(drop=True).copy()
+    cols = agregar(df["ts"].to_numpy("int64"), df["open"], df["high"], df["low"], df["close"],
+                   df["volume"], tf_a_ms(tf_base), tf_a_ms(tf), incluir_parcial)
+    out = pd.DataFrame(dict(zip(["ts", "open", "high", "low", "close", "volume"], cols)))
+    out["time"] = pd.to_datetime(out["ts"], unit="ms", utc=True)
+    return out
+
+
+def tf_base_para(symbol: str, tf: str, cache_dir: Optional[Path] = None) -> Optional[str]:
+    """TF más fino del cache que divide a `tf` (None si no hay)."""
+    objetivo = tf_a_ms(tf)
+    for b in tfs_disponibles(symbol, cache_dir):
+        if tf_a_ms(b) <= objetivo and objetivo % tf_a_ms(b) == 0:
+            return b
+    return None
+
+
+def cargar_tf(symbol: str, tf: str, since=None, until=None, cache_dir: Optional[Path] = None,
+              base: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    Como cache_ohlcv.cargar pero derivando `tf` de la base más fina (o `base`).
+    Un CSV propio del TF destino, si existe, se ignora: todo sale de la misma base.
+    """
+    base = base or tf_base_para(symbol, tf, cache_dir)
+    if base is None:
+        return None
+    files = archivos_cache(symbol, base, cache_dir)
+    key = (tuple((str(p), p.stat().st_mtime_ns) for p in files), tf)
+    df = _memo.get(key)
+    if df is None:
+        df_base = cargar(symbol, base, cache_dir=cache_dir)
+        if df_base is None:
+            return None
+        df = resamplear(df_base, base, tf)
+        _memo[key] = df
+    if since is not None:
+        df = df[df["time"] >= pd.to_datetime(since, utc=True)]
+    if until is not None:
+        df = df[df["time"] < pd.to_datetime(until, utc=True)]
+    return df.reset_index(drop=True).copy()
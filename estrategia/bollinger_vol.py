@@ -12,33 +12,82 @@ Generador de señal con filtros cableados al JSON (sección 'estrategia').
     use_min_dist_ema200, min_dist_ema200_pct
     use_breakout_retest, breakout_retest_min_atr_mult, confirm_wait_bars
     use_atr, atr_period   (para guards que dependen de ATR)
+    usar_htf_tendencia, usar_htf_adx, htf_*  (contexto 1h/4h, ver estrategia.htf)
 """
 
 import math
 import numpy as np
 import pandas as pd
 
-# =============== Indicadores base ===============
+from estrategia import htf as _htf
 
-def _ema(s: pd.Series, n: int):
-    return s.ewm(span=max(1, int(n)), adjust=False).mean()
+# =============== Indicadores base ===============
 
-def _rsi(close: pd.Series, n: int = 14):
+def _media_movil(s: pd.Series, n: int) -> pd.Series:
+    """
+    rolling(n, min_periods=n).mean() calculada ventana por ventana: cada valor
+    depende solo de sus n velas (la de pandas arrastra redondeo desde el inicio
+    de la serie), así que un tramo con solape da los mismos bits que la
+    historia entera. Suma desvíos respecto de la primera vela de la ventana:
+    una ventana plana da exactamente su valor.
+    """
+    x = s.to_numpy(dtype=float)
+    out = np.full(len(x), np.nan)
+    m = len(x) - n + 1
+    if m > 0:
+        base = x[:m]
+        acc = np.zeros(m)
+        for k in range(1, n):
+            acc += x[k:k + m] - base
+        out[n - 1:] = base + acc / n
+    return pd.Series(out, index=s.index)
+
+def _std_movil(s: pd.Series, n: int, media: pd.Series) -> pd.Series:
+    """rolling(n).std(ddof=0) por ventana (ver _media_movil), dada su media móvil."""
+    x = s.to_numpy(dtype=float)
+    out = np.full(len(x), np.nan)
+    m = len(x) - n + 1
+    if m > 0:
+        mu = media.to_numpy(dtype=float)[n - 1:]
+        acc = np.zeros(m)
+        for k in range(n):
+            d = x[k:k + m] - mu
+            acc += d * d
+        out[n - 1:] = np.sqrt(acc / n)
+    return pd.Series(out, index=s.index)
+
+def _ewm(s: pd.Series, semilla=None, **kw):
+    """ewm(adjust=False).mean(); con `semilla` (valor en la vela anterior a s) sigue la recursión exacta."""
+    if semilla is None or len(s) == 0:
+        return s.ewm(adjust=False, **kw).mean()
+    out = pd.concat([pd.Series([float(semilla)]), s], ignore_index=True).ewm(adjust=False, **kw).mean()
+    return pd.Series(out.to_numpy()[1:], index=s.index)
+
+def _ema(s: pd.Series, n: int, semilla=None):
+    return _ewm(s, semilla, span=max(1, int(n)))
+
+def _rsi_partes(close: pd.Series, n: int = 14, semilla=None):
+    """(rsi, ma_up, ma_dn); semilla = (close previo, ma_up previo, ma_dn previo)."""
     n = max(2, int(n))
     delta = close.diff()
+    if semilla is not None and len(close):
+        delta.iloc[0] = close.iloc[0] - semilla[0]
     up = delta.clip(lower=0.0)
     dn = -delta.clip(upper=0.0)
-    ma_up = up.ewm(alpha=1/n, adjust=False).mean()
-    ma_dn = dn.ewm(alpha=1/n, adjust=False).mean()
+    ma_up = _ewm(up, None if semilla is None else semilla[1], alpha=1/n)
+    ma_dn = _ewm(dn, None if semilla is None else semilla[2], alpha=1/n)
     rs = ma_up / ma_dn.replace(0, np.nan)
     out = 100 - (100 / (1 + rs))
-    return out.fillna(50)
+    return out.fillna(50), ma_up, ma_dn
+
+def _rsi(close: pd.Series, n: int = 14):
+    return _rsi_partes(close, n)[0]
 
 def _atr(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14):
     n = max(1, int(n))
     prev = close.shift(1)
     tr = pd.concat([high - low, (high - prev).abs(), (low - prev).abs()], axis=1).max(axis=1)
-    return tr.rolling(n, min_periods=n).mean()
+    return _media_movil(tr, n)
 
 def _adx(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14):
     """
@@ -57,19 +106,19 @@ def _adx(high: pd.Series, low: pd.Series, close: pd.Series, n: int = 14):
         (low  - close.shift(1)).abs()
     ], axis=1).max(axis=1)
 
-    atr = tr.rolling(n, min_periods=n).mean()
-    plus_di  = 100 * pd.Series(plus_dm, index=high.index).rolling(n, min_periods=n).mean() / atr.replace(0, np.nan)
-    minus_di = 100 * pd.Series(minus_dm, index=high.index).rolling(n, min_periods=n).mean() / atr.replace(0, np.nan)
+    atr = _media_movil(tr, n)
+    plus_di  = 100 * _media_movil(pd.Series(plus_dm, index=high.index), n) / atr.replace(0, np.nan)
+    minus_di = 100 * _media_movil(pd.Series(minus_dm, index=high.index), n) / atr.replace(0, np.nan)
 
     dx = ( (plus_di - minus_di).abs() / (plus_di + minus_di).replace(0, np.nan) ) * 100
-    adx = dx.rolling(n, min_periods=n).mean()
+    adx = _media_movil(dx, n)
     return adx.fillna(0), plus_di.fillna(0), minus_di.fillna(0)
 
 def _bb(close: pd.Series, n: int = 20, mult: float = 2.0):
     n = max(2, int(n))
     mult = float(mult)
-    ma = close.rolling(n, min_periods=n).mean()
-    std = close.rolling(n, min_periods=n).std(ddof=0)
+    ma = _media_movil(close, n)
+    std = _std_movil(close, n, ma)
     up = ma + mult*std
     lo = ma - mult*std
     width = (up - lo).abs()
@@ -160,7 +209,7 @@ def _generar_senal_core(rows, _ctx, cfg_estrategia: dict):
 
     # === Cálculos
     ma, bb_up, bb_lo, bbw = _bb(close, bb_len, bb_mult)
-    bbw_ma = bbw.rolling(bbw_ma_len, min_periods=bbw_ma_len).mean()
+    bbw_ma = _media_movil(bbw, bbw_ma_len)
 
     ema = _ema(close, ema_len) if usar_ema200 or use_ema200_slope or use_min_dist_ema200 else pd.Series(index=close.index, dtype=float)
     ema_slope_pct = _pct_slope(ema) if use_ema200_slope else pd.Series(index=close.index, dtype=float)
@@ -175,6 +224,20 @@ def _generar_senal_core(rows, _ctx, cfg_estrategia: dict):
 
     i = len(close) - 1
 
+    # Contexto HTF: el bot lo trae en el estado (almacén de velas); si no, se agrega de `rows`
+    htf_ctx = _ctx.get("htf") if isinstance(_ctx, dict) else None
+
+    def cond_htf(lado):
+        nonlocal htf_ctx
+        if not _htf.activo(E): return True
+        if htf_ctx is None: htf_ctx = _htf.contexto_filas(df, E)
+        return bool(_htf.filtros(htf_ctx, E)[0 if lado == "long" else 1])
+
+    def tendencia_1h():
+        nonlocal htf_ctx
+        if htf_ctx is None: htf_ctx = _htf.contexto_filas(df, E)
+        return _htf.etiqueta(htf_ctx, "1h")
+
     # === Filtros comunes (aplican a LONG/SHORT según corresponda)
 
     def cond_ema_long():
@@ -297,8 +360,9 @@ def _generar_senal_core(rows, _ctx, cfg_estrategia: dict):
         and cond_adx_long()
         and cond_squeeze_long()
         and cond_rsi_long()
-        and cond_breakout_retest_long()):
-        return {"accion": "BUY", "precio": float(close.iloc[i])}
+        and cond_breakout_retest_long()
+        and cond_htf("long")):
+        return {"accion": "BUY", "precio": float(close.iloc[i]), "tendencia_1h": tendencia_1h()}
 
     # === Evaluación SHORT
     if (trigger_short()
@@ -306,8 +370,9 @@ def _generar_senal_core(rows, _ctx, cfg_estrategia: dict):
         and cond_adx_short()
         and cond_squeeze_short()
         and cond_rsi_short()
-        and cond_breakout_retest_short()):
-        return {"accion": "SELL", "precio": float(close.iloc[i])}
+        and cond_breakout_retest_short()
+        and cond_htf("short")):
+        return {"accion": "SELL", "precio": float(close.iloc[i]), "tendencia_1h": tendencia_1h()}
 
     return {}
 
@@ -353,3 +418,193 @@ def generar_senal(rows_or_velas, estado=None, cfg=None):
     except TypeError:
         # Intento alternativo sin estado
         return _generar_senal_core(rows, {}, cfg_estrategia)
+
+
+# ======== Señales vectorizadas (backtest) ========
+def senales_vectorizadas(df, cfg_estrategia: dict, warmup: int = 250, tf_ms: int | None = None,
+                         cache=None):
+    """
+    Mismas condiciones que _generar_senal_core evaluadas sobre TODAS las velas
+    a la vez. Devuelve np.int8: +1 BUY, -1 SELL, 0 nada (las primeras `warmup`
+    velas quedan en 0, igual que el bot con menos de 250 velas).
+    `tf_ms` (TF de `df`) solo hace falta para los filtros HTF; si falta se infiere de `ts`.
+    `cache`: estrategia.cache_indicadores.CacheIndicadores (BB/EMA/RSI/ADX/ATR del disco).
+
+    Nota: EMA/RSI se calculan sobre toda la historia; el bot los calcula sobre
+    la ventana de 250 velas, así que cerca del umbral puede haber diferencias.
+    """
+    return _senales(df, cfg_estrategia, warmup, tf_ms, cache=cache)[0]
+
+
+def _senales(df, cfg_estrategia: dict, warmup: int = 250, tf_ms: int | None = None,
+             semillas: dict | None = None, corte: int | None = None, offset: int = 0, cache=None):
+    """
+    senales_vectorizadas por tramos (ver SenalesStream). `semillas`: estado de
+    las recursiones (EMA, RSI, EMA HTF) en la vela anterior a df[0], que es la
+    vela `offset` de la historia. Devuelve (señales, semillas en df[corte]).
+    """
+    E = cfg_estrategia or {}
+    sem = dict(semillas or {})
+    nuevas = {}
+    close = df["close"].astype(float).reset_index(drop=True)
+    high = df["high"].astype(float).reset_index(drop=True)
+    low = df["low"].astype(float).reset_index(drop=True)
+    n = len(close)
+    if n == 0:
+        return np.zeros(0, dtype=np.int8), dict(semillas or {})
+    huella = None
+    if cache is not None and not sem:
+        from estrategia.cache_indicadores import firma
+        huella = firma(close, high, low)
+
+    def ind(nombre, params, fn):
+        return fn() if huella is None else cache.memo(huella, nombre, params, fn, close.index)
+
+    bb_len = int(E.get("bb_len", 20)); bb_mult = float(E.get("bb_mult", 2.0))
+    bbw_ma_len = int(E.get("bb_width_ma_len", 50))
+    squeeze_mult = float(E.get("squeeze_mult", 1.0)); usar_squeeze = bool(E.get("usar_squeeze", False))
+    usar_ema200 = bool(E.get("usar_ema200", True)); ema_len = int(E.get("ema_len", 200))
+    use_ema200_slope = bool(E.get("use_ema200_slope", False))
+    ema200_slope_min = float(E.get("ema200_slope_min_pct_per_bar", 0.0))
+    use_min_dist_ema200 = bool(E.get("use_min_dist_ema200", False))
+    min_dist_ema200_pct = float(E.get("min_dist_ema200_pct", 0.0))
+    usar_adx = bool(E.get("usar_adx", False)); adx_len = int(E.get("adx_len", 14))
+    adx_min = float(E.get("adx_min", 0.0)); use_adx_rising = bool(E.get("use_adx_rising", False))
+    adx_delta_min = float(E.get("adx_delta_min", 0.0))
+    usar_rsi = bool(E.get("usar_rsi", False)); rsi_len = int(E.get("rsi_len", 14))
+    rsi_long_min = float(E.get("rsi_long_min", 0.0)); rsi_short_max = float(E.get("rsi_short_max", 100.0))
+    use_rsi_guard = bool(E.get("use_rsi_guard", False)); rsi_delta_min = float(E.get("rsi_delta_min", 0.0))
+    rsi_overbought = float(E.get("rsi_overbought", 100.0))
+    use_breakout_retest = bool(E.get("use_breakout_retest", False))
+    br_mult = float(E.get("breakout_retest_min_atr_mult", 0.0))
+    bars = max(1, int(E.get("confirm_wait_bars", 0)))
+    use_atr = bool(E.get("use_atr", False)); atr_period = int(E.get("atr_period", 14))
+
+    ma, bb_up, bb_lo, bbw = ind("bb", (bb_len, bb_mult), lambda: _bb(close, bb_len, bb_mult))
+    true_ = pd.Series(True, index=close.index)
+
+    long_ok = (close > bb_up)
+    short_ok = (close < bb_lo)
+
+    if usar_ema200:
+        ema = ind("ema", (ema_len,), lambda: _ema(close, ema_len, sem.get("ema")))
+        if corte:
+            nuevas["ema"] = float(ema.iloc[corte - 1])
+        ok_l = ema.notna() & ~(close <= ema)
+        ok_s = ema.notna() & ~(close >= ema)
+        if use_ema200_slope:
+            sl = _pct_slope(ema)
+            ok_l &= ~(sl < ema200_slope_min)
+            ok_s &= ~(sl > -ema200_slope_min)
+        if use_min_dist_ema200:
+            lejos = ~((close - ema).abs() / ema * 100.0 < min_dist_ema200_pct)
+            ok_l &= lejos; ok_s &= lejos
+        long_ok &= ok_l; short_ok &= ok_s
+
+    if usar_adx:
+        adx, _, _ = ind("adx", (adx_len,), lambda: _adx(high, low, close, adx_len))
+        ok = ~(adx < adx_min)
+        if use_adx_rising:
+            ok &= ~(adx.diff() < adx_delta_min)
+        long_ok &= ok; short_ok &= ok
+
+    if usar_squeeze:
+        bbw_ma = _media_movil(bbw, bbw_ma_len)
+        ok = bbw_ma.notna() & (bbw_ma != 0) & ~((bbw / bbw_ma.replace(0, np.nan)) < squeeze_mult)
+        long_ok &= ok; short_ok &= ok
+
+    if usar_rsi or use_rsi_guard:
+        rsi, ma_up, ma_dn = ind("rsi", (rsi_len,), lambda: _rsi_partes(close, rsi_len, sem.get("rsi")))
+        if corte:
+            nuevas["rsi"] = (float(close.iloc[corte - 1]), float(ma_up.iloc[corte - 1]), float(ma_dn.iloc[corte - 1]))
+        rsi_delta = rsi.diff()
+        ok_l, ok_s = true_.copy(), true_.copy()
+        if usar_rsi:
+            ok_l &= ~(rsi < rsi_long_min)
+            ok_s &= ~(rsi > rsi_short_max)
+        if use_rsi_guard:
+            ok_l &= ~(rsi_delta < rsi_delta_min) & ~(rsi > rsi_overbought)
+            ok_s &= ~(-rsi_delta < rsi_delta_min)
+        long_ok &= ok_l; short_ok &= ok_s
+
+    if use_breakout_retest:
+        atr_abs = ind("atr", (atr_period,), lambda: _atr(high, low, close, atr_period))
+        c_b, up_b, lo_b = close.shift(bars), bb_up.shift(bars), bb_lo.shift(bars)
+        atr_b = atr_abs.shift(bars)
+        con_atr = (br_mult > 0) & atr_abs.notna()
+        min_pull = close.shift(1).rolling(bars, min_periods=bars).min()
+        max_pull = close.shift(1).rolling(bars, min_periods=bars).max()
+        low_min = low.shift(1).rolling(bars, min_periods=bars).min()
+        high_max = high.shift(1).rolling(bars, min_periods=bars).max()
+        ma_min = ma.shift(1).rolling(bars, min_periods=bars).min()
+        ma_max = ma.shift(1).rolling(bars, min_periods=bars).max()
+        idx_ok = pd.Series(np.arange(n) >= bars + 2, index=close.index)
+
+        ok_l = idx_ok & ~(c_b <= up_b) & ~(close <= ma)
+        ok_l &= np.where(con_atr, ~((c_b - min_pull) < br_mult * atr_b), ~(low_min > ma_min))
+        ok_s = idx_ok & ~(c_b >= lo_b) & ~(close >= ma)
+        ok_s &= np.where(con_atr, ~((max_pull - c_b) < br_mult * atr_b), ~(high_max < ma_max))
+        long_ok &= ok_l; short_ok &= ok_s
+
+    if _htf.activo(E) and "ts" in df.columns:
+        ts = df["ts"].to_numpy("int64")
+        if tf_ms is None:
+            paso = np.diff(ts)
+            tf_ms = int(paso[paso > 0].min()) if (paso > 0).any() else 0
+        if tf_ms:
+            corte_ts = int(ts[corte]) if corte is not None and corte < n else None
+            ctx, nuevas["htf"] = _htf.contexto_semillas(
+                ts, df["open"].to_numpy(float), high.to_numpy(), low.to_numpy(), close.to_numpy(),
+                df["volume"].to_numpy(float), tf_ms, E, sem.get("htf"), corte_ts)
+            ok_l, ok_s = _htf.filtros(ctx, E)
+            long_ok &= ok_l; short_ok &= ok_s
+
+    out = np.where(long_ok.to_numpy(bool), 1, np.where(short_ok.to_numpy(bool), -1, 0)).astype(np.int8)
+    out[:min(n, max(0, int(warmup) - 1 - int(offset)))] = 0
+    return out, (nuevas if corte else sem)
+
+
+def solape_senales(cfg_estrategia: dict, tf_ms: int) -> int:
+    """
+    Velas previas que necesita cada tramo para que las ventanas móviles (BB,
+    ADX, ATR, squeeze, breakout y ADX de los HTF) salgan igual que sobre toda
+    la historia; las recursiones (EMA/RSI) van por semilla y no suman.
+    """
+    E = cfg_estrategia or {}
+    w = max(int(E.get("bb_len", 20)) + int(E.get("bb_width_ma_len", 50)),
+            2 * int(E.get("adx_len", 14)), int(E.get("atr_period", 14)) + 1,
+            max(1, int(E.get("confirm_wait_bars", 0))) + int(E.get("bb_len", 20)) + 3)
+    if _htf.activo(E):
+        tfs, _, adx_len = _htf.params(E)
+        for tf in tfs:
+            razon = max(1, _htf.tf_a_ms(tf) // max(1, int(tf_ms)))
+            w = max(w, (2 * adx_len + 2) * razon)
+    return 2 * w + 2
+
+
+class SenalesStream:
+    """
+    senales_vectorizadas sobre la historia en tramos (backtest en streaming):
+    guarda las últimas `solape` velas y las semillas de EMA/RSI/EMA HTF, y
+    cada `procesar(tramo)` devuelve las señales de las velas del tramo.
+    Las EMAs siguen la misma recursión que sobre toda la historia y las
+    medias móviles se calculan por ventana (_media_movil): las señales son
+    bit a bit las de senales_vectorizadas.
+    """
+
+    def __init__(self, cfg_estrategia: dict, tf_ms: int, warmup: int = 250):
+        self.E, self.tf_ms, self.warmup = cfg_estrategia or {}, int(tf_ms), int(warmup)
+        self.solape = solape_senales(self.E, self.tf_ms)
+        self.cola = None
+        self.semillas = None
+        self.offset = 0
+
+    def procesar(self, tramo: pd.DataFrame) -> np.ndarray:
+        tramo = tramo.reset_index(drop=True)
+        df = tramo if self.cola is None else pd.concat([self.cola, tramo], ignore_index=True)
+        previas = 0 if self.cola is None else len(self.cola)
+        corte = max(0, len(df) - self.solape)
+        out, self.semillas = _senales(df, self.E, self.warmup, self.tf_ms, self.semillas, corte, self.offset)
+        self.offset += corte
+        self.cola = df.iloc[corte:].reset_index(drop=True)
+        return out[previas:]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistente de indicadores para las señales vectorizadas (backtest,
+optimizador, walk-forward, UI).
+
+- Direccionado por contenido: clave = sha256 de (firma de los datos,
+  indicador, parámetros, versión del código de los indicadores). La firma es
+  un blake2b de los bytes de close/high/low: el mismo rango de velas da la
+  misma clave venga del archivo, la sesión o el proceso que venga.
+- Un .npy por entrada en cache/.indicadores/ (1D si el indicador devuelve una
+  serie, 2D con una fila por columna si devuelve varias). Se leen con
+  np.load(mmap_mode="r"): un run caliente no copia ni calcula nada.
+- LRU por tamaño total (`max_disco_mb`): cada lectura toca el mtime; al
+  escribir se borran las entradas más viejas hasta quedar bajo el tope.
+- Escritura tmp + os.replace: varios workers pueden escribir la misma clave.
+
+Se activa con backtest.cache_indicadores.enabled (por defecto sí).
+"""
+import hashlib
+import json
+import logging
+import os
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+LOG = logging.getLogger("bibit")
+
+ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = ROOT / "cache" / ".indicadores"
+MAX_MB = 1024.0
+
+
+@lru_cache(maxsize=1)
+def version_indicadores() -> str:
+    return hashlib.sha256((Path(__file__).parent / "bollinger_vol.py").read_bytes()).hexdigest()[:16]
+
+
+def firma(*columnas) -> str:
+    """Huella de los datos de entrada (bytes float64 de cada columna)."""
+    h = hashlib.blake2b(digest_size=16)
+    for col in columnas:
+        a = np.ascontiguousarray(np.asarray(col, dtype=np.float64))
+        h.update(str(a.shape).encode())
+        h.update(a.data)
+    return h.hexdigest()
+
+
+class CacheIndicadores:
+    def __init__(self, directorio: Optional[Path] = None, max_disco_mb: float = MAX_MB):
+        self.dir = Path(directorio or CACHE_DIR)
+        self.max_disco = int(float(max_disco_mb) * 1e6)
+        self.hits = self.misses = 0
+
+    def _ruta(self, huella: str, nombre: str, params) -> Path:
+        k = json.dumps([version_indicadores(), huella, nombre, params], default=str)
+        return self.dir / f"{nombre}_{hashlib.sha256(k.encode('utf-8')).hexdigest()[:32]}.npy"
+
+    def memo(self, huella: str, nombre: str, params, fn: Callable, index: pd.Index):
+        """
+        Resultado de `fn()` (Series o tupla de Series) para `huella` + `params`:
+        del disco si está (Series sobre el memmap), si no lo calcula y lo guarda.
+        """
+        p = self._ruta(huella, nombre, params)
+        try:
+            arr = np.load(p, mmap_mode="r")
+            if arr.shape[-1] == len(index):
+                os.utime(p)
+                self.hits += 1
+                if arr.ndim == 1:
+                    return pd.Series(arr, index=index, copy=False)
+                return tuple(pd.Series(fila, index=index, copy=False) for fila in arr)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            LOG.warning("CACHE indicador %s ilegible: %s", p.name, e)
+        self.misses += 1
+        r = fn()
+        self._guardar(p, r)
+        return r
+
+    def _guardar(self, p: Path, r):
+        try:
+            cols = r if isinstance(r, tuple) else (r,)
+            arr = np.stack([np.asarray(c, dtype=np.float64) for c in cols])
+            self.dir.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_name(f".{p.stem}.{uuid.uuid4().hex[:8]}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr if isinstance(r, tuple) else arr[0])
+            os.replace(tmp, p)
+            self._podar()
+        except Exception as e:
+            LOG.warning("CACHE no pude guardar indicador %s: %s", p.name, e)
+
+    def _podar(self):
+        archivos = []
+        for p in self.dir.glob("*.npy"):
+            try:
+                st = p.stat()
+                archivos.append((st.st_mtime, st.st_size, p))
+            except FileNotFoundError:
+                continue
+        total = sum(s for _, s, _ in archivos)
+        for _, s, p in sorted(archivos):
+            if total <= self.max_disco:
+                break
+            p.unlink(missing_ok=True)
+            total -= s
+
+
+_por_defecto: Optional[CacheIndicadores] = None
+
+
+def por_defecto(max_disco_mb: Optional[float] = None) -> CacheIndicadores:
+    global _por_defecto
+    if _por_defecto is None:
+        _por_defecto = CacheIndicadores()
+    if max_disco_mb is not None:
+        _por_defecto.max_disco = int(float(max_disco_mb) * 1e6)
+    return _por_defecto
+
+
+def desde_cfg(cfg: Dict) -> Optional[CacheIndicadores]:
+    """El cache del proceso si backtest.cache_indicadores.enabled; None si está apagado."""
+    ci = ((cfg or {}).get("backtest") or {}).get("cache_indicadores") or {}
+    if not ci.get("enabled", True):
+        return None
+    return por_defecto(ci.get("max_mb"))
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Contexto de TF mayores (1h/4h) para estrategia.bollinger_vol.
+
+Todo sale de velas del TF base agregadas (datos.resample.agregar en backtest,
+core.velas.AlmacenVelas en vivo), nunca de un get_klines por TF:
+  - tendencia: cierre HTF vs EMA(htf_ema_len) -> +1 / -1 (0 sin historia);
+  - ADX(htf_adx_len) del HTF, mismo cálculo que el filtro ADX del TF base.
+Una vela base solo ve las velas HTF ya cerradas a su cierre (sin lookahead),
+igual en vivo y en backtest.
+
+Llaves en 'estrategia':
+    htf_tfs, htf_ema_len, htf_adx_len
+    usar_htf_tendencia          LONG solo si todos los htf_tfs están en +1, SHORT en -1
+    usar_htf_adx, htf_adx_min   ADX de todos los htf_tfs >= mínimo
+"""
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from datos.cache_ohlcv import tf_a_ms
+from datos.resample import agregar
+
+ETIQUETA = {1: "ALCISTA", -1: "BAJISTA", 0: "N/A"}
+
+
+def params(E: Dict):
+    E = E or {}
+    return (list(E.get("htf_tfs", ["1h", "4h"]) or []), int(E.get("htf_ema_len", 50)),
+            int(E.get("htf_adx_len", 14)))
+
+
+def activo(E: Dict) -> bool:
+    E = E or {}
+    return bool(E.get("usar_htf_tendencia", False)) or bool(E.get("usar_htf_adx", False))
+
+
+def indicadores(c, h, l, ema_len: int, adx_len: int):
+    """Arrays de velas HTF cerradas -> (tendencia int8, adx)."""
+    return _indicadores(c, h, l, ema_len, adx_len)[:2]
+
+
+def _indicadores(c, h, l, ema_len: int, adx_len: int, semilla_ema=None, previas: int = 0):
+    """(tendencia, adx, ema); `previas` = velas HTF de la historia antes de c[0] (tramos)."""
+    from estrategia.bollinger_vol import _adx, _ema
+    c, h, l = (pd.Series(np.asarray(x, dtype=float)) for x in (c, h, l))
+    if len(c) == 0:
+        return np.zeros(0, dtype=np.int8), np.zeros(0), np.zeros(0)
+    ema = _ema(c, ema_len, semilla_ema).to_numpy()
+    tend = np.sign(c.to_numpy() - ema).astype(np.int8)
+    tend[:max(0, ema_len - 1 - previas)] = 0            # EMA sin historia suficiente
+    adx = _adx(h, l, c, adx_len)[0].to_numpy(dtype=float, copy=True)
+    adx[:max(0, 2 * adx_len - 2 - previas)] = np.nan    # _adx rellena con 0 el arranque
+    return tend, adx, ema
+
+
+def alinear(ts_htf, htf_ms: int, ts_base, base_ms: int) -> np.ndarray:
+    """Índice de la última vela HTF cerrada al cierre de cada vela base (-1 si ninguna)."""
+    return np.searchsorted(np.asarray(ts_htf, dtype="int64") + htf_ms,
+                           np.asarray(ts_base, dtype="int64") + base_ms, side="right") - 1
+
+
+def contexto(ts, o, h, l, c, v, base_ms: int, E: Dict) -> Dict[str, Dict[str, np.ndarray]]:
+    """{tf: {"tendencia", "adx"}} alineados a las velas base (arrays de len(ts))."""
+    return contexto_semillas(ts, o, h, l, c, v, base_ms, E)[0]
+
+
+def contexto_semillas(ts, o, h, l, c, v, base_ms: int, E: Dict, semillas: Optional[Dict] = None,
+                      corte_ts: Optional[int] = None):
+    """
+    contexto() por tramos: `semillas` {tf: (ema previa, velas HTF previas)}
+    del tramo anterior; devuelve además las del tramo que arranca en `corte_ts`
+    (las velas HTF que empiezan antes quedan en la semilla).
+    """
+    tfs, ema_len, adx_len = params(E)
+    ts = np.asarray(ts, dtype="int64")
+    semillas = semillas or {}
+    out, nuevas = {}, {}
+    for tf in tfs:
+        tend_b, adx_b = np.zeros(len(ts), dtype=np.int8), np.full(len(ts), np.nan)
+        htf_ms = tf_a_ms(tf)
+        ema_0, previas = semillas.get(tf, (None, 0))
+        nuevas[tf] = (ema_0, previas)
+        if htf_ms > base_ms and htf_ms % base_ms == 0 and len(ts):
+            th, _, hh, lh, ch, _ = agregar(ts, o, h, l, c, v, base_ms, htf_ms)
+            if len(th):
+                tend, adx, ema = _indicadores(ch, hh, lh, ema_len, adx_len, ema_0, previas)
+                j = alinear(th, htf_ms, ts, base_ms)
+                ok = j >= 0
+                tend_b[ok], adx_b[ok] = tend[j[ok]], adx[j[ok]]
+                k = int(np.searchsorted(th, corte_ts)) if corte_ts is not None else 0
+                if k:
+                    nuevas[tf] = (float(ema[k - 1]), previas + k)
+        out[tf] = {"tendencia": tend_b, "adx": adx_b}
+    return out, nuevas
+
+
+def contexto_filas(df: pd.DataFrame, E: Dict) -> Dict[str, Dict]:
+    """Contexto de la última vela de `df` (ts ms o time s); fallback sin almacén."""
+    if "ts" in df.columns:
+        ts = df["ts"].to_numpy("int64")
+    else:
+        ts = (df["time"].astype(float) * 1000).to_numpy("int64")
+    paso = np.diff(ts)
+    paso = paso[paso > 0]
+    if not len(paso):
+        return {}
+    ctx = contexto(ts, df["open"], df["high"], df["low"], df["close"],
+                   df.get("volume", pd.Series(np.zeros(len(df)))), int(paso.min()), E)
+    return {tf: {"tendencia": int(d["tendencia"][-1]), "adx": float(d["adx"][-1])} for tf, d in ctx.items()}
+
+
+def filtros(ctx: Dict[str, Dict], E: Dict):
+    """(ok_long, ok_short) para arrays (backtest) o escalares (vivo)."""
+    E = E or {}
+    usar_t = bool(E.get("usar_htf_tendencia", False))
+    usar_a = bool(E.get("usar_htf_adx", False))
+    adx_min = float(E.get("htf_adx_min", 20.0))
+    ok_l = ok_s = np.True_
+    for tf in params(E)[0]:
+        d = ctx.get(tf) or {"tendencia": 0, "adx": np.nan}
+        t, a = np.asarray(d["tendencia"]), np.asarray(d["adx"], dtype=float)
+        if usar_t:
+            ok_l = ok_l & (t == 1)
+            ok_s = ok_s & (t == -1)
+        if usar_a:
+            fuerte = ~np.isnan(a) & (a >= adx_min)
+            ok_l, ok_s = ok_l & fuerte, ok_s & fuerte
+    return ok_l, ok_s
+
+
+def etiqueta(ctx: Dict[str, Dict], tf: str = "1h") -> str:
+    d = (ctx or {}).get(tf)
+    if not d:
+        return "N/A"
+    txt = ETIQUETA.get(int(d["tendencia"]), "N/A")
+    adx = float(d["adx"])
+    return txt if np.isnan(adx) else f"{txt} (ADX {adx:.1f})"
+
+
+class ContextoHTF:
+    """
+    Contexto en vivo por símbolo. Las velas HTF llegan ya agregadas por el
+    almacén (sin REST); los indicadores se recalculan solo cuando cierra una
+    vela HTF nueva, entre cierres se devuelve el último valor.
+    """
+
+    def __init__(self):
+        self._memo: Dict[tuple, tuple] = {}     # (sym, tf) -> (firma, valor)
+
+    def actualizar(self, sym: str, velas_tf: Callable[[str], List[Dict]], t_base_s: float,
+                   base_s: int, E: Dict) -> Dict[str, Dict]:
+        tfs, ema_len, adx_len = params(E)
+        out = {}
+        for tf in tfs:
+            htf_s = tf_a_ms(tf) // 1000
+            velas = velas_tf(tf) or []
+            n = len(velas)
+            while n and float(velas[n - 1]["time"]) + htf_s > float(t_base_s) + base_s:
+                n -= 1                                  # cubeta en curso
+            if not n:
+                out[tf] = {"tendencia": 0, "adx": float("nan")}
+                continue
+            firma = (float(velas[n - 1]["time"]), n, ema_len, adx_len)
+            memo = self._memo.get((sym, tf))
+            if memo is None or memo[0] != firma:
+                cerradas = velas[:n]
+                tend, adx = indicadores([x["close"] for x in cerradas], [x["high"] for x in cerradas],
+                                        [x["low"] for x in cerradas], ema_len, adx_len)
+                memo = (firma, {"tendencia": int(tend[-1]), "adx": float(adx[-1])})
+                self._memo[(sym, tf)] = memo
+            out[tf] = memo[1]
+        return out
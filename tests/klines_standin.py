@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in local de /v5/market/kline (Bybit v5) para probar datos.descarga sin
+red: velas sintéticas deterministas, más nuevas primero, `limit` como el real.
+`fallar_desde=n` responde 500 a partir del request n (corte de red simulado).
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_MS = {"D": 86_400_000}
+
+
+def vela(ts: int):
+    base = 100.0 + (ts // 60_000) % 500 * 0.1
+    return [str(ts), f"{base:.2f}", f"{base + 1:.2f}", f"{base - 1:.2f}", f"{base + 0.5:.2f}", "10", "1000"]
+
+
+class KlinesStandIn:
+    def __init__(self, fallar_desde=None):
+        self.requests = 0
+        self.fallar_desde = fallar_desde
+        padre = self
+
+        class _H(BaseHTTPRequestHandler):
+            def log_message(self, *a):
+                pass
+
+            def do_GET(self):
+                padre.requests += 1
+                if padre.fallar_desde is not None and padre.requests >= padre.fallar_desde:
+                    self.send_response(500); self.end_headers(); return
+                q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                paso = _MS.get(q["interval"], int(q["interval"] or 1) * 60_000)
+                ini, fin, lim = int(q["start"]), int(q["end"]), int(q.get("limit", 200))
+                t0 = ini + (-ini) % paso
+                lista = [vela(t) for t in range(t0, fin + 1, paso)][:lim][::-1]
+                body = json.dumps({"retCode": 0, "retMsg": "OK", "result": {"list": lista}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _H)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def cerrar(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in del stream privado de Bybit: reproduce mensajes grabados
+(tests/streams/*.json) contra adapters.bybit_stream.StreamPrivado.
+"""
+import json
+from pathlib import Path
+
+STREAMS_DIR = Path(__file__).resolve().parent / "streams"
+
+
+class StreamStandIn:
+    """Transporte falso: expone is_connected()/exit() como el WebSocket de pybit."""
+    def __init__(self, nombre_o_ruta):
+        p = Path(nombre_o_ruta)
+        if not p.exists():
+            p = STREAMS_DIR / f"{nombre_o_ruta}.json"
+        data = json.loads(p.read_text(encoding="utf-8"))
+        self.name = data.get("name", p.stem)
+        self.mensajes = list(data.get("mensajes", []))
+        self.conectado = True
+        self.callback = None
+
+    def is_connected(self):
+        return self.conectado
+
+    def exit(self):
+        self.conectado = False
+
+    def emitir(self, stream, hasta=None):
+        """Entrega los mensajes (todos o hasta el id dado) al callback del stream."""
+        while self.mensajes:
+            m = self.mensajes.pop(0)
+            stream.procesar(m)
+            if hasta is not None and m.get("id") == hasta:
+                break
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting.almacen import AlmacenCorridas  # noqa: E402
+
+
+def _corrida(a, i, symbol="ETHUSDT", tf="30m"):
+    eq = pd.DataFrame({"time": pd.date_range("2024-01-01", periods=10, freq="30min"),
+                       "equity": 1000.0 + i * pd.Series(range(10), dtype=float)})
+    trades = pd.DataFrame({"pnl": [float(i), -1.0], "side": ["BUY", "SELL"]})
+    return a.guardar(symbol, tf, {"estrategia": {"bb_len": 20 + i}}, trades, eq,
+                     {"trades": 2, "pnl": i - 1.0, "pf": float(i), "max_dd": 10.0 - i}, clave=f"k{symbol}{tf}{i}")
+
+
+def test_top_por_metrica_y_filtros(tmp_path):
+    a = AlmacenCorridas(tmp_path)
+    ids = [_corrida(a, i) for i in range(5)] + [_corrida(a, 9, tf="1h")]
+    assert _corrida(a, 3) == ids[3]                                      # misma clave: no duplica
+
+    top = a.top("pf", n=3, symbol="ETHUSDT", tf="30m")
+    assert top["pf"].tolist() == [4.0, 3.0, 2.0] and top["desde_ms"].iloc[0] == 1704067200000
+    assert a.top("max_dd", n=1, tf="30m")["max_dd"].tolist() == [6.0]  # menor DD primero
+    assert len(a.buscar(pnl_min=2.0)) == 3 and ("ETHUSDT", "1h") in a.pares()
+
+
+def test_cargar_y_superponer_sin_recalcular(tmp_path):
+    a = AlmacenCorridas(tmp_path)
+    x, y = _corrida(a, 1), _corrida(a, 2)
+    d = AlmacenCorridas(tmp_path).cargar(x)                              # otra instancia: todo desde disco
+    assert d["config"] == {"estrategia": {"bb_len": 21}} and d["metricas"]["pf"] == 1.0
+    assert d["trades"]["pnl"].tolist() == [1.0, -1.0]
+    eqs = a.equities([y, x])
+    assert list(eqs) == [y, x] and eqs[y]["equity"].iloc[-1] == 1018.0
+    a.borrar(x)
+    assert a.cargar(x) is None and not list((tmp_path / "blobs").glob(f"{x}_*"))
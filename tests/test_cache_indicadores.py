@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from estrategia import bollinger_vol as bv  # noqa: E402
+from estrategia.cache_indicadores import CacheIndicadores, firma  # noqa: E402
+
+E = {"usar_ema200": True, "usar_rsi": True, "rsi_long_min": 45, "rsi_short_max": 55, "bb_mult": 1.0,
+     "usar_adx": True, "adx_min": 15, "use_breakout_retest": True, "use_atr": True}
+
+
+def _df(n=3_000, semilla=1):
+    rng = np.random.default_rng(semilla)
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    o = np.r_[c[0], c[:-1]]
+    return pd.DataFrame({"ts": np.arange(n) * 900_000, "open": o, "high": np.maximum(o, c) * 1.002,
+                         "low": np.minimum(o, c) * 0.998, "close": c, "volume": rng.random(n)})
+
+
+def test_caliente_no_recalcula_indicadores(tmp_path, monkeypatch):
+    df = _df()
+    sin = bv.senales_vectorizadas(df, E)
+    cache = CacheIndicadores(tmp_path)
+    assert (bv.senales_vectorizadas(df, E, cache=cache) == sin).all()
+    assert cache.misses == 5 and cache.hits == 0
+
+    def no(*a, **k):
+        raise AssertionError("indicador recalculado")
+    for f in ("_bb", "_ema", "_rsi_partes", "_adx", "_atr"):
+        monkeypatch.setattr(bv, f, no)
+    otro = CacheIndicadores(tmp_path)                 # otra sesión: solo el disco
+    assert (bv.senales_vectorizadas(df.copy(), E, cache=otro) == sin).all()
+    assert otro.hits == 5
+
+
+def test_lru_por_tamano(tmp_path):
+    cache = CacheIndicadores(tmp_path, max_disco_mb=0.25)         # entran 2 BB de 3000 velas x 4 columnas
+    E0 = {"usar_ema200": False}
+    a, b, c = (_df(semilla=s) for s in range(3))
+    ruta = {k: cache._ruta(firma(d["close"], d["high"], d["low"]), "bb", (20, 2.0)) for k, d in zip("abc", (a, b, c))}
+    bv.senales_vectorizadas(a, E0, cache=cache)
+    bv.senales_vectorizadas(b, E0, cache=cache)
+    os.utime(ruta["a"], (1, 1)); os.utime(ruta["b"], (2, 2))
+    bv.senales_vectorizadas(a, E0, cache=cache)                    # leer A la vuelve la más reciente
+    bv.senales_vectorizadas(c, E0, cache=cache)
+    assert ruta["a"].exists() and ruta["c"].exists() and not ruta["b"].exists()
+    assert cache.hits == 1
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting.cache_resultados import (CacheResultados, archivos_motor, clave, firma_archivos,  # noqa: E402
+                                          json_por_mtime)
+
+
+def test_clave_canonica_y_datos(tmp_path):
+    f = tmp_path / "ohlcv_ETH-USDT_15m.csv"
+    f.write_text("ts\n1\n")
+    k1 = clave({"a": 1, "b": {"c": 2}}, firma_archivos([f]))
+    assert k1 == clave({"b": {"c": 2}, "a": 1}, firma_archivos([f]))     # orden de llaves no importa
+    assert k1 != clave({"a": 1, "b": {"c": 3}}, firma_archivos([f]))
+    os.utime(f, ns=(1, 1))                                                # archivo tocado => otra clave
+    assert k1 != clave({"a": 1, "b": {"c": 2}}, firma_archivos([f]))
+
+
+def test_version_motor_cubre_lo_que_importa_el_motor():
+    archivos = archivos_motor()
+    assert ROOT / "core" / "partials.py" in archivos                     # motor.py lo importa desde core/
+    assert ROOT / "backtesting" / "motor.py" in archivos
+    assert ROOT / "core" / "core.py" not in archivos                     # el bot en vivo no es el motor
+
+
+def test_lru_disco_e_historial(tmp_path):
+    c = CacheResultados(tmp_path, max_memoria=2)
+    llamadas = []
+
+    def correr(i):
+        llamadas.append(i)
+        return {"trades": pd.DataFrame({"pnl": [float(i)]})}
+
+    for i in range(3):
+        c.memo(f"k{i}", lambda i=i: correr(i), meta={"symbol": "ETHUSDT", "metricas": {"pnl": float(i)}})
+    valor, hit = c.memo("k0", lambda: correr(99))                         # fuera del LRU, vuelve de disco
+    assert hit and llamadas == [0, 1, 2] and valor["trades"]["pnl"].iloc[0] == 0.0
+
+    otro = CacheResultados(tmp_path)                                      # otro proceso: solo disco
+    assert [h["clave"] for h in otro.historial()] == ["k2", "k1", "k0"]
+    assert otro.get("k1")["trades"]["pnl"].iloc[0] == 1.0
+
+    chico = CacheResultados(tmp_path, max_disco_mb=0)                     # poda por tamaño
+    chico.put("k3", {"x": 1})
+    assert chico.historial() == [] and not list(tmp_path.glob("*.pkl"))
+
+
+def test_json_por_mtime(tmp_path):
+    p = tmp_path / "s.json"
+    p.write_text('{"a": {"b": 1}}')
+    a = json_por_mtime(p)
+    a["a"]["b"] = 5                                                       # copia: no ensucia el memo
+    assert json_por_mtime(p) == {"a": {"b": 1}}
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting import motor  # noqa: E402
+from backtesting.checkpoint import run_incremental  # noqa: E402
+
+H = 3_600_000
+CFG = {"estrategia": {"tf": "1h", "usar_ema200": True, "usar_rsi": False, "bb_len": 20, "bb_mult": 1.0},
+       "riesgo": {"stop_pct": 1.0, "take_pct": 3.0}, "partials": {"enabled": True}, "trailing": {"enabled": True},
+       "risk_controls": {"daily_max_trades": 3, "daily_max_loss_usdt": 15,
+                         "cooldown_after_sl_streak": {"count": 2, "bars": 5}},
+       "backtest": {"integridad": {"saltar_huecos": False}}}
+
+
+def _df(n=6000):
+    rng = np.random.default_rng(1)
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    o = np.r_[c[0], c[:-1]]
+    return pd.DataFrame({"ts": np.arange(n) * H, "open": o, "high": np.maximum(o, c) * 1.004,
+                         "low": np.minimum(o, c) * 0.996, "close": c, "volume": np.ones(n)})
+
+
+def test_reanudar_igual_a_correr_completo(tmp_path):
+    df = _df()
+    full_tr, full_au, full_eq = motor.run_symbol_on_df("X", "1h", df, motor.normalize_cfg(CFG))
+    for corte in (2500, 5990):                              # con y sin posición abierta al corte
+        run_incremental("X", "1h", df.iloc[:corte], CFG, directorio=tmp_path / str(corte))
+        tr, au, eq = run_incremental("X", "1h", df, CFG, directorio=tmp_path / str(corte))
+        assert au["reanudado"] == corte
+        assert tr == full_tr and np.allclose([e for _, e in eq], [e for _, e in full_eq])
+        assert all(au[k] == full_au[k] for k in motor.CONTADORES_LOOP)
+
+
+def test_datos_distintos_corren_completo(tmp_path):
+    df = _df()
+    run_incremental("X", "1h", df.iloc[:3000], CFG, directorio=tmp_path)
+    df2 = df.copy()
+    df2.loc[10, "close"] *= 1.01                            # vela corregida en el pasado
+    _, au, _ = run_incremental("X", "1h", df2, CFG, directorio=tmp_path)
+    assert au["reanudado"] == 0
+    _, au, _ = run_incremental("X", "1h", df2, {**CFG, "riesgo": {"stop_pct": 2.0}}, directorio=tmp_path)
+    assert au["reanudado"] == 0                             # otra config: otro checkpoint
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting import cola_distribuida as cola  # noqa: E402
+from backtesting import motor  # noqa: E402
+from backtesting.metricas import metricas  # noqa: E402
+from backtesting.walkforward import aplicar, combinaciones  # noqa: E402
+from datos.resample import cargar_tf  # noqa: E402
+
+H1 = 3_600_000
+CFG = {"estrategia": {"tf": "1h", "usar_ema200": False, "usar_rsi": False, "bb_mult": 1.0},
+       "riesgo": {"stop_pct": 1.0, "take_pct": 2.0}, "session_filter": {"enabled": False},
+       "telegram": {"token": "no-va-al-directorio-compartido"}}
+GRILLA = {"estrategia.bb_mult": [0.8, 1.2], "riesgo.stop_pct": [0.6, 1.0, 1.4], "riesgo.take_pct": [1.5, 3.0]}
+
+
+def _cache(d: Path, n=3_000):
+    rng = np.random.default_rng(3)
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.006, n)))
+    o = np.r_[c[0], c[:-1]]
+    d.mkdir()
+    pd.DataFrame({"ts": np.arange(n) * H1, "open": o, "high": np.maximum(o, c) * 1.003,
+                  "low": np.minimum(o, c) * 0.997, "close": c,
+                  "volume": rng.random(n)}).to_csv(d / "ohlcv_ETH-USDT_1h.csv", index=False)
+
+
+def test_barrido_con_varios_workers_y_lease_vencido(tmp_path):
+    cache = tmp_path / "cache"
+    _cache(cache)
+    d = cola.publicar(tmp_path / "cola", "ETHUSDT", "1h", CFG, GRILLA, por_unidad=3, lease_s=2.0)
+    assert "telegram" not in json.loads((d / "barrido.json").read_text(encoding="utf-8"))["cfg"]
+    (d / "leases" / "u0000.lease").write_text('{"worker": "caido:1"}')      # worker muerto con la unidad
+
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=cola.worker, args=(d.parent,),
+                         kwargs={"cache_dir": cache, "esperar": True, "intervalo": 0.2}) for _ in range(3)]
+    for p in procs:
+        p.start()
+    try:
+        res = cola.coordinar(d, intervalo=0.2, timeout=120)
+    finally:
+        for p in procs:
+            p.terminate()
+            p.join()
+
+    assert (d / "resultados.csv").exists() and cola.estado(d)["hechas"] == 4
+    assert len(res) == 12 and res["puntaje"].is_monotonic_decreasing
+    assert json.loads((d / "resultados" / "u0000.json").read_text(encoding="utf-8"))["worker"] != "caido:1"
+
+    df = cargar_tf("ETHUSDT", "1h", cache_dir=cache)
+    p = combinaciones(GRILLA)[7]
+    trades, _, _ = motor.run_symbol_on_df("ETHUSDT", "1h", df, motor.normalize_cfg(aplicar(CFG, p)))
+    fila = res[(res["estrategia.bb_mult"] == p["estrategia.bb_mult"]) & (res["riesgo.stop_pct"] == p["riesgo.stop_pct"])
+               & (res["riesgo.take_pct"] == p["riesgo.take_pct"])].iloc[0]
+    assert fila["pnl"] == metricas(trades)["pnl"] and fila["trades"] == len(trades)
+
+
+def test_worker_no_reintenta_unidades_fallidas(tmp_path):
+    (tmp_path / "cache").mkdir()                                          # sin velas: toda unidad falla
+    d = cola.publicar(tmp_path / "cola", "ETHUSDT", "1h", CFG, GRILLA, por_unidad=3)
+    assert cola.worker(d.parent, cache_dir=tmp_path / "cache") == 0       # termina, no gira sobre la misma
+    assert cola.estado(d) == {"unidades": 4, "hechas": 0, "en_curso": 0}
+
+
+def test_lease_reemitido_no_se_renueva_ni_se_borra(tmp_path):
+    ruta = tmp_path / "u0000.lease"
+    lease = cola._Lease(ruta, 0.2, "lento:1")
+    assert lease.tomar()
+    ruta.write_text('{"worker": "otro:2", "token": "de-otro"}')          # reemitida y tomada por otro
+    os.utime(ruta, (1, 1))
+    time.sleep(0.3)
+    lease.soltar()
+    assert lease.perdido and ruta.exists() and ruta.stat().st_mtime == 1  # ni latido ni unlink ajenos
+
+    propio = cola._Lease(tmp_path / "u0001.lease", 60, "rapido:3")
+    assert propio.tomar()
+    propio.soltar()
+    assert not propio.perdido and not propio.ruta.exists()
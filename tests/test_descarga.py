@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from datos.cache_ohlcv import archivo_unico, cargar  # noqa: E402
+from datos.descarga import ClienteKlines, descargar, dir_parcial  # noqa: E402
+from tests.klines_standin import KlinesStandIn  # noqa: E402
+
+Q = 900_000
+T0 = 1_735_689_600_000            # 2025-01-01 00:00 UTC
+
+
+def test_descarga_reanudable_incremental_y_consolidada(tmp_path):
+    # CSV legado con fecha: se funde en el consolidado
+    pd.DataFrame({"ts": [T0], "open": [1.0], "high": [1.0], "low": [1.0], "close": [1.0], "volume": [1.0]}) \
+        .to_csv(tmp_path / "ohlcv_ETH-USDT_15m_2025-01-01.csv", index=False)
+    hasta = pd.to_datetime(T0 + 2500 * Q, unit="ms", utc=True)      # 2499 velas nuevas, 3 páginas
+
+    srv = KlinesStandIn(fallar_desde=3)                              # 2 páginas OK y se corta
+    try:
+        cli = ClienteKlines(srv.url, presupuesto_rps=1000, rafaga=1000, reintentos=1)
+        res = descargar(["ETHUSDT"], ["15m"], hasta=hasta, cache_dir=tmp_path, cliente=cli, hilos=1)
+        assert res["ETHUSDT 15m"]["pendientes"] == 1 and res["ETHUSDT 15m"]["archivo"] is None
+        assert len(list(dir_parcial("ETHUSDT", "15m", tmp_path).glob("*.csv"))) == 2
+
+        srv.fallar_desde = None                                      # reanuda: solo la página que falta
+        antes = srv.requests
+        res = descargar(["ETHUSDT"], ["15m"], hasta=hasta, cache_dir=tmp_path, cliente=cli, hilos=2)
+        assert srv.requests - antes == 1 and res["ETHUSDT 15m"]["pendientes"] == 0
+        assert not dir_parcial("ETHUSDT", "15m", tmp_path).exists()
+        assert not (tmp_path / "ohlcv_ETH-USDT_15m_2025-01-01.csv").exists()
+
+        df = cargar("ETHUSDT", "15m", cache_dir=tmp_path)
+        assert len(df) == 2500 and df["ts"].is_unique and (df["ts"].diff().dropna() == Q).all()
+
+        # incremental: solo pide desde la última vela guardada
+        antes = srv.requests
+        hasta2 = pd.to_datetime(T0 + 2600 * Q, unit="ms", utc=True)
+        descargar(["ETHUSDT"], ["15m"], hasta=hasta2, cache_dir=tmp_path, cliente=cli)
+        assert srv.requests - antes == 1
+        assert len(pd.read_csv(archivo_unico("ETHUSDT", "15m", tmp_path))) == 2600
+    finally:
+        srv.cerrar()
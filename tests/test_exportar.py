@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import sys
+import zipfile
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting import exportar  # noqa: E402
+
+
+def _trades(n):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"symbol": rng.choice(["BTCUSDT", "ETHUSDT"], n), "qty": rng.random(n),
+                         "pnl": rng.normal(0, 5, n),
+                         "ts_entry": pd.to_datetime(1_735_689_600_000 + np.arange(n) * 900_000, unit="ms"),
+                         "exit_reason": rng.choice(["TP", "SL"], n)})
+
+
+def _xml(xlsx: bytes, hoja: int = 1) -> str:
+    with zipfile.ZipFile(BytesIO(xlsx)) as z:
+        return z.read(f"xl/worksheets/sheet{hoja}.xml").decode("utf-8")
+
+
+def test_xlsx_en_bloque(monkeypatch):
+    monkeypatch.setattr(exportar, "BLOQUE", 7)            # varios bloques
+    df = _trades(30)
+    df.loc[3, "pnl"] = np.nan
+    xml = _xml(exportar.trades_xlsx(df, {"pnl_total": 1.5}))
+    assert xml.count("<row ") == 31                        # encabezado + 30 filas, en orden
+    assert '<c r="C4"' in xml and '<c r="C5"' not in xml     # NaN (fila 3 de df) -> celda vacía
+    # fecha como serial de Excel (2025-01-01 = 45658) con formato de columna
+    assert "<v>45658</v>" in xml and "<col " in xml
+    assert exportar.anchos(df, muestra=8)[0] == len("BTCUSDT") + 2
+
+
+def test_csv_y_parquet(tmp_path):
+    df = _trades(50)
+    p = exportar.exportar(df, tmp_path / "t.parquet")
+    assert p.exists() and p.suffix in (".parquet", ".gz")
+    leido = pd.read_parquet(p) if p.suffix == ".parquet" else pd.read_csv(p)
+    assert len(leido) == 50 and np.allclose(leido["pnl"], df["pnl"])
+
+    eq = pd.DataFrame({"ts": df["ts_entry"], "equity": 1000 + df["pnl"].cumsum()})
+    out = exportar.excel_completo(tmp_path / "full.xlsx", df, eq, {"riesgo": {"stop_pct": 1.0}}, {"PF": 1.2}, eq)
+    with zipfile.ZipFile(out) as z:
+        libro = z.read("xl/workbook.xml").decode("utf-8")
+    for hoja in ("Trades", "Curva", "Config usada", "Comparador"):
+        assert f'name="{hoja}"' in libro
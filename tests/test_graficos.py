@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.graficos import lttb, pagina, reducir, ventana  # noqa: E402
+
+
+def _eq(n):
+    y = 1000 + np.cumsum(np.random.default_rng(3).normal(0, 1, n))
+    y[n // 3] -= 400                                                   # pico de drawdown aislado
+    return pd.DataFrame({"time": pd.date_range("2024-01-01", periods=n, freq="15min"), "equity": y})
+
+
+def test_lttb_conserva_extremos_y_picos():
+    df = _eq(50_000)
+    idx = lttb(df["time"], df["equity"], 1000)
+    assert len(idx) == 1000 and idx[0] == 0 and idx[-1] == len(df) - 1
+    assert np.all(np.diff(idx) > 0) and len(df) // 3 in idx
+    assert reducir(df.head(500), "time", "equity") is not None and len(reducir(df.head(500), "time", "equity")) == 500
+
+
+def test_ventana_y_paginado():
+    df = _eq(10_000)
+    w = ventana(df, "time", pd.Timestamp("2024-01-10"), pd.Timestamp("2024-01-11"))
+    assert w["time"].iloc[0] == pd.Timestamp("2024-01-10") and w["time"].iloc[-1] == pd.Timestamp("2024-01-11")
+    assert len(w) == 97
+
+    t = pd.DataFrame({"n": range(450)})
+    p1, total = pagina(t, 1, 200)
+    assert total == 3 and p1["n"].tolist()[:2] == [449, 448] and len(p1) == 200   # más nuevos primero
+    p3, _ = pagina(t, 9, 200)                                                       # se acota a la última
+    assert p3["n"].tolist()[-1] == 0 and len(p3) == 50
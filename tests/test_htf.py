@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.velas import AlmacenVelas  # noqa: E402
+from estrategia import htf  # noqa: E402
+from estrategia.bollinger_vol import generar_senal, senales_vectorizadas  # noqa: E402
+
+M30 = 1_800_000
+T0 = 1_735_689_600_000
+E = {"htf_tfs": ["1h", "4h"], "htf_ema_len": 10, "htf_adx_len": 5,
+     "usar_htf_tendencia": True, "usar_htf_adx": True, "htf_adx_min": 15.0}
+
+
+def _df(n=900, seed=3):
+    rng = np.random.default_rng(seed)
+    c = 100 + np.cumsum(rng.normal(0, 1, n))
+    return pd.DataFrame({"ts": T0 + np.arange(n) * M30, "open": c - 0.2, "high": c + 1.0,
+                         "low": c - 1.0, "close": c, "volume": np.ones(n)})
+
+
+def test_vivo_igual_a_backtest_sin_lookahead():
+    df = _df()
+    ctx = htf.contexto(df["ts"], df["open"], df["high"], df["low"], df["close"], df["volume"], M30, E)
+    velas = [{"open": r.open, "high": r.high, "low": r.low, "close": r.close, "volume": r.volume,
+              "time": int(r.ts) // 1000} for r in df.itertuples()]
+    vivo = htf.ContextoHTF()
+    for i in (300, 301, 302, 303, 500, 899):
+        alm = AlmacenVelas(lambda s, tf, n: velas[:i + 1], "30m", reloj=lambda: velas[i]["time"])
+        alm.actualizar("X")
+        got = vivo.actualizar("X", lambda tf: alm.velas("X", tf), velas[i]["time"], 1800, E)
+        for tf in ("1h", "4h"):
+            assert got[tf]["tendencia"] == ctx[tf]["tendencia"][i]
+            assert np.isclose(got[tf]["adx"], ctx[tf]["adx"][i])
+    # una vela 1h solo cuenta desde el cierre de su segunda media hora
+    j = htf.alinear([T0], 3_600_000, [T0, T0 + M30], M30)
+    assert j.tolist() == [-1, 0]
+
+
+def test_filtro_y_etiqueta_en_senal():
+    df = _df()
+    base = {"usar_ema200": False, "bb_len": 20, "bb_mult": 0.5}
+    sin = senales_vectorizadas(df, base)
+    con = senales_vectorizadas(df, dict(base, **E), tf_ms=M30)
+    assert (np.abs(con) <= np.abs(sin)).all() and np.abs(con).sum() < np.abs(sin).sum()
+
+    i = int(np.flatnonzero(con)[-1])
+    rows = df.iloc[:i + 1].to_dict("records")
+    s = generar_senal(rows, {}, dict(base, **E))
+    assert s["accion"] == ("BUY" if con[i] > 0 else "SELL")
+    assert s["tendencia_1h"].startswith("ALCISTA" if con[i] > 0 else "BAJISTA")
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from datos import integridad  # noqa: E402
+from datos.integridad import analizar_df, mascara_invalida, reparar, validar_cache  # noqa: E402
+from datos.descarga import ClienteKlines  # noqa: E402
+from tests.klines_standin import KlinesStandIn  # noqa: E402
+
+Q = 900_000
+T0 = 1_735_689_600_000
+
+
+def _df(ts):
+    n = len(ts)
+    return pd.DataFrame({"ts": ts, "open": np.full(n, 100.0), "high": np.full(n, 101.0),
+                         "low": np.full(n, 99.0), "close": np.full(n, 100.5), "volume": np.full(n, 10.0)})
+
+
+def test_indice_y_mascara():
+    ts = [T0 + k * Q for k in list(range(50)) + [50, 50] + list(range(55, 60))]   # dup en 50, faltan 51..54
+    df = _df(ts)
+    df.loc[3, "high"] = 98.0                                                       # OHLC inválido
+    r = analizar_df(df, Q)
+    assert r["duplicados"] == 1 and r["faltantes"] == 4 and r["huecos"] == [[T0 + 51 * Q, T0 + 55 * Q, 4]]
+    assert r["ohlc_invalidas"] == 1 and not r["ok"]
+
+    u = df.drop_duplicates("ts")
+    mala = mascara_invalida(u["ts"].to_numpy(), Q, ventana=3, df=u)
+    assert np.flatnonzero(mala).tolist() == [3, 51, 52, 53]
+
+
+def test_indice_cacheado_y_reparacion(tmp_path, monkeypatch):
+    ts = [T0 + k * Q for k in list(range(20)) + list(range(30, 40))]
+    _df(ts).to_csv(tmp_path / "ohlcv_ETH-USDT_15m.csv", index=False)
+    idx = validar_cache(tmp_path)
+    assert idx["ohlcv_ETH-USDT_15m.csv"]["faltantes"] == 10
+    # sin cambios en el archivo no se relee (índice persistido en .integridad.json)
+    integridad._memo.clear()
+    with monkeypatch.context() as m:
+        m.setattr(integridad.pd, "read_csv", lambda *a, **k: (_ for _ in ()).throw(AssertionError("releído")))
+        assert validar_cache(tmp_path) == idx
+
+    srv = KlinesStandIn()
+    try:
+        r = reparar("ETHUSDT", "15m", tmp_path, ClienteKlines(srv.url, 1000, 1000))
+    finally:
+        srv.cerrar()
+    assert r["recuperadas"] == 10 and srv.requests == 1
+    assert validar_cache(tmp_path)["ohlcv_ETH-USDT_15m.csv"]["ok"]            # archivo cambió => re-valida
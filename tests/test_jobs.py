@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting import motor  # noqa: E402
+from backtesting.jobs import GestorJobs  # noqa: E402
+
+H = 3_600_000
+CFG = {"estrategia": {"tf": "1h", "usar_ema200": False, "usar_rsi": False, "bb_len": 20, "bb_mult": 1.0},
+       "riesgo": {"stop_pct": 1.0, "take_pct": 1.5}, "partials": {"enabled": False},
+       "trailing": {"enabled": False}, "backtest": {"integridad": {"saltar_huecos": False}}}
+
+
+def _df(n=4000):
+    rng = np.random.default_rng(1)
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    return pd.DataFrame({"ts": np.arange(n) * H, "open": c, "high": c * 1.006, "low": c * 0.994,
+                         "close": c, "volume": np.ones(n)})
+
+
+def _esperar(g, jid, hasta=("listo", "error", "cancelado"), timeout=60.0):
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        est = g.estado(jid)
+        if est["estado"] in hasta:
+            return est
+        time.sleep(0.05)
+    raise AssertionError(f"job {jid} no llegó a {hasta}: {g.estado(jid)}")
+
+
+def test_progreso_del_motor(monkeypatch):
+    monkeypatch.setattr(motor, "PROGRESO_S", 0.0)
+    avances = []
+    trades, _, eq = motor.run_symbol_on_df("X", "1h", _df(), motor.normalize_cfg(CFG),
+                                         progreso=avances.append)
+    assert avances[-1]["velas"] == avances[-1]["total"] == len(eq)
+    assert avances[-1]["trades"] == len(trades) > 0
+    puntos = [p for a in avances for p in a["nuevos"]]
+    assert len(puntos) == len(trades) and np.isclose(puntos[-1][1], eq[-1][1])
+
+
+def test_jobs_en_procesos_y_cancelacion():
+    g = GestorJobs(max_workers=2)
+    try:
+        df = _df()
+        a = g.enviar("simbolo", symbol="X", tf="1h", cfg=CFG, df=df)
+        b = g.enviar("barrido", symbol="X", tf="1h", cfgs=[CFG] * 500, df=df)
+        est = _esperar(g, a)
+        assert est["estado"] == "listo" and est["progreso"]["velas"] == len(df)
+        r = g.resultado(a)
+        assert len(r["trades"]) == est["progreso"]["trades"] and len(r["equity"]) == len(df)
+
+        _esperar(g, b, hasta=("corriendo",))
+        assert g.cancelar(b)
+        est = _esperar(g, b)
+        assert est["estado"] == "cancelado" and est.get("config", 0) < 499
+    finally:
+        g.cerrar()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting.montecarlo import max_drawdown, peor_racha, simular  # noqa: E402
+
+
+def test_drawdown_y_racha_por_fila():
+    pnl = np.array([[-1.0, 2.0, -3.0, 1.0], [1.0, -1.0, -1.0, -1.0]])
+    assert max_drawdown(pnl).tolist() == [3.0, 3.0]
+    assert peor_racha(pnl < 0).tolist() == [1, 3]
+
+
+def test_shuffle_sin_ruido_conserva_pnl_y_semilla_reproducible():
+    trades = pd.DataFrame({"pnl": [5.0, -2.0, -2.0, 3.0], "fees": [0.1] * 4, "qty": [1.0] * 4,
+                           "price_entry": [100.0] * 4, "price_exit": [101.0] * 4})
+    fee = 0.1 / 201.0
+    sim = simular(trades, 500, "shuffle", fee_rate=fee, fee_jitter=0.0, slippage_bps=0.0, seed=7)
+    assert np.allclose(sim["pnl"], 4.0, atol=1e-4)
+    assert sim["racha"].min() >= 1 and sim["racha"].max() == 2
+    a = simular(trades, 500, seed=7)
+    b = simular(trades, 500, seed=7, hilos=1)
+    assert np.array_equal(a["pnl"], b["pnl"])
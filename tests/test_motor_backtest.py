@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting.motor import normalize_cfg, run_symbol_on_df  # noqa: E402
+
+H = 3_600_000
+Q = 900_000
+
+
+def _df(ts, filas):
+    return pd.DataFrame({"ts": ts, "open": [f[0] for f in filas], "high": [f[1] for f in filas],
+                         "low": [f[2] for f in filas], "close": [f[3] for f in filas],
+                         "volume": 1.0})
+
+
+def _cfg(intrabar):
+    return normalize_cfg({
+        "estrategia": {"tf": "1h"},
+        "riesgo": {"stop_pct": 1.0, "take_pct": 2.0, "riesgo_usdt": 10.0},
+        "partials": {"enabled": False}, "trailing": {"enabled": False},
+        "backtest": {"fill_policy": "favorable", "intrabar": intrabar, "intrabar_tf": "15m"},
+    })
+
+
+def test_intrabar_resuelve_sl_y_tp_en_la_misma_vela():
+    # vela 1h de señal cierra en 100; la siguiente toca SL (99) y TP (102)
+    df = _df([0, H, 2 * H], [(100, 100, 100, 100), (100, 103, 98, 101), (101, 101, 101, 101)])
+    sig = np.array([1, 0, 0], dtype=np.int8)
+
+    trades, audit, eq = run_symbol_on_df("ETHUSDT", "1h", df, _cfg(False), senales=sig)
+    assert [t["exit_reason"] for t in trades] == ["TP"]       # política favorable sin detalle
+
+    # en 15m el mínimo llega antes que el máximo => SL
+    fino = _df([H, H + Q, H + 2 * Q, H + 3 * Q, 2 * H],
+               [(100, 100.5, 98, 99), (99, 100, 99, 100), (100, 103, 100, 101),
+                (101, 101, 101, 101), (101, 101, 101, 101)])
+    trades, audit, eq = run_symbol_on_df("ETHUSDT", "1h", df, _cfg(True), df_fino=fino, senales=sig)
+    assert audit["modo"] == "intrabar" and audit["intrabar_fallback"] == 0
+    assert [t["exit_reason"] for t in trades] == ["SL"]
+    assert trades[0]["price_exit"] == 99.0 and trades[0]["ts_exit"] == H
+    assert len(eq) == 3 and eq[-1][1] < eq[0][1]
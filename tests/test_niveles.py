@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.niveles import IndiceNiveles
+from core.trailing_base import inicializar, preparar_posicion
+
+CFG = {
+    "riesgo": {"stop_pct": 1.0, "take_pct": 3.0},
+    "partials": {"enabled": True, "trigger_mode": "R_multiple", "trigger_R": 0.5,
+                 "qty_mode": "percent_of_open", "qty_value": 50.0},
+    "trailing": {"trigger_R": 1.0, "distance_R": 0.5},
+}
+
+
+def _reg():
+    tr = preparar_posicion(inicializar(CFG), "LONG", 100.0, CFG)
+    return {"posicion_abierta": True, "direccion": "COMPRA (LONG)", "entrada_precio": 100.0,
+            "sl_pct": 1.0, "tp_pct": 3.0, "qty": 1.0, "trailing": tr}
+
+
+def test_banda_entre_sl_y_parcial():
+    idx = IndiceNiveles()
+    reg = _reg()
+    idx.construir("ETHUSDT", reg, CFG, 100.1)
+    n = idx.niveles["ETHUSDT"]
+    assert abs(n["parcial"] - 100.5) < 1e-9 and abs(n["be"] - 101.0) < 1e-9
+    assert not idx.cruzado("ETHUSDT", 100.4)      # tick ocioso: solo comparación
+    assert idx.cruzado("ETHUSDT", 100.6)          # cruza el parcial
+    assert idx.cruzado("ETHUSDT", 98.9)           # cruza el SL
+
+    reg["partial_done"] = True
+    idx.construir("ETHUSDT", reg, CFG, 100.6)
+    assert not idx.cruzado("ETHUSDT", 100.9) and idx.cruzado("ETHUSDT", 101.0)
+    assert idx.cruzado("BTCUSDT", 1.0)            # sin índice => hay trabajo
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting import motor  # noqa: E402
+from backtesting.metricas import metricas  # noqa: E402
+from backtesting.optimizador import halving, rondas  # noqa: E402
+from backtesting.walkforward import _puntaje, aplicar, combinaciones  # noqa: E402
+
+H1 = 3_600_000
+CFG = {"estrategia": {"tf": "1h", "usar_ema200": False, "usar_rsi": False, "bb_mult": 1.0},
+       "riesgo": {"stop_pct": 1.0, "take_pct": 2.0}, "partials": {"enabled": True}, "trailing": {"enabled": True},
+       "session_filter": {"enabled": False}}
+GRILLA = {"estrategia.bb_mult": [0.8, 1.0, 1.2], "riesgo.stop_pct": [0.6, 1.0, 1.4],
+          "riesgo.take_pct": [1.5, 3.0], "trailing.trigger_R": [1.0, 2.0]}
+
+
+def _df(n=8_000):
+    rng = np.random.default_rng(11)
+    c = 100 * np.exp(np.cumsum(rng.normal(0.00005, 0.006, n)))
+    o = np.r_[c[0], c[:-1]]
+    return pd.DataFrame({"ts": np.arange(n) * H1, "open": o, "high": np.maximum(o, c) * 1.003,
+                         "low": np.minimum(o, c) * 0.997, "close": c, "volume": rng.random(n)})
+
+
+def test_rondas():
+    assert rondas(8_100, 100, 3) == [100, 300, 900, 2_700, 8_100]
+    assert rondas(500, 1_000, 3) == [500]
+
+
+def test_halving_elige_entre_los_mejores_de_la_grilla():
+    df = _df()
+    res = halving("X", "1h", df, CFG, GRILLA, eta=3, dias_min=10, min_trades=5, top=3, procesos=1)
+    assert res["candidatos"] == 36
+    assert [r["candidatos"] for r in res["rondas"]] == [36, 12, 4, 2]
+    assert res["rondas"][-1]["velas"] == len(df)
+    assert res["evaluaciones_velas"] < 36 * len(df) / 5
+
+    # la última ronda (historia completa, reanudada por prefijos) = correr cada finalista de una vez
+    puntajes = {}
+    for p in combinaciones(GRILLA):
+        trades, _, _ = motor.run_symbol_on_df("X", "1h", df, motor.normalize_cfg(aplicar(CFG, p)))
+        puntajes[tuple(sorted(p.items()))] = _puntaje(metricas(trades), "pnl_dd", 5)
+    mejor = res["mejores"][0]
+    assert mejor["puntaje"] == puntajes[tuple(sorted(mejor["params"].items()))]
+    assert mejor["puntaje"] >= np.percentile(list(puntajes.values()), 75)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.planificador import Planificador
+
+
+def test_urgente_primero_y_presupuesto_global():
+    t = {"now": 900.0 * 1000 + 300.0}   # lejos del cierre de vela
+    pl = Planificador(["BTC", "ETH", "SOL"], tf_s=900, min_s=2, max_s=60,
+                      presupuesto_rps=1.0, rafaga=2, reloj=lambda: t["now"])
+    for s in ("BTC", "ETH", "SOL"):
+        pl._est[s]["ultimo"] = t["now"]
+    pl.registrar("ETH", 100.0, niveles={"sl": 99.95}, atr=1.0, abierta=True)   # 0.05 ATR del SL
+    pl.registrar("BTC", 100.0)                                                # plano
+    assert pl.intervalo(pl.urgencia("ETH")) < 5 and pl.intervalo(pl.urgencia("BTC")) == 60
+
+    t["now"] += 5
+    assert pl.vencidos() == ["ETH", "SOL"]     # BTC (plano) todavía no vence
+    t["now"] += 0.1
+    assert pl.vencidos() == []          # sin tokens: ráfaga consumida
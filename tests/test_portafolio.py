@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting.motor import run_symbol_on_df  # noqa: E402
+from backtesting.portafolio import run_portfolio  # noqa: E402
+
+H = 3_600_000
+
+
+def _df(filas):
+    return pd.DataFrame({"ts": [k * H for k in range(len(filas))],
+                         "open": [f[0] for f in filas], "high": [f[1] for f in filas],
+                         "low": [f[2] for f in filas], "close": [f[3] for f in filas], "volume": 1.0})
+
+
+def test_capital_compartido_y_anti_piramidado():
+    # señal en 0 y 1 para ambos; la posición de 0 sale por TP en la vela 2
+    filas = [(100, 100, 100, 100), (100, 100.5, 99.5, 100), (100, 103, 100, 102), (102, 102, 102, 102)]
+    dfs = {"AAAUSDT": _df(filas), "BBBUSDT": _df(filas)}
+    sig = {s: np.array([1, 1, 0, 0], dtype=np.int8) for s in dfs}
+    cfg = {"estrategia": {"tf": "1h"}, "capital": {"total_usdt": 150.0},
+           "futuros": {"leverage": 10, "target_margin_usdt": 100.0},
+           "riesgo": {"stop_pct": 1.0, "take_pct": 2.0, "riesgo_usdt": 10.0},
+           "partials": {"enabled": False}, "trailing": {"enabled": False}}
+
+    trades, audit, eq = run_portfolio(dfs, "1h", cfg, senales=sig)
+    assert [t["symbol"] for t in trades] == ["AAAUSDT"]          # margen 100 de 150: BBB no entra
+    assert audit["sin_margen"] == 2 and audit["ocupado"] == 1     # AAA en 1: ya tiene posición
+    assert trades[0]["exit_reason"] == "TP" and eq[-1][1] > 150.0
+
+    cfg["capital"]["total_usdt"] = 1000.0
+    trades, audit, _ = run_portfolio(dfs, "1h", cfg, senales=sig)
+    assert sorted(t["symbol"] for t in trades) == ["AAAUSDT", "BBBUSDT"] and audit["max_simultaneas"] == 2
+
+
+def test_perdida_diaria_cuenta_el_dia_de_la_salida_en_ambos_motores():
+    # entra el día 0 (vela 22), sale por SL pasada la medianoche (vela 24); la señal
+    # de la vela 25 ya es del día 1, donde se realizó la pérdida
+    filas = [(100, 100, 100, 100)] * 30
+    filas[24] = (100, 100, 98, 100)
+    sig = np.zeros(30, dtype=np.int8)
+    sig[[22, 25]] = 1
+    cfg = {"estrategia": {"tf": "1h"}, "riesgo": {"stop_pct": 1.0, "take_pct": 2.0, "riesgo_usdt": 10.0},
+           "partials": {"enabled": False}, "trailing": {"enabled": False},
+           "session_filter": {"enabled": False}, "risk_controls": {"daily_max_loss_usdt": 1.0}}
+
+    trades, audit, _ = run_symbol_on_df("AAAUSDT", "1h", _df(filas), cfg, senales=sig)
+    trades_p, audit_p, _ = run_portfolio({"AAAUSDT": _df(filas)}, "1h", cfg, senales={"AAAUSDT": sig})
+    assert [t["exit_reason"] for t in trades] == [t["exit_reason"] for t in trades_p] == ["SL"]
+    assert audit["bloqueadas_riesgo"] == audit_p["bloqueadas_riesgo"] == 1
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from utils.reloj import RelojExchange, formatear_hora
+
+
+def test_offset_de_la_muestra_con_menor_rtt():
+    # local avanza 1s por lectura; el exchange va +500ms adelantado
+    t = {"now": 1000.0}
+    rtts = iter([0.4, 0.02, 0.2, 0.3])
+
+    def local():
+        return t["now"]
+
+    def servidor():
+        ida = next(rtts)
+        t["now"] += ida / 2
+        srv = t["now"] * 1000.0 + 500.0
+        t["now"] += ida / 2
+        return srv
+
+    r = RelojExchange(fuente=servidor, reloj_local=local, muestras_iniciales=4)
+    assert r.tick()
+    assert abs(r.rtt_ms - 20.0) < 1e-6
+    assert abs(r.offset_ms - 500.0) < 1e-6
+    assert not r.tick()                      # dentro del intervalo: sin I/O
+    assert r.now_ms() == int(t["now"] * 1000 + 500)
+
+
+def test_sin_fuente_usa_hora_local_y_formato_utc():
+    r = RelojExchange(fuente=None)
+    assert not r.tick() and r.offset_ms == 0.0
+    assert formatear_hora(0, "Zona/Inexistente", "local") == "00:00 UTC"
+    assert formatear_hora(0, "UTC", "utc") == "00:00 UTC"
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from datos.resample import cargar_tf, resamplear  # noqa: E402
+from core.velas import AlmacenVelas, VelasSinActualizar  # noqa: E402
+
+Q = 900_000
+H = 3_600_000
+T0 = 1_735_689_600_000          # 2025-01-01 00:00 UTC
+
+
+def _df(ts):
+    n = len(ts)
+    k = np.arange(n, dtype=float)
+    return pd.DataFrame({"ts": ts, "open": 100 + k, "high": 101 + k, "low": 99 + k,
+                         "close": 100.5 + k, "volume": np.ones(n)})
+
+
+def test_resamplear_alineado_y_completo(tmp_path):
+    # arranca a las 00:30 (1h cortada) y falta una vela de las 03:00
+    ts = [T0 + k * Q for k in range(2, 24) if k != 13]
+    df = _df(ts)
+    h1 = resamplear(df, "15m", "1h")
+    assert (h1["ts"] % H == 0).all()
+    assert h1["ts"].tolist() == [T0 + k * H for k in (1, 2, 4, 5)]
+    r = h1.iloc[0]                                   # 01:00 = velas 4..7 del rango
+    assert (r["open"], r["high"], r["low"], r["close"], r["volume"]) == (102, 106, 101, 105.5, 4)
+
+    _df([T0 + k * Q for k in range(15)]).to_csv(tmp_path / "ohlcv_ETH-USDT_15m.csv", index=False)
+    h4 = cargar_tf("ETHUSDT", "4h", cache_dir=tmp_path)
+    assert len(h4) == 0 and len(cargar_tf("ETHUSDT", "1h", cache_dir=tmp_path)) == 3
+
+
+def test_almacen_incremental_igual_a_recalculo():
+    reloj = [T0 // 1000 + 400 * 900 + 30]
+
+    def fetch(sym, tf, n):
+        ult = reloj[0] - reloj[0] % 900
+        return [{"open": 1.0 + t % 7, "high": 2.0 + t % 11, "low": 0.5, "close": 1.5 + t % 5,
+                 "volume": 1.0, "time": t} for t in range(ult - (n - 1) * 900, ult + 1, 900)]
+
+    alm = AlmacenVelas(fetch, "15m", max_base=300, reloj=lambda: reloj[0])
+    alm.actualizar("X")
+    for paso in (300, 900, 1800, 60, 3600):
+        reloj[0] += paso
+        alm.actualizar("X")
+        inc = alm.velas("X", "1h")
+        ref = AlmacenVelas(fetch, "15m", max_base=300, reloj=lambda: reloj[0])
+        ref.actualizar("X")
+        completo = ref.velas("X", "1h")
+        assert inc[-len(completo):] == completo
+        assert alm.velas("X", "30m", 10) == ref.velas("X", "30m", 10)
+    assert alm.requests == 6                         # un request del TF base por actualización
+
+
+def test_almacen_no_devuelve_buffer_viejo_si_falla_el_rest():
+    resp = [[{"open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 1.0, "time": T0 // 1000}]]
+    alm = AlmacenVelas(lambda sym, tf, n: resp[0], "15m", reloj=lambda: T0 // 1000 + 60)
+    assert len(alm.actualizar("X")) == 1
+    resp[0] = []
+    try:
+        alm.actualizar("X")
+        assert False, "debería levantar"
+    except VelasSinActualizar:
+        pass
+    assert len(alm.velas("X")) == 1                 # el buffer no se tocó
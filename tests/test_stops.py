@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.stops import GestorStops
+
+
+def test_coalesce_y_envia_solo_la_mejora_monotonica():
+    llamadas = []
+
+    def enviar(sym, take_profit=None, stop_loss=None, posicion=None):
+        llamadas.append((sym, take_profit, stop_loss, posicion is not None))
+        return True, {"retCode": 0}
+
+    g = GestorStops(enviar, min_mov_sl_pct=0.1, frescura_s=30.0, reloj=lambda: 100.0)
+    g.confirmar("ETHUSDT", "Buy", 3000.0, sl=2970.0, tp=3150.0)
+
+    g.proponer("ETHUSDT", sl=2990.0)              # trailing
+    g.proponer("ETHUSDT", sl=2995.0)              # trailing (mejor)
+    g.proponer("ETHUSDT", sl=2970.0, tp=3150.0)   # realineo de la reconciliación
+    res = g.flush()
+    assert llamadas == [("ETHUSDT", None, 2995.0, True)]   # 1 request, sin relectura
+    assert res["ETHUSDT"]["ok"] and g.conocido["ETHUSDT"]["stopLoss"] == 2995.0
+
+    g.proponer("ETHUSDT", sl=2996.0)              # < min_mov_sl_pct
+    g.proponer("BTCUSDT", sl=1.0)                 # sin estado: va con relectura
+    g.flush()
+    assert llamadas[1:] == [("BTCUSDT", None, 1.0, False)]
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Stream privado contra el stand-in con mensajes grabados:
+- dedupe de execId y descarte de 'position' viejo (seq)
+- parcial propio (sin doble aviso) y cierre por SL con motivo/precio exactos
+- resync REST tras reconexión
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from adapters.bybit_stream import StreamPrivado
+from core.eventos_stream import aplicar_evento, vencer_pendientes
+from tests.stream_standin import StreamStandIn
+
+
+def _drenar(st, estado):
+    acciones = []
+    while not st.eventos.empty():
+        acciones += aplicar_evento(estado, st.eventos.get_nowait())
+    return acciones
+
+
+def _resync(st, estado):
+    """resync + drenar, repitiendo mientras se pida confirmación (como el core)."""
+    acciones = []
+    while st.resync_si_corresponde():
+        nuevas = _drenar(st, estado)
+        acciones += nuevas
+        for a in nuevas:
+            if a["accion"] == "confirmar":
+                st.marcar_gap("confirmar")
+    return acciones
+
+
+def _reg_eth():
+    return {
+        "posicion_abierta": True,
+        "direccion": "COMPRA (LONG)",
+        "entrada_precio": 3333.4,
+        "sl_pct": 1.0,
+        "qty": 0.03,
+        "partial_done": True,   # el bot ya colocó el parcial a mercado
+        "trailing": {"be_moved": False, "ultimo_sl_notificado": None},
+    }
+
+
+def test_parcial_y_cierre_sl():
+    fuente = StreamStandIn("eth_parcial_y_sl")
+    st = StreamPrivado(["ETHUSDT"], transporte=fuente).iniciar()
+    estado = {"ETHUSDT": _reg_eth()}
+
+    fuente.emitir(st, hasta="p1-viejo")
+    acciones = _drenar(st, estado)
+    assert [a["accion"] for a in acciones] == ["parcial"]
+    assert acciones[0]["notificar"] is False          # ya lo avisó core.partials
+    assert abs(acciones[0]["precio"] - 3350.10) < 1e-9
+    assert abs(estado["ETHUSDT"]["qty"] - 0.015) < 1e-12  # p1-viejo descartado por seq
+
+    fuente.emitir(st)
+    acciones = _drenar(st, estado)
+    assert [a["accion"] for a in acciones] == ["cierre"]
+    assert acciones[0]["motivo"] == "Stop Loss"
+    assert abs(acciones[0]["precio"] - 3333.10) < 1e-9
+    assert estado["ETHUSDT"]["posicion_abierta"] is False
+    assert vencer_pendientes(estado, ahora=10**12) == []
+
+
+def test_resync_tras_reconexion_cierra_por_snapshot():
+    fuente = StreamStandIn("eth_parcial_y_sl")
+    snapshots = {"ETHUSDT": None}  # REST: ya no hay posición
+    st = StreamPrivado(["ETHUSDT"], snapshot=lambda s: snapshots[s], transporte=fuente,
+                       stale_s=0.0).iniciar()
+    estado = {"ETHUSDT": _reg_eth()}
+    # snapshot inicial: dos seguidos sin posición para cerrar
+    assert [a["accion"] for a in _resync(st, estado)] == ["confirmar", "cierre"]
+
+    estado = {"ETHUSDT": _reg_eth()}
+    fuente.conectado = False
+    assert not st.resync_si_corresponde()
+    fuente.conectado = True
+    acciones = _resync(st, estado)     # reconexión => resync
+    assert acciones[-1]["accion"] == "cierre" and acciones[-1]["motivo"] == "Cierre manual/externo"
+
+
+def test_resync_con_rest_caido_no_cierra():
+    fuente = StreamStandIn("eth_parcial_y_sl")
+    pos = {"side": "Buy", "qty": 0.03, "avgPrice": 3333.4}
+    rest = {"falla": True, "pos": None}
+
+    def snapshot(s):
+        if rest["falla"]:
+            raise ConnectionError("timeout")
+        return rest["pos"]
+    st = StreamPrivado(["ETHUSDT"], snapshot=snapshot, transporte=fuente).iniciar()
+    estado = {"ETHUSDT": _reg_eth()}
+
+    assert st.resync_si_corresponde() and _drenar(st, estado) == []
+    assert st.resync_si_corresponde()                 # sigue pendiente: se reintenta
+    assert estado["ETHUSDT"]["posicion_abierta"] is True
+
+    rest.update(falla=False, pos=None)
+    assert [a["accion"] for a in _drenar(st, estado)] == []
+    st.resync_si_corresponde()
+    assert [a["accion"] for a in _drenar(st, estado)] == ["confirmar"]
+    rest["pos"] = pos                                 # el segundo snapshot la ve: no se cierra
+    st.marcar_gap("confirmar")
+    st.resync_si_corresponde()
+    assert _drenar(st, estado) == [] and estado["ETHUSDT"]["posicion_abierta"] is True
+    assert "_snapshot_miss" not in estado["ETHUSDT"]
+
+
+def test_size_cero_y_luego_positivo_no_cierra():
+    estado = {"ETHUSDT": _reg_eth()}
+    ev = {"tipo": "posicion", "symbol": "ETHUSDT", "side": "", "qty": 0.0}
+    assert aplicar_evento(estado, ev) == []                              # espera la ejecución
+    assert aplicar_evento(estado, {**ev, "side": "Sell", "qty": 1.0, "avgPrice": 3300.0}) == []
+    assert vencer_pendientes(estado, ahora=10**12) == []                 # sigue abierta: no hay cierre
+    reg = estado["ETHUSDT"]
+    assert reg["posicion_abierta"] and reg["qty"] == 1.0 and reg["direccion"] == "VENTA (SHORT)"
+
+
+def test_parcial_residente_se_notifica_por_order_id():
+    fuente = StreamStandIn("eth_parcial_y_sl")
+    st = StreamPrivado(["ETHUSDT"], transporte=fuente).iniciar()
+    reg = _reg_eth()
+    reg["partial_done"] = False
+    reg["residente"] = {"parcial_order_id": "ord-parcial"}
+    estado = {"ETHUSDT": reg}
+
+    fuente.emitir(st, hasta="p1-viejo")
+    acciones = _drenar(st, estado)
+    assert [a["accion"] for a in acciones] == ["parcial"]
+    assert acciones[0]["notificar"] is True            # limit del exchange: avisa el stream
+    assert reg["partial_done"] is True
+    assert "parcial_order_id" not in reg["residente"]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting import motor  # noqa: E402
+from backtesting.streaming import run_streaming  # noqa: E402
+from datos.cache_ohlcv import cargar, leer_tramos  # noqa: E402
+from datos.integridad import _atr_previo  # noqa: E402
+from estrategia import bollinger_vol as bv  # noqa: E402
+
+M5 = 300_000
+CFG = {"estrategia": {"tf": "5m", "usar_ema200": True, "usar_rsi": True, "rsi_long_min": 45, "rsi_short_max": 55,
+                      "bb_mult": 1.0, "usar_htf_tendencia": True, "htf_tfs": ["1h"]},
+       "riesgo": {"stop_pct": 0.6, "take_pct": 1.5}, "partials": {"enabled": True}, "trailing": {"enabled": True},
+       "session_filter": {"enabled": True, "blocked_hours": [3, 4]},
+       "risk_controls": {"daily_max_trades": 6, "daily_max_loss_usdt": 20,
+                         "cooldown_after_sl_streak": {"count": 2, "bars": 12}},
+       "backtest": {"integridad": {"saltar_huecos": True, "saltar_picos": True}}}
+
+
+def _df(n=30_000):
+    rng = np.random.default_rng(5)
+    c = 100 * np.exp(np.cumsum(rng.normal(0, 0.003, n)))
+    o = np.r_[c[0], c[:-1]]
+    ts = np.arange(n) * M5
+    ts[n // 2:] += 7 * M5                                               # hueco a mitad de la historia
+    return pd.DataFrame({"ts": ts, "open": o, "high": np.maximum(o, c) * 1.002,
+                         "low": np.minimum(o, c) * 0.998, "close": c, "volume": rng.random(n)})
+
+
+def test_streaming_igual_al_motor_en_memoria(tmp_path):
+    df = _df()
+    trades, audit, eq = motor.run_symbol_on_df("X", "5m", df, motor.normalize_cfg(CFG))
+    r = run_streaming("X", "5m", CFG, tmp_path, tramos=(df.iloc[i:i + 2_500] for i in range(0, len(df), 2_500)))
+
+    t2 = pd.read_csv(r["trades"], float_precision="round_trip")
+    e2 = pd.read_csv(r["equity"], float_precision="round_trip")
+    t1 = pd.DataFrame(trades)
+    assert len(t1) > 100 and t1.equals(t2[t1.columns])
+    assert (e2["equity"].to_numpy() == np.array([x for _, x in eq])).all()
+    for k in ("senales", "filtradas_sesion", "filtradas_integridad", "bloqueadas_riesgo", "cooldowns", "trades"):
+        assert r["audit"][k] == audit[k], k
+    assert r["audit"]["tramos"] == 12
+
+
+def test_medias_moviles_no_dependen_del_origen():
+    # un tramo que arranca a mitad de la historia da los mismos bits (sin margen para empates)
+    df = _df(6_000)
+    h, l, c = (df[k] for k in ("high", "low", "close"))
+    k = 3_517
+    sub = lambda x: x.iloc[k:].reset_index(drop=True)
+    for a, b in zip(bv._bb(c, 20, 2.0), bv._bb(sub(c), 20, 2.0)):
+        assert a.iloc[k + 19:].to_numpy().tobytes() == b.iloc[19:].to_numpy().tobytes()
+    for a, b in zip(bv._adx(h, l, c, 14), bv._adx(sub(h), sub(l), sub(c), 14)):
+        assert a.iloc[k + 27:].to_numpy().tobytes() == b.iloc[27:].to_numpy().tobytes()
+    a, b = bv._atr(h, l, c, 14), bv._atr(sub(h), sub(l), sub(c), 14)
+    assert a.iloc[k + 14:].to_numpy().tobytes() == b.iloc[14:].to_numpy().tobytes()
+    a = _atr_previo(h.to_numpy(), l.to_numpy(), c.to_numpy())
+    b = _atr_previo(h.to_numpy()[k:], l.to_numpy()[k:], c.to_numpy()[k:])
+    assert a[k + 15:].tobytes() == b[15:].tobytes()
+    plana = pd.Series([0.1] * 40)
+    ma, up, lo, _ = bv._bb(plana, 20, 2.0)
+    assert (ma.iloc[19:] == 0.1).all() and (up.iloc[19:] == 0.1).all() and (lo.iloc[19:] == 0.1).all()
+
+
+def test_leer_tramos_igual_a_cargar(tmp_path):
+    df = _df(5_000)
+    df.iloc[:3_000].to_csv(tmp_path / "ohlcv_ETH-USDT_5m_2025-01-01.csv", index=False)   # legado
+    unico = df.iloc[2_000:].copy()
+    unico.loc[unico.index[:10], "close"] += 1.0                          # el consolidado gana en lo solapado
+    unico.to_csv(tmp_path / "ohlcv_ETH-USDT_5m.csv", index=False)
+
+    completo = cargar("ETHUSDT", "5m", since="1970-01-01 02:00", cache_dir=tmp_path)
+    partes = list(leer_tramos("ETHUSDT", "5m", since="1970-01-01 02:00", filas=700, cache_dir=tmp_path))
+    assert max(len(p) for p in partes) <= 700
+    assert pd.concat(partes, ignore_index=True).equals(completo)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backtesting.walkforward import DIA_MS, combinaciones, estabilidad, ventanas  # noqa: E402
+
+
+def test_ventanas_rodantes_y_ancladas():
+    ts = np.arange(0, 100 * DIA_MS, DIA_MS // 24, dtype="int64")   # 100 días de velas 1h
+    rod = ventanas(ts, 30, 10)
+    anc = ventanas(ts, 30, 10, anclada=True)
+    assert len(rod) == len(anc) == 7
+    assert rod[1][0] == 10 * 24 and anc[1][0] == 0                  # rodante avanza, anclada no
+    assert all(b == a_next for (_, _, b), (_, a_next, _) in zip(rod, rod[1:]))   # tests contiguos
+
+
+def test_grilla_y_estabilidad():
+    combos = combinaciones({"riesgo.stop_pct": [1.0, 1.2], "estrategia.bb_mult": [2.0]})
+    assert len(combos) == 2 and combos[0] == {"estrategia.bb_mult": 2.0, "riesgo.stop_pct": 1.0}
+    est = estabilidad([{"x": 1.0}, {"x": 1.0}, {"x": 2.0}])
+    assert est["x"]["moda"] == 1.0 and est["x"]["cambios"] == 1 and round(est["x"]["pct_moda"]) == 67
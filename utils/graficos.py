@@ -0,0 +1,103 @@
+# utils/graficos.py
+# Render escalable de series y tablas largas para la UI (Streamlit + Plotly).
+#
+# - lttb(): Largest-Triangle-Three-Buckets. Reduce una serie a n puntos
+#   conservando la forma (picos y valles del drawdown no se pierden como con
+#   un `[::k]`). O(N) con los promedios por bucket vectorizados; el único
+#   loop es de n iteraciones (n = puntos en pantalla, no velas).
+# - reducir() / ventana(): submuestreo de un DataFrame y recorte por rango
+#   de tiempo (searchsorted); la UI vuelve a submuestrear solo la ventana
+#   elegida => al hacer zoom aparece el detalle real.
+# - traza(): Scattergl (WebGL) por encima de UMBRAL_WEBGL puntos.
+# - pagina(): página de una tabla; al navegador va solo esa página.
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+MAX_PUNTOS = 2000
+UMBRAL_WEBGL = 5000
+FILAS_PAGINA = 200
+
+
+def _numerico(x) -> np.ndarray:
+    s = pd.Series(x)
+    if pd.api.types.is_datetime64_any_dtype(s):
+        s = s.dt.tz_localize(None) if getattr(s.dt, "tz", None) is not None else s
+        return s.to_numpy("datetime64[ns]").astype(np.int64).astype(float)
+    return s.to_numpy(dtype=float)
+
+
+def lttb(x, y, n: int) -> np.ndarray:
+    """Índices (ordenados) de los n puntos elegidos; siempre incluye el primero y el último."""
+    x = _numerico(x)
+    y = np.asarray(y, dtype=float)
+    N = len(y)
+    if n >= N or N <= 2:
+        return np.arange(N)
+    n = max(int(n), 3)
+    # buckets 1..n-2 sobre los puntos 1..N-2 (el primero y el último van fijos)
+    bordes = (np.floor(np.arange(n - 1) * (N - 2) / (n - 2)).astype(np.int64) + 1)
+    bordes[-1] = N - 1
+    cuenta = np.diff(bordes)
+    prom_x = np.add.reduceat(x[:-1], bordes[:-1]) / cuenta
+    prom_y = np.add.reduceat(y[:-1], bordes[:-1]) / cuenta
+    # el "siguiente" del último bucket es el punto final
+    prom_x = np.append(prom_x[1:], x[-1])
+    prom_y = np.append(prom_y[1:], y[-1])
+
+    elegidos = np.empty(n, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, N - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = bordes[i], bordes[i + 1]
+        xa, ya = x[a], y[a]
+        area = np.abs((xa - prom_x[i]) * (y[lo:hi] - ya) - (xa - x[lo:hi]) * (prom_y[i] - ya))
+        a = lo + int(np.argmax(area))
+        elegidos[i + 1] = a
+    return elegidos
+
+
+def reducir(df: pd.DataFrame, x: str, y: str, max_puntos: int = MAX_PUNTOS) -> pd.DataFrame:
+    """df submuestreado con LTTB sobre (x, y); sin cambios si ya entra en pantalla."""
+    if df is None or len(df) <= max_puntos:
+        return df
+    return df.iloc[lttb(df[x], df[y], max_puntos)]
+
+
+def ventana(df: pd.DataFrame, x: str, desde=None, hasta=None) -> pd.DataFrame:
+    """Filas con desde <= x <= hasta (x ordenado); O(log N) con searchsorted."""
+    if df is None or df.empty or (desde is None and hasta is None):
+        return df
+    col = df[x].to_numpy()
+    i = 0 if desde is None else int(np.searchsorted(col, np.asarray(desde, dtype=col.dtype), side="left"))
+    j = len(df) if hasta is None else int(np.searchsorted(col, np.asarray(hasta, dtype=col.dtype), side="right"))
+    return df.iloc[i:j]
+
+
+def traza(x, y, nombre: str = "", umbral: int = UMBRAL_WEBGL, **kw):
+    """go.Scatter en líneas; WebGL (Scattergl) cuando la serie es grande."""
+    import plotly.graph_objects as go
+    cls = go.Scattergl if len(y) > umbral else go.Scatter
+    return cls(x=x, y=y, mode="lines", name=nombre, **kw)
+
+
+def pagina(df: pd.DataFrame, n: int, filas: int = FILAS_PAGINA,
+           desc: bool = True) -> Tuple[pd.DataFrame, int]:
+    """(filas de la página n (1-based), total de páginas). desc=True: la página 1 son las últimas."""
+    if df is None or df.empty:
+        return df, 1
+    filas = max(1, int(filas))
+    total = max(1, math.ceil(len(df) / filas))
+    n = min(max(1, int(n)), total)
+    if desc:
+        fin = len(df) - (n - 1) * filas
+        return df.iloc[max(0, fin - filas):fin].iloc[::-1], total
+    return df.iloc[(n - 1) * filas:n * filas], total
+
+
+def rango_fechas(df: pd.DataFrame, x: str) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+    if df is None or df.empty:
+        return None
+    return pd.Timestamp(df[x].iloc[0]), pd.Timestamp(df[x].iloc[-1])
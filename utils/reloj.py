@@ -0,0 +1,96 @@
+# utils/reloj.py
+# Hora del exchange sin I/O por llamada + formateo con zona horaria cacheada.
+#
+# Estimación estilo NTP: por muestra se mide t0 (local), srv (exchange), t1 (local)
+#   rtt    = t1 - t0
+#   offset = srv - (t0 + t1) / 2
+# y se usa el offset de la muestra con menor RTT dentro de la ventana
+# (la de menor RTT es la que tiene menos error por asimetría de red).
+import time
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+
+try:
+    from zoneinfo import ZoneInfo
+except Exception:
+    ZoneInfo = None
+
+LOG = logging.getLogger("bibit")
+
+
+class RelojExchange:
+    """
+    fuente: callable() -> ms del servidor (ej. adapters.bybit_private.get_server_time_ms).
+    Sin fuente (o si falla) el offset queda en 0 => hora local.
+    """
+
+    def __init__(self, fuente=None, intervalo_s: float = 600.0, ventana: int = 8,
+                 muestras_iniciales: int = 4, reloj_local=time.time):
+        self._fuente = fuente
+        self.intervalo_s = float(intervalo_s)
+        self.muestras_iniciales = max(1, int(muestras_iniciales))
+        self._local = reloj_local
+        self._muestras = deque(maxlen=max(1, int(ventana)))  # (rtt_ms, offset_ms)
+        self.offset_ms = 0.0
+        self.rtt_ms = None
+        self._ultimo_sync = 0.0
+
+    def _muestra(self) -> bool:
+        try:
+            t0 = self._local() * 1000.0
+            srv = float(self._fuente())
+            t1 = self._local() * 1000.0
+        except Exception as e:
+            LOG.debug("RELOJ muestra fallida: %s", e)
+            return False
+        self._muestras.append((t1 - t0, srv - (t0 + t1) / 2.0))
+        return True
+
+    def sincronizar(self, n: int = 1) -> bool:
+        """Toma `n` muestras y recalcula el offset (filtro de mínimo RTT)."""
+        self._ultimo_sync = self._local()
+        if self._fuente is None:
+            return False
+        ok = False
+        for _ in range(max(1, int(n))):
+            ok = self._muestra() or ok
+        if self._muestras:
+            self.rtt_ms, self.offset_ms = min(self._muestras, key=lambda m: m[0])
+        if ok:
+            LOG.debug("RELOJ offset=%.1fms rtt=%.1fms (n=%s)", self.offset_ms, self.rtt_ms or 0.0,
+                      len(self._muestras))
+        return ok
+
+    def tick(self) -> bool:
+        """Llamar en el loop: solo hace I/O cuando venció el intervalo."""
+        if self._ultimo_sync and (self._local() - self._ultimo_sync) < self.intervalo_s:
+            return False
+        n = 1 if self._muestras else self.muestras_iniciales
+        return self.sincronizar(n)
+
+    def now_ms(self) -> int:
+        return int(self._local() * 1000.0 + self.offset_ms)
+
+    def now_s(self) -> float:
+        return self.now_ms() / 1000.0
+
+
+@lru_cache(maxsize=16)
+def zona(tzname: str):
+    """ZoneInfo cacheada (None si no existe o no hay tzdata)."""
+    if not ZoneInfo or not tzname:
+        return None
+    try:
+        return ZoneInfo(tzname)
+    except Exception:
+        return None
+
+
+def formatear_hora(ts_ms: int, tzname: str = "UTC", fmt: str = "utc") -> str:
+    """'HH:MM UTC' (fmt='utc' o zona inválida) o 'HH:MM' en la zona configurada."""
+    tz = None if str(fmt).lower() == "utc" else zona(tzname)
+    if tz is None:
+        return datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).strftime("%H:%M UTC")
+    return datetime.fromtimestamp(ts_ms / 1000.0, tz=tz).strftime("%H:%M")